@@ -0,0 +1,5 @@
+"""
+Benchmarks for the download engine, run against a local fake media server.
+
+Run them from the repository root with ``python -m benchmarks.run``.
+"""
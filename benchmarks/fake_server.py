@@ -0,0 +1,287 @@
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+
+
+# Repeated to build every synthetic payload
+PATTERN: bytes = bytes(range(256)) * 4096
+
+SEGMENT_DURATION: int = 2
+
+
+def payload(size: int) -> bytes:
+    """Returns ``size`` bytes of deterministic synthetic media data."""
+    repeats, rest = divmod(size, len(PATTERN))
+    return PATTERN * repeats + PATTERN[:rest]
+
+
+class FakeMediaServer:
+    """
+    Serves synthetic media and info JSON on localhost for the benchmarks.
+
+    Routes:
+        /progressive/<name>.mp4: A single file, with HTTP range support.
+        /hls/index.m3u8: An HLS media playlist of ``segments`` segments.
+        /dash/manifest.mpd: A DASH manifest with a segment list.
+        /info.json: A fake yt-dlp info_dict with the formats above and
+            ``extra_formats`` more video formats, as the GUI caches it.
+
+    Every request waits ``latency`` seconds before it is answered, which
+    stands in for the round trip to a real CDN and makes concurrent
+    fragment downloads measurable on localhost.
+
+    Args:
+        latency (float, optional): Seconds added to every request.
+        segment_size (int, optional): The size of an HLS/DASH segment.
+        segments (int, optional): The number of segments of a stream.
+        progressive_size (int, optional): The size of progressive files.
+        extra_formats (int, optional): The number of additional formats
+            listed in the info JSON.
+        connection_rate (float, optional): Bytes per second every response
+            with a progressive file is throttled to, like a CDN limiting
+            each connection.
+    """
+    def __init__(
+            self, latency: float = 0.02, segment_size: int = 256 * 1024,
+            segments: int = 40, progressive_size: int = 4 * 1024 * 1024,
+            extra_formats: int = 60, connection_rate: Optional[float] = None
+    ):
+        self.latency = latency
+        self.segment_size = segment_size
+        self.segments = segments
+        self.progressive_size = progressive_size
+        self.extra_formats = extra_formats
+        self.connection_rate = connection_rate
+        self.requests: int = 0
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'FakeMediaServer':
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def start(self) -> 'FakeMediaServer':
+        """Starts serving on a free port, on a daemon thread."""
+        server = self
+
+        class Handler(FakeMediaHandler):
+            media = server
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True
+            )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def url(self, path: str) -> str:
+        """Returns the URL of a path on the server."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def duration(self) -> int:
+        """The duration of the streams in seconds."""
+        return self.segments * SEGMENT_DURATION
+
+    @property
+    def stream_size(self) -> int:
+        """The size of an HLS or DASH stream in bytes."""
+        return self.segments * self.segment_size
+
+    def hls_playlist(self) -> str:
+        lines: List[str] = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{SEGMENT_DURATION}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for index in range(self.segments):
+            lines += [f"#EXTINF:{SEGMENT_DURATION}.0,", f"seg{index}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def dash_manifest(self) -> str:
+        segment_urls: str = "".join(
+            f'<SegmentURL media="seg{index}.m4s"/>'
+            for index in range(self.segments)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+            f'mediaPresentationDuration="PT{self.duration}S" '
+            'minBufferTime="PT2S" '
+            'profiles="urn:mpeg:dash:profile:isoff-main:2011">'
+            '<Period><AdaptationSet mimeType="video/mp4">'
+            '<Representation id="dash" bandwidth="1000000" '
+            'codecs="avc1.4d401f,mp4a.40.2" width="1280" height="720">'
+            f'<SegmentList timescale="1" duration="{SEGMENT_DURATION}">'
+            '<Initialization sourceURL="init.mp4"/>'
+            f'{segment_urls}</SegmentList>'
+            '</Representation></AdaptationSet></Period></MPD>'
+        )
+
+    def info_dict(self) -> Dict[str, Any]:
+        """
+        Returns a fake info_dict, as yt-dlp's ``sanitize_info`` returns it.
+
+        The HLS and DASH formats carry everything yt-dlp needs to download
+        them without extracting anything.
+        """
+        codecs: Dict[str, str] = {
+            'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2'
+        }
+        formats: List[Dict[str, Any]] = [
+            {
+                'format_id': 'progressive', 'ext': 'mp4', 'protocol': 'http',
+                'url': self.url('/progressive/bench.mp4'), 'height': 360,
+                'filesize': self.progressive_size, **codecs,
+            },
+            {
+                'format_id': 'hls', 'ext': 'mp4', 'protocol': 'm3u8_native',
+                'url': self.url('/hls/index.m3u8'),
+                'manifest_url': self.url('/hls/index.m3u8'), 'height': 720,
+                **codecs,
+            },
+            {
+                'format_id': 'dash', 'ext': 'mp4',
+                'protocol': 'http_dash_segments',
+                'url': self.url('/dash/manifest.mpd'),
+                'manifest_url': self.url('/dash/manifest.mpd'),
+                'fragment_base_url': self.url('/dash/'),
+                'fragments': [{'path': 'init.mp4'}] + [
+                    {'path': f'seg{index}.m4s', 'duration': SEGMENT_DURATION}
+                    for index in range(self.segments)
+                ],
+                'height': 720, **codecs,
+            },
+        ]
+        heights: Tuple[int, ...] = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+        vcodecs: Tuple[str, ...] = ('avc1.640028', 'vp9', 'av01.0.08M.08')
+        for index in range(self.extra_formats):
+            height: int = heights[index % len(heights)]
+            formats.append({
+                'format_id': f'extra{index}', 'ext': 'mp4',
+                'protocol': 'http',
+                'url': self.url(f'/progressive/extra{index}.mp4'),
+                'height': height, 'fps': 60 if index % 2 else 30,
+                'vcodec': vcodecs[index % len(vcodecs)], 'acodec': 'none',
+                'tbr': height * 4.0,
+                'dynamic_range': 'HDR10' if index % 5 == 0 else 'SDR',
+            })
+        return {
+            'id': 'bench', 'title': 'Benchmark', 'duration': self.duration,
+            'extractor': 'generic', 'extractor_key': 'Generic',
+            'webpage_url': self.url('/hls/index.m3u8'),
+            'formats': formats,
+        }
+
+
+class FakeMediaHandler(BaseHTTPRequestHandler):
+    """Answers the routes of the FakeMediaServer set as ``media``."""
+    media: FakeMediaServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Keep the benchmark output readable
+
+    def handle(self) -> None:
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # The client stopped reading, as yt-dlp does when sniffing
+
+    def do_HEAD(self) -> None:
+        self._serve(head=True)
+
+    def do_GET(self) -> None:
+        self._serve(head=False)
+
+    def _serve(self, head: bool) -> None:
+        media: FakeMediaServer = self.media
+        media.count_request()
+        if media.latency:
+            time.sleep(media.latency)
+        path: str = self.path.split('?')[0]
+
+        if path == '/hls/index.m3u8':
+            body: bytes = media.hls_playlist().encode()
+            content_type: str = 'application/vnd.apple.mpegurl'
+        elif path == '/dash/manifest.mpd':
+            body = media.dash_manifest().encode()
+            content_type = 'application/dash+xml'
+        elif path == '/info.json':
+            body = json.dumps(media.info_dict()).encode()
+            content_type = 'application/json'
+        elif re.fullmatch(r'/(hls/seg\d+\.ts|dash/seg\d+\.m4s)', path):
+            body = payload(media.segment_size)
+            content_type = 'application/octet-stream'
+        elif path == '/dash/init.mp4':
+            body = payload(1024)
+            content_type = 'video/mp4'
+        elif re.fullmatch(r'/progressive/[\w.-]+\.mp4', path):
+            self._serve_range(payload(media.progressive_size), head)
+            return
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _serve_range(self, body: bytes, head: bool) -> None:
+        """Serves a file, or the part of it a ``Range`` header asks for."""
+        match = re.fullmatch(
+            r'bytes=(\d+)-(\d*)', self.headers.get('Range') or ''
+            )
+        start, end = 0, len(body) - 1
+        if match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), end)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                'Content-Range', f'bytes {start}-{end}/{len(body)}'
+                )
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+        rate: Optional[float] = self.media.connection_rate
+        if not rate:
+            self.wfile.write(body[start:end + 1])
+            return
+        block: int = 64 * 1024
+        for offset in range(start, end + 1, block):
+            self.wfile.write(body[offset:min(offset + block, end + 1)])
+            time.sleep(block / rate)
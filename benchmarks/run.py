@@ -0,0 +1,382 @@
+"""
+Runs the benchmarks and stores the results as JSON.
+
+Usage, from the repository root::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --quick --compare benchmarks/results/base.json
+
+Every metric name ends in its unit. Metrics in MB/s or per second are
+better when higher, all others (times) when lower; ``--compare`` flags
+changes beyond ``--threshold`` in the wrong direction as regressions and
+exits with status 1.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, Any, List, Callable
+
+from benchmarks.fake_server import FakeMediaServer
+from core import (
+    LOGGER, DownloadArchive, DownloadTask, FormatRule,
+    build_download_options, list_formats, load_video_info
+)
+from main import BatchDownloader, EventWriter
+
+REPO_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR: str = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+HIGHER_IS_BETTER = ('_mbps', '_per_s')
+
+Metrics = Dict[str, float]
+
+
+def median_time(func: Callable[[], Any], repeat: int) -> float:
+    """Runs ``func`` ``repeat`` times and returns the median seconds."""
+    times: List[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def folder_size(path: str) -> int:
+    """The total size of the files below ``path``."""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def bench_extraction(server: FakeMediaServer, repeat: int) -> Metrics:
+    """
+    Extraction latency of a generic HLS URL, and the cost of listing and
+    selecting formats from the fake info JSON.
+    """
+    import urllib.request
+
+    hls_url: str = server.url('/hls/index.m3u8')
+    metrics: Metrics = {
+        'hls_extract_ms': median_time(
+            lambda: load_video_info(hls_url), repeat
+            ) * 1000,
+    }
+    with urllib.request.urlopen(server.url('/info.json')) as response:
+        info: Dict[str, Any] = json.load(response)
+    metrics['list_formats_ms'] = median_time(
+        lambda: list_formats(info), repeat * 10
+        ) * 1000
+    records = list_formats(info)
+    rule = FormatRule(max_height=1080, vcodec='av1', smallest=True)
+    metrics['select_format_us'] = median_time(
+        lambda: rule.select(records), repeat * 10
+        ) * 1e6
+    return metrics
+
+
+def bench_throughput(
+        server: FakeMediaServer, concurrency: List[int], repeat: int
+) -> Metrics:
+    """
+    Download throughput of the HLS and DASH streams from the fake info
+    JSON, for every number of concurrent fragment downloads.
+    """
+    metrics: Metrics = {}
+    info: Dict[str, Any] = server.info_dict()
+    for protocol in ('hls', 'dash'):
+        for fragments in concurrency:
+            rates: List[float] = []
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as folder:
+                    ydl_opts: Dict[str, Any] = build_download_options(
+                        "Video", None, folder
+                        )
+                    ydl_opts.update({
+                        'format': protocol,
+                        'concurrent_fragment_downloads': fragments,
+                        'postprocessors': [],
+                        'fixup': 'never',
+                        'verbose': False,
+                        'quiet': True,
+                    })
+                    task = DownloadTask(
+                        info['webpage_url'], ydl_opts,
+                        info_dict=json.loads(json.dumps(info))
+                        )
+                    start: float = time.perf_counter()
+                    task.run()
+                    elapsed: float = time.perf_counter() - start
+                    rates.append(folder_size(folder) / elapsed / 1e6)
+            metrics[f'{protocol}_fragments{fragments}_mbps'] = (
+                statistics.median(rates)
+                )
+    return metrics
+
+
+def bench_sharded(server: FakeMediaServer, repeat: int) -> Metrics:
+    """
+    Download throughput of one large progressive file over a single
+    connection and split into ranges, from a server that throttles every
+    connection.
+    """
+    metrics: Metrics = {}
+    info: Dict[str, Any] = server.info_dict()
+    for name, sharded in (('single', False), ('sharded', True)):
+        rates: List[float] = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as folder:
+                ydl_opts: Dict[str, Any] = build_download_options(
+                    "Video", None, folder, sharded=sharded
+                    )
+                ydl_opts.update({
+                    'format': 'progressive',
+                    'postprocessors': [],
+                    'verbose': False,
+                    'quiet': True,
+                })
+                task = DownloadTask(
+                    info['webpage_url'], ydl_opts,
+                    info_dict=json.loads(json.dumps(info))
+                    )
+                start: float = time.perf_counter()
+                task.run()
+                elapsed: float = time.perf_counter() - start
+                rates.append(folder_size(folder) / elapsed / 1e6)
+        metrics[f'progressive_{name}_mbps'] = statistics.median(rates)
+    return metrics
+
+
+def bench_progress_hooks(calls: int) -> Metrics:
+    """The cost of one progress hook call, as yt-dlp makes them."""
+    task = DownloadTask('http://127.0.0.1/bench', {})
+    total: int = calls * 1024
+    progress: List[Dict[str, Any]] = [
+        {
+            'status': 'downloading', 'downloaded_bytes': index * 1024,
+            'total_bytes': total, 'fragment_index': index // 64,
+            'fragment_count': calls // 64 + 1,
+        }
+        for index in range(calls)
+    ]
+    start: float = time.perf_counter()
+    for d in progress:
+        task._progress_hook(d)
+    elapsed: float = time.perf_counter() - start
+    return {
+        'progress_hook_us': elapsed / calls * 1e6,
+        'progress_hooks_per_s': calls / elapsed,
+    }
+
+
+def bench_queue_scaling(
+        server: FakeMediaServer, job_counts: List[int], jobs: int
+) -> Metrics:
+    """
+    Wall time of the command line queue downloading N progressive files
+    on ``jobs`` threads.
+    """
+    metrics: Metrics = {}
+    with open(os.devnull, 'w') as devnull:
+        for count in job_counts:
+            with tempfile.TemporaryDirectory() as folder:
+                downloader = BatchDownloader(
+                    "Video", jobs, folder, False, EventWriter(devnull)
+                    )
+                # Keep the user's archive out of the benchmark
+                downloader.archive = DownloadArchive(
+                    os.path.join(folder, 'archive.txt')
+                    )
+                urls: List[str] = [
+                    server.url(f'/progressive/queue{count}-{index}.mp4')
+                    for index in range(count)
+                ]
+                start: float = time.perf_counter()
+                downloader.run(urls)
+                elapsed: float = time.perf_counter() - start
+            metrics[f'queue_{count}_jobs_s'] = elapsed
+            metrics[f'queue_{count}_jobs_per_s'] = count / elapsed
+    return metrics
+
+
+def bench_cold_start(repeat: int) -> Metrics:
+    """Start-up times of fresh interpreters, as a user launches the app."""
+    commands: Dict[str, List[str]] = {
+        'import_core_ms': ['-c', 'import core'],
+        'import_yt_dlp_ms': ['-c', 'import core, yt_dlp'],
+        'cli_help_ms': ['main.py', '--help'],
+    }
+    if importlib.util.find_spec('PyQt5') is not None:
+        commands['import_gui_ms'] = ['-c', 'import gui']
+    env: Dict[str, str] = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    return {
+        name: median_time(
+            lambda: subprocess.run(
+                [sys.executable, *args], cwd=REPO_DIR, env=env, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                ),
+            repeat
+            ) * 1000
+        for name, args in commands.items()
+    }
+
+
+def git_revision() -> Optional[str]:
+    """The commit the benchmarks ran on, if this is a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    """Runs the selected benchmarks and returns the results document."""
+    import yt_dlp.version
+
+    repeat: int = 1 if args.quick else 3
+    results: Dict[str, Metrics] = {}
+    with FakeMediaServer(latency=args.latency) as server, FakeMediaServer(
+            latency=args.latency, progressive_size=32 * 1024 * 1024,
+            connection_rate=4e6
+    ) as throttled:
+        cases: Dict[str, Callable[[], Metrics]] = {
+            'extraction': lambda: bench_extraction(server, repeat),
+            'throughput': lambda: bench_throughput(
+                server, [1, 4] if args.quick else [1, 2, 4, 8], repeat
+                ),
+            'sharded': lambda: bench_sharded(throttled, repeat),
+            'progress_hooks': lambda: bench_progress_hooks(
+                20000 if args.quick else 200000
+                ),
+            'queue_scaling': lambda: bench_queue_scaling(
+                server, [1, 8] if args.quick else [1, 4, 16], args.jobs
+                ),
+            'cold_start': lambda: bench_cold_start(repeat),
+        }
+        for name, case in cases.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = {
+                metric: round(value, 3) for metric, value in case().items()
+            }
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'quick': args.quick,
+        'latency': args.latency,
+        'results': results,
+    }
+
+
+def compare(
+        baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> int:
+    """
+    Prints how every metric changed since the baseline.
+
+    Returns:
+        int: The number of regressions beyond the threshold.
+    """
+    regressions: int = 0
+    print(f"{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for case, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            old: Optional[float] = (
+                baseline['results'].get(case, {}).get(metric)
+                )
+            if not old:
+                continue
+            change: float = (value - old) / old
+            worse: float = (
+                -change if metric.endswith(HIGHER_IS_BETTER) else change
+                )
+            flag: str = ""
+            if worse > threshold:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(
+                f"{case + '.' + metric:<44} {old:>12.3f} {value:>12.3f} "
+                f"{change:>+8.1%}{flag}"
+                )
+    return regressions
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmark the download engine against a fake server."
+    )
+    parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help="where to write the results (default: benchmarks/results/)"
+        )
+    parser.add_argument(
+        '--compare', metavar='BASELINE',
+        help="compare the results to an earlier results file"
+        )
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help="relative change counted as a regression (default: 0.1)"
+        )
+    parser.add_argument(
+        '--only', nargs='+', metavar='CASE',
+        choices=(
+            'extraction', 'throughput', 'sharded', 'progress_hooks',
+            'queue_scaling', 'cold_start'
+        ),
+        help="run only these benchmarks"
+        )
+    parser.add_argument(
+        '--quick', action='store_true',
+        help="fewer repetitions and sizes, for a fast smoke run"
+        )
+    parser.add_argument(
+        '--latency', type=float, default=0.02,
+        help="seconds the fake server adds to a request (default: 0.02)"
+        )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=4,
+        help="parallel downloads of the queue benchmark (default: 4)"
+        )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    LOGGER.logger.setLevel(logging.WARNING)
+    document: Dict[str, Any] = run_benchmarks(args)
+
+    output: str = args.output or os.path.join(
+        RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json'
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as results_file:
+        json.dump(document, results_file, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline: Dict[str, Any] = json.load(baseline_file)
+        if compare(baseline, document, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
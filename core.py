@@ -0,0 +1,3776 @@
+import re
+import os
+import sys
+import ctypes
+import logging
+import threading
+import time
+import json
+import zlib
+import random
+import shutil
+import sqlite3
+import importlib
+import multiprocessing
+from concurrent.futures import (
+    FIRST_EXCEPTION, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import (
+    Optional, Dict, Any, List, Tuple, Iterator, Iterable, Callable, Set,
+    TYPE_CHECKING
+)
+from urllib.parse import urlparse, parse_qs
+
+# yt_dlp loads hundreds of extractor modules, so it is imported where it
+# is used instead of here. See preload_yt_dlp.
+if TYPE_CHECKING:
+    import yt_dlp
+
+# Directory for the application's persistent state
+APP_DATA_DIR: str = os.path.join(os.path.expanduser("~"), ".vidoor")
+
+# Default folder downloads are saved to
+DOWNLOADS_FOLDER: str = os.path.expanduser("~/Downloads")
+
+# Where unfinished downloads are written before they are moved into the
+# downloads folder, e.g. a tmpfs or local SSD. None writes them in place.
+SCRATCH_FOLDER: Optional[str] = os.environ.get('VIDOOR_SCRATCH_DIR') or None
+
+# Bytes yt-dlp reads and writes at once
+WRITE_BLOCK_SIZE: int = 1024 * 1024
+
+YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)'
+    r'|youtu\.be/)([0-9A-Za-z_-]{11})'
+    )
+
+
+class MyLogger:
+    """
+    A simple logger class for custom logging.
+
+    Args:
+        name (str, optional): The name of the logger. Defaults to "MyLogger".
+        level (int, optional): The logging level. Defaults to logging.INFO.
+
+    """
+    def __init__(self, name: str = "MyLogger", level: int = logging.INFO):
+        """
+        Initializes the logger with the given name and level.
+
+        Args:
+            name (str, optional):
+                The name of the logger. Defaults to "MyLogger".
+            level (int, optional): The logging level. Defaults to logging.INFO.
+        """
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level)
+
+        # Create console handler and set the level
+        ch = logging.StreamHandler()
+        ch.setLevel(level)
+
+        # Create formatter and add it to the handler
+        formatter = logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s'
+            )
+        ch.setFormatter(formatter)
+
+        # Add the handler to the logger
+        if not self.logger.handlers:  # Prevent duplicate handlers
+            self.logger.addHandler(ch)
+
+    def debug(self, msg: str) -> None:
+        """
+        Logs a debug message.
+
+        Args:
+            msg (str): The debug message.
+        """
+        self.logger.debug(msg)
+
+    def info(self, msg: str) -> None:
+        """
+        Logs an info message.
+
+        Args:
+            msg (str): The info message.
+        """
+        self.logger.info(msg)
+
+    def warning(self, msg: str) -> None:
+        """
+        Logs a warning message.
+
+        Args:
+            msg (str): The warning message.
+        """
+        self.logger.warning(msg)
+
+    def error(self, msg: str) -> None:
+        """
+        Logs an error message.
+
+        Args:
+            msg (str): The error message.
+        """
+        self.logger.error(msg)
+
+
+# Shared by everything that logs, including yt_dlp
+LOGGER: MyLogger = MyLogger()
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """
+    Returns the 11 character YouTube video id in a URL, if any.
+
+    Args:
+        url (str): A youtube.com or youtu.be video URL.
+    """
+    match = YOUTUBE_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def is_playlist_url(url: str) -> bool:
+    """
+    Returns True if the URL refers to a playlist.
+
+    Like yt-dlp, a watch URL that carries a ``list`` parameter is treated
+    as its playlist.
+
+    Args:
+        url (str): The URL entered by the user.
+    """
+    parsed = urlparse(url)
+    return parsed.path.rstrip('/') == '/playlist' or 'list' in parse_qs(
+        parsed.query
+        )
+
+
+class MetadataCache:
+    """
+    A persistent SQLite cache of extracted video info, keyed by video id.
+
+    Only the fields needed to list formats and to download from the info
+    are stored, as compressed JSON. Entries expire after ``ttl`` seconds,
+    which should stay below the lifetime of the signed stream URLs they
+    contain. Once more than ``max_entries`` are stored, the least recently
+    used ones are evicted. The database is opened on first use, so the
+    cache adds nothing to startup.
+
+    Args:
+        path (str, optional): The database file.
+            Defaults to metadata_cache.sqlite3 in APP_DATA_DIR.
+        ttl (float, optional): Seconds an entry stays valid.
+        max_entries (int, optional): The maximum number of entries kept.
+    """
+    # YouTube stream URLs are signed for about six hours
+    DEFAULT_TTL: float = 5 * 60 * 60
+    DEFAULT_MAX_ENTRIES: int = 500
+    CACHED_FIELDS: Tuple[str, ...] = (
+        '_type', 'id', 'title', 'fulltitle', 'display_id', 'webpage_url',
+        'webpage_url_basename', 'webpage_url_domain', 'extractor',
+        'extractor_key', 'duration', 'thumbnail', 'uploader', 'channel',
+        'channel_id', 'upload_date', 'live_status', 'is_live', 'was_live',
+        'formats', '_format_sort_fields', '_has_drm', 'epoch', '_version',
+    )
+
+    def __init__(
+            self, path: Optional[str] = None,
+            ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.path = path or os.path.join(
+            APP_DATA_DIR, 'metadata_cache.sqlite3'
+            )
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.logger = LOGGER
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def key_for_url(url: str) -> Optional[str]:
+        """
+        Returns the cache key for a video URL, or None if it has no id.
+
+        Args:
+            url (str): The URL of the video.
+        """
+        video_id: Optional[str] = youtube_video_id(url)
+        return f"youtube:{video_id}" if video_id else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached info for a key, or None if missing or expired.
+
+        Args:
+            key (str): The cache key, see key_for_url.
+        """
+        now: float = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT fetched_at, payload FROM metadata WHERE key = ?",
+                    (key,)
+                    ).fetchone()
+                if row is None:
+                    return None
+                if now - row[0] > self.ttl:
+                    connection.execute(
+                        "DELETE FROM metadata WHERE key = ?", (key,)
+                        )
+                    connection.commit()
+                    return None
+                connection.execute(
+                    "UPDATE metadata SET last_used = ? WHERE key = ?",
+                    (now, key)
+                    )
+                connection.commit()
+            return json.loads(zlib.decompress(row[1]))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            self.logger.warning(f"Metadata cache lookup failed: {e}")
+            return None
+
+    def put(self, key: str, info_dict: Dict[str, Any]) -> None:
+        """
+        Stores the cacheable fields of a sanitized info_dict.
+
+        Args:
+            key (str): The cache key, see key_for_url.
+            info_dict (Dict[str, Any]): A JSON serializable info_dict.
+        """
+        entry: Dict[str, Any] = {
+            field: info_dict[field]
+            for field in self.CACHED_FIELDS if field in info_dict
+        }
+        now: float = time.time()
+        try:
+            payload: bytes = zlib.compress(
+                json.dumps(entry, separators=(',', ':')).encode('utf-8')
+                )
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO metadata "
+                    "(key, fetched_at, last_used, payload) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, now, now, payload)
+                    )
+                connection.execute(
+                    "DELETE FROM metadata WHERE key NOT IN ("
+                    "SELECT key FROM metadata "
+                    "ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_entries,)
+                    )
+                connection.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.logger.warning(f"Metadata cache update failed: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use and drops expired entries."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=5, check_same_thread=False
+                )
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS metadata (
+                    key TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    payload BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS metadata_last_used
+                    ON metadata (last_used);
+            """)
+            connection.execute(
+                "DELETE FROM metadata WHERE fetched_at < ?",
+                (time.time() - self.ttl,)
+                )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+
+class JobJournal:
+    """
+    A crash-safe record of queued downloads in an SQLite WAL database.
+
+    Every job's URL, download type, format, output template, title and
+    state is written when it changes, so downloads that were queued or
+    running when the application stopped can be resumed on the next
+    start. Progress updates are buffered and written in one transaction
+    at most every ``FLUSH_INTERVAL`` seconds.
+
+    Args:
+        path (str, optional): The database file.
+            Defaults to jobs.sqlite3 in APP_DATA_DIR.
+    """
+    UNFINISHED_STATES: Tuple[str, ...] = (
+        "queued", "running", "paused", "postprocessing"
+    )
+    FLUSH_INTERVAL: float = 2.0
+    # Finished, failed and cancelled jobs are forgotten after 30 days
+    RETENTION: float = 30 * 24 * 60 * 60
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(APP_DATA_DIR, 'jobs.sqlite3')
+        self.logger = LOGGER
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending_progress: Dict[int, int] = {}
+        self._last_flush: float = time.monotonic()
+
+    def add(
+            self, url: str, download_type: str, format_spec: str,
+            outtmpl: str, title: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Records a newly queued job.
+
+        Args:
+            url (str): The URL to download.
+            download_type (str): "Video" or "Audio".
+            format_spec (str): The yt-dlp format selector.
+            outtmpl (str): The yt-dlp output template.
+            title (str, optional): The video title, if already known.
+
+        Returns:
+            Optional[int]: The journal id of the job, or None if the
+            journal could not be written.
+        """
+        now: float = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                cursor = connection.execute(
+                    "INSERT INTO jobs (url, download_type, format, outtmpl, "
+                    "title, state, percent, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?)",
+                    (url, download_type, format_spec, outtmpl, title, now, now)
+                    )
+                connection.commit()
+                return cursor.lastrowid
+        except sqlite3.Error as e:
+            self.logger.warning(f"Job journal update failed: {e}")
+            return None
+
+    def set_state(
+            self, journal_id: int, state: str, percent: Optional[int] = None
+    ) -> None:
+        """
+        Records a state change right away.
+
+        Buffered progress is written in the same transaction.
+        """
+        if percent is not None:
+            self._pending_progress[journal_id] = percent
+        try:
+            with self._lock:
+                connection = self._connect()
+                self._write_progress(connection)
+                connection.execute(
+                    "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                    (state, time.time(), journal_id)
+                    )
+                connection.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Job journal update failed: {e}")
+
+    def record_progress(self, journal_id: int, percent: int) -> None:
+        """
+        Buffers the progress of a job, flushing at most every
+        FLUSH_INTERVAL seconds.
+        """
+        self._pending_progress[journal_id] = percent
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes all buffered progress in one transaction."""
+        if not self._pending_progress:
+            return
+        try:
+            with self._lock:
+                connection = self._connect()
+                self._write_progress(connection)
+                connection.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Job journal update failed: {e}")
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Returns the jobs that did not finish, fail or get cancelled."""
+        placeholders: str = ", ".join("?" * len(self.UNFINISHED_STATES))
+        try:
+            with self._lock:
+                connection = self._connect()
+                rows = connection.execute(
+                    "SELECT id, url, download_type, format, outtmpl, title, "
+                    "state, percent FROM jobs "
+                    f"WHERE state IN ({placeholders}) ORDER BY id",
+                    self.UNFINISHED_STATES
+                    ).fetchall()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Job journal lookup failed: {e}")
+            return []
+        columns: Tuple[str, ...] = (
+            'id', 'url', 'download_type', 'format', 'outtmpl', 'title',
+            'state', 'percent'
+        )
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self) -> None:
+        """Flushes buffered progress and closes the database."""
+        self.flush()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _write_progress(self, connection: sqlite3.Connection) -> None:
+        """Writes buffered progress; the caller commits."""
+        if self._pending_progress:
+            now: float = time.time()
+            connection.executemany(
+                "UPDATE jobs SET percent = ?, updated_at = ? WHERE id = ?",
+                [
+                    (percent, now, journal_id)
+                    for journal_id, percent in self._pending_progress.items()
+                ]
+                )
+            self._pending_progress.clear()
+        self._last_flush = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use and prunes old jobs."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=5, check_same_thread=False
+                )
+            # WAL keeps committed rows safe on a crash; NORMAL sync avoids
+            # an fsync per progress transaction
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    download_type TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    outtmpl TEXT NOT NULL,
+                    title TEXT,
+                    state TEXT NOT NULL,
+                    percent INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+            """)
+            placeholders: str = ", ".join("?" * len(self.UNFINISHED_STATES))
+            connection.execute(
+                f"DELETE FROM jobs WHERE state NOT IN ({placeholders}) "
+                "AND updated_at < ?",
+                (*self.UNFINISHED_STATES, time.time() - self.RETENTION)
+                )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+
+class DownloadArchive(set):
+    """
+    The ids of every downloaded video, in yt-dlp's download archive format.
+
+    The archive is loaded once into memory, so checking a video before any
+    extraction is a set lookup. It is also passed to yt-dlp as its
+    ``download_archive``, which accepts a set: yt-dlp then skips videos it
+    finds in it and adds the ones it downloads. Adding an id also appends
+    it to the archive file, which stays usable with
+    ``yt-dlp --download-archive``.
+
+    Args:
+        path (str, optional): The archive file.
+            Defaults to download_archive.txt in APP_DATA_DIR.
+    """
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        self.path = path or os.path.join(APP_DATA_DIR, 'download_archive.txt')
+        self.logger = LOGGER
+        self._lock = threading.Lock()
+        # Passed to yt-dlp instead when the video is added later
+        self.read_only: ReadOnlyArchive = ReadOnlyArchive(self)
+        try:
+            with open(self.path, encoding='utf-8') as archive_file:
+                super().update(
+                    line.strip() for line in archive_file if line.strip()
+                    )
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Failed to load the download archive: {e}")
+
+    @staticmethod
+    def make_id(extractor: str, video_id: str) -> str:
+        """
+        Returns the archive id of a video, as yt-dlp builds it.
+
+        Args:
+            extractor (str): The extractor key, e.g. "Youtube".
+            video_id (str): The id of the video.
+        """
+        return f"{extractor.lower()} {video_id}"
+
+    def has_video(
+            self, extractor: Optional[str], video_id: Optional[str]
+    ) -> bool:
+        """Returns True if the video was downloaded before."""
+        if not extractor or not video_id:
+            return False
+        return self.make_id(extractor, video_id) in self
+
+    def has_url(self, url: str) -> bool:
+        """
+        Returns True if the URL names a video downloaded before.
+
+        Only URLs with a recognisable YouTube video id can be checked
+        without extracting them.
+        """
+        return self.has_video("Youtube", youtube_video_id(url))
+
+    def add(self, archive_id: str) -> None:
+        """Adds an archive id and appends it to the archive file."""
+        with self._lock:
+            if archive_id in self:
+                return
+            super().add(archive_id)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as archive_file:
+                    archive_file.write(archive_id + '\n')
+            except OSError as e:
+                self.logger.warning(
+                    f"Failed to update the download archive: {e}"
+                    )
+
+
+class ReadOnlyArchive:
+    """
+    A DownloadArchive as yt-dlp's ``download_archive``, that only skips.
+
+    yt-dlp records a video as soon as its download and in-thread
+    postprocessors are done. Jobs whose postprocessors run on the
+    PostProcessingPool pass this view instead: yt-dlp still skips the
+    videos in the archive, and DownloadTask adds the video once the pool
+    post-processed it.
+
+    Args:
+        archive (DownloadArchive): The archive checked.
+    """
+    def __init__(self, archive: DownloadArchive):
+        self.archive = archive
+
+    def __contains__(self, archive_id: object) -> bool:
+        return archive_id in self.archive
+
+    def add(self, archive_id: str) -> None:
+        pass  # Added by DownloadTask after post-processing
+
+
+def split_urls(text: str) -> List[str]:
+    """
+    Splits the URL input into individual URLs.
+
+    URLs may be separated by whitespace or commas.
+
+    Args:
+        text (str): The raw text of the URL input.
+
+    Returns:
+        List[str]: The URLs in the order they were entered.
+    """
+    return [url for url in re.split(r'[\s,]+', text.strip()) if url]
+
+
+def host_key(url: str) -> str:
+    """
+    Returns the host used to apply per-host download limits.
+
+    Short and mobile YouTube hosts are folded into ``youtube.com`` since
+    they are served by the same backend.
+
+    Args:
+        url (str): The URL of the video.
+    """
+    host: str = (urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host == 'youtu.be':
+        host = 'youtube.com'
+    return host
+
+
+def format_bytes(num_bytes: float) -> str:
+    """Formats a byte count with a binary unit, e.g. ``3.1 MiB``."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TiB"
+
+
+def format_eta(seconds: float) -> str:
+    """Formats a number of seconds as ``H:MM:SS`` or ``M:SS``."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+@dataclass
+class ProgressSnapshot:
+    """
+    A coalesced view of a download's progress.
+
+    Attributes:
+        percent (int): The progress of the current stream in percent.
+        speed (float): The smoothed speed in bytes per second.
+        eta (float): Seconds left for the current stream, or -1 if unknown.
+        status (str): A human readable status line.
+    """
+    percent: int
+    speed: float
+    eta: float
+    status: str
+
+
+class ProgressAggregator:
+    """
+    Coalesces yt-dlp progress callbacks into rate limited snapshots.
+
+    With concurrent fragment downloads, yt-dlp calls the progress hooks
+    for every chunk of every fragment. The aggregator only keeps the
+    latest state and produces a snapshot at most once per ``interval``
+    seconds, plus one for every change of status. Speed is measured from
+    the bytes received between snapshots and smoothed with an exponential
+    moving average, which keeps the speed and ETA readable.
+
+    Args:
+        interval (float, optional): Minimum seconds between snapshots.
+            Defaults to 0.1, i.e. 10 updates per second.
+    """
+    DEFAULT_INTERVAL: float = 0.1
+    SPEED_SMOOTHING: float = 0.3
+
+    # Shorter streams are too noisy to judge fragment concurrency by
+    MIN_MEASURED_SECONDS: float = 2.0
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.speed: float = 0.0
+        # Average throughput of the last finished fragmented stream
+        self.stream_throughput: Optional[float] = None
+        self._fragmented: bool = False
+        self._last_emit: float = 0.0
+        self._last_status: Optional[str] = None
+        self._last_sample: Optional[Tuple[float, int]] = None
+
+    def update(self, d: Dict[str, Any]) -> Optional[ProgressSnapshot]:
+        """
+        Records a yt-dlp progress dict.
+
+        Args:
+            d (Dict[str, Any]): The dict passed to a yt-dlp progress hook.
+
+        Returns:
+            Optional[ProgressSnapshot]: A snapshot to report, or None if
+            the update was coalesced into the next one.
+        """
+        status: str = d['status']
+        now: float = time.monotonic()
+        status_changed: bool = status != self._last_status
+        self._last_status = status
+        if status == 'finished':
+            self._measure_stream(d)
+            self._last_sample = None
+            self._last_emit = now
+            return ProgressSnapshot(
+                100, self.speed, 0.0, "Download Completed - 100%"
+                )
+        if status != 'downloading':
+            return None
+        if not status_changed and now - self._last_emit < self.interval:
+            return None
+        self._last_emit = now
+
+        downloaded_bytes: int = d.get('downloaded_bytes') or 0
+        total_bytes: float = (
+            d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        )
+        self._fragmented = self._fragmented or bool(d.get('fragment_count'))
+        self._sample_speed(now, downloaded_bytes)
+
+        if total_bytes:
+            percent: float = downloaded_bytes / total_bytes * 100
+        elif d.get('fragment_count'):
+            fragment_index: int = d.get('fragment_index') or 0
+            percent = fragment_index / d['fragment_count'] * 100
+        else:
+            percent = 0
+        percent = min(max(percent, 0), 100)
+        eta: float = (
+            (total_bytes - downloaded_bytes) / self.speed
+            if total_bytes and self.speed else -1
+        )
+
+        info: Dict[str, Any] = d.get('info_dict') or {}
+        kind: str = (
+            "Downloading Audio"
+            if info.get('vcodec') == 'none' or info.get('is_audio')
+            else "Downloading Video"
+        )
+        status_text: str = f"{kind} - {int(percent)}%"
+        if self.speed:
+            status_text += f" - {format_bytes(self.speed)}/s"
+        if eta >= 0:
+            status_text += f", ETA {format_eta(eta)}"
+        return ProgressSnapshot(int(percent), self.speed, eta, status_text)
+
+    def _measure_stream(self, d: Dict[str, Any]) -> None:
+        """Records the average throughput of a finished fragmented stream."""
+        elapsed: float = d.get('elapsed') or 0
+        total_bytes: int = (
+            d.get('total_bytes') or d.get('downloaded_bytes') or 0
+        )
+        self.stream_throughput = (
+            total_bytes / elapsed
+            if self._fragmented and elapsed >= self.MIN_MEASURED_SECONDS
+            else None
+        )
+        self._fragmented = False
+
+    def _sample_speed(self, now: float, downloaded_bytes: int) -> None:
+        """Updates the smoothed speed from the bytes since the last sample."""
+        if self._last_sample is not None:
+            then, previous_bytes = self._last_sample
+            elapsed: float = now - then
+            if elapsed > 0 and downloaded_bytes >= previous_bytes:
+                instant: float = (downloaded_bytes - previous_bytes) / elapsed
+                self.speed = (
+                    instant if not self.speed else
+                    self.SPEED_SMOOTHING * instant
+                    + (1 - self.SPEED_SMOOTHING) * self.speed
+                )
+        self._last_sample = (now, downloaded_bytes)
+
+
+# fallocate() mode that reserves space without changing the file size
+FALLOC_FL_KEEP_SIZE: int = 0x01
+
+
+@lru_cache(maxsize=None)
+def _libc_fallocate() -> Optional[Callable[..., int]]:
+    """Returns the C library's fallocate(), or None if there is none."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    except (OSError, AttributeError):
+        return None
+    fallocate.argtypes = [
+        ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong
+        ]
+    fallocate.restype = ctypes.c_int
+    return fallocate
+
+
+def preallocate(path: str, size: int) -> bool:
+    """
+    Reserves disk space for a file that is still being written.
+
+    The space is reserved in one go, so the file system can lay the file
+    out contiguously even while other downloads write at the same time.
+    The file size does not change, which keeps yt-dlp's resume logic,
+    based on the size of the .part file, working. Only supported on
+    Linux; elsewhere nothing is done.
+
+    Args:
+        path (str): The file.
+        size (int): The expected final size in bytes.
+
+    Returns:
+        bool: True if the space was reserved.
+    """
+    fallocate = _libc_fallocate()
+    if fallocate is None or size <= 0:
+        return False
+    try:
+        fd: int = os.open(path, os.O_WRONLY)
+    except OSError:
+        return False
+    try:
+        return fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, size) == 0
+    finally:
+        os.close(fd)
+
+
+def sync_file(path: str, release: bool = False) -> None:
+    """
+    Flushes a file to disk.
+
+    Args:
+        path (str): The file.
+        release (bool, optional): Also give back the space reserved past
+            the end of the file, for files that turned out smaller than
+            preallocated.
+    """
+    try:
+        fd: int = os.open(path, os.O_WRONLY)
+    except OSError:
+        return
+    try:
+        if release:
+            os.ftruncate(fd, os.fstat(fd).st_size)
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class PartFileAllocator:
+    """
+    Preallocates the .part files yt-dlp writes and syncs them in batches.
+
+    yt-dlp writes downloads through buffered I/O and leaves writeback to
+    the OS. With many jobs writing at once this interleaves their blocks
+    on disk and lets dirty pages pile up. Fed with the progress hooks,
+    the allocator reserves the expected size of every .part file when it
+    starts, flushes it every ``sync_bytes`` and releases what was not
+    used once it is finished.
+
+    Args:
+        sync_bytes (int, optional): Bytes written between two flushes.
+            Defaults to SYNC_BYTES, 64 MiB.
+    """
+    SYNC_BYTES: int = 64 * 1024 * 1024
+
+    def __init__(self, sync_bytes: int = SYNC_BYTES):
+        self.sync_bytes = sync_bytes
+        self._lock = threading.Lock()
+        # Bytes downloaded at the last flush, by .part file
+        self._synced: Dict[str, int] = {}
+
+    def update(self, d: Dict[str, Any]) -> None:
+        """
+        Records a yt-dlp progress dict.
+
+        Args:
+            d (Dict[str, Any]): The dict passed to a yt-dlp progress hook.
+        """
+        filename: Optional[str] = d.get('filename')
+        # yt-dlp reports no tmpfilename once the .part file was renamed
+        path: Optional[str] = d.get('tmpfilename') or (
+            filename and f"{filename}.part"
+        )
+        if not path:
+            return
+        downloaded: int = d.get('downloaded_bytes') or 0
+        if d['status'] == 'downloading':
+            with self._lock:
+                synced: Optional[int] = self._synced.get(path)
+                if synced is None or downloaded - synced >= self.sync_bytes:
+                    self._synced[path] = downloaded
+            if synced is None:
+                preallocate(path, int(
+                    d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                    ))
+            elif downloaded - synced >= self.sync_bytes:
+                sync_file(path)
+        elif d['status'] == 'finished':
+            with self._lock:
+                started: bool = self._synced.pop(path, None) is not None
+            if started and filename:
+                sync_file(filename, release=True)
+
+
+def estimate_download_size(info_dict: Dict[str, Any]) -> Optional[int]:
+    """
+    Estimates the bytes a download writes, from its selected formats.
+
+    Args:
+        info_dict (Dict[str, Any]): The info_dict of the video with the
+            format selected, as yt-dlp passes it to ``before_dl``
+            postprocessors.
+
+    Returns:
+        Optional[int]: The estimate, or None if no size is known.
+    """
+    duration: Optional[float] = info_dict.get('duration')
+    requested: List[Dict[str, Any]] = (
+        info_dict.get('requested_formats') or [info_dict]
+    )
+    sizes: List[Optional[int]] = [
+        _estimate_size(fmt, duration) for fmt in requested
+    ]
+    if None in sizes:
+        return _estimate_size(info_dict, duration)
+    return sum(sizes)
+
+
+def _device_of(path: str) -> Tuple[str, int]:
+    """The nearest existing folder of ``path`` and its device number."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path, os.stat(path).st_dev
+
+
+class DiskSpaceGovernor:
+    """
+    Holds downloads back until their disk has room for them.
+
+    Before a download starts writing, it reserves its estimated size,
+    multiplied by ``overhead`` for the merged file written next to the
+    streams and for post-processing. A download only starts once its
+    reservation fits into the free space of the disk, minus ``margin``
+    and what the other running downloads have reserved but not written
+    yet. A download that could never fit, because nothing else holds a
+    reservation on its disk, fails instead of waiting forever. Shared by
+    all downloads and thread safe.
+
+    Args:
+        overhead (float, optional): The factor applied to size estimates.
+        margin (int, optional): Bytes always left free on a disk.
+        poll_interval (float, optional): Seconds between checks of the
+            free space while downloads wait.
+    """
+    # Merging writes the output file while both streams are still there
+    DEFAULT_OVERHEAD: float = 2.0
+    DEFAULT_MARGIN: int = 256 * 1024 * 1024
+    DEFAULT_POLL_INTERVAL: float = 5.0
+
+    def __init__(
+            self, overhead: float = DEFAULT_OVERHEAD,
+            margin: int = DEFAULT_MARGIN,
+            poll_interval: float = DEFAULT_POLL_INTERVAL
+    ):
+        self.overhead = overhead
+        self.margin = margin
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        # Reserved bytes by device, per owner
+        self._reserved: Dict[int, Dict[int, int]] = {}
+        # Bytes written so far by file, per owner
+        self._written: Dict[int, Dict[str, int]] = {}
+
+    def reserve(
+            self, owner: Any, size: Optional[int], folder: str,
+            temp_folder: Optional[str] = None,
+            on_wait: Optional[Callable[[str], None]] = None,
+            cancelled: Callable[[], bool] = lambda: False
+    ) -> bool:
+        """
+        Waits until the download fits and reserves its space.
+
+        Args:
+            owner (Any): The download, used to update and release it.
+            size (int, optional): The estimated size of the download, see
+                estimate_download_size. Unknown sizes reserve nothing but
+                still wait while the disk is full.
+            folder (str): The folder the finished file is moved to.
+            temp_folder (str, optional): The folder the download and the
+                merge are written to, if not ``folder``.
+            on_wait (Callable[[str], None], optional): Called with a
+                status message whenever the download has to wait.
+            cancelled (Callable[[], bool], optional): Returns True when
+                the download should stop waiting.
+
+        Returns:
+            bool: True once the space is reserved, False if cancelled.
+
+        Raises:
+            yt_dlp.utils.DownloadError: If the download does not fit even
+                though no other download holds a reservation.
+        """
+        import yt_dlp
+
+        need: int = int((size or 0) * self.overhead)
+        final_path, final_device = _device_of(folder)
+        temp_path, temp_device = _device_of(temp_folder or folder)
+        needs: Dict[int, int] = {temp_device: need}
+        paths: Dict[int, str] = {temp_device: temp_path}
+        if final_device != temp_device:
+            # The finished file is moved over, the merge stays behind
+            needs[final_device] = size or 0
+            paths[final_device] = final_path
+        with self._condition:
+            while True:
+                if cancelled():
+                    return False
+                shortage: Optional[Tuple[int, int, bool]] = None
+                for device, bytes_needed in needs.items():
+                    others: int = self._outstanding(device)
+                    free: int = (
+                        shutil.disk_usage(paths[device]).free - self.margin
+                    )
+                    if bytes_needed > free - others:
+                        shortage = (bytes_needed, free - others, others > 0)
+                        break
+                if shortage is None:
+                    self._reserved[id(owner)] = needs
+                    self._written[id(owner)] = {}
+                    return True
+                bytes_needed, available, others_reserved = shortage
+                message: str = (
+                    f"{format_bytes(bytes_needed)} needed, "
+                    f"{format_bytes(max(0, available))} available"
+                )
+                if not others_reserved:
+                    raise yt_dlp.utils.DownloadError(
+                        f"Not enough disk space: {message}"
+                        )
+                if on_wait is not None:
+                    on_wait(f"Waiting for disk space ({message})")
+                self._condition.wait(self.poll_interval)
+
+    def update(self, owner: Any, d: Dict[str, Any]) -> None:
+        """
+        Records the bytes a download wrote, from a yt-dlp progress dict.
+
+        Args:
+            owner (Any): The download passed to reserve.
+            d (Dict[str, Any]): The dict passed to a yt-dlp progress hook.
+        """
+        if not d.get('filename'):
+            return
+        with self._condition:
+            written: Optional[Dict[str, int]] = self._written.get(id(owner))
+            if written is not None:
+                written[d['filename']] = d.get('downloaded_bytes') or 0
+
+    def release(self, owner: Any) -> None:
+        """Drops the reservation of a download and wakes waiting ones."""
+        with self._condition:
+            self._reserved.pop(id(owner), None)
+            self._written.pop(id(owner), None)
+            self._condition.notify_all()
+
+    def wake(self) -> None:
+        """Makes waiting downloads check again, e.g. after a cancel."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def _outstanding(self, device: int) -> int:
+        """
+        The bytes reserved on a device but not written yet, called with
+        the lock held.
+        """
+        total: int = 0
+        for owner, needs in self._reserved.items():
+            written: int = sum(self._written.get(owner, {}).values())
+            total += max(0, needs.get(device, 0) - written)
+        return total
+
+
+# The external_downloader name the sharded HTTP downloader is registered as
+SHARDED_DOWNLOADER: str = 'vidoor_sharded'
+
+# Not a yt-dlp option: a callable that the transfer threads of the sharded
+# downloader call between blocks. It blocks while the download is paused
+# and raises DownloadCancelled once it is cancelled.
+TRANSFER_CHECK_PARAM: str = 'vidoor_check_transfer'
+
+
+@lru_cache(maxsize=None)
+def register_sharded_downloader() -> type:
+    """
+    Defines the sharded HTTP downloader and registers it with yt-dlp.
+
+    yt-dlp picks it for http(s) formats whose ``external_downloader`` is
+    SHARDED_DOWNLOADER. It is defined on first use, so importing core
+    does not import yt-dlp.
+
+    Returns:
+        type: The downloader class, a subclass of yt-dlp's HttpFD.
+    """
+    import yt_dlp.downloader.external
+    from yt_dlp.downloader.http import HttpFD
+    from yt_dlp.networking import Request
+    from yt_dlp.networking.exceptions import HTTPError, TransportError
+    from yt_dlp.utils import ContentTooShortError, DownloadCancelled
+    from yt_dlp.utils.networking import HTTPHeaderDict
+
+    class ShardedHttpFD(HttpFD):
+        """
+        Downloads a progressive stream over several connections.
+
+        Hosts that throttle every connection cap a single download at the
+        per-connection rate, and concurrent_fragment_downloads only helps
+        fragmented streams. This downloader splits a large file into one
+        byte range per connection, as many as concurrent_fragment_downloads
+        allows, and writes every range in place into the preallocated
+        .part file. Ranges are requested in pieces of at most the format's
+        http_chunk_size, and resumed where they broke off when a connection
+        fails. The file is renamed only once every range arrived in full.
+
+        Until then the .part file has gaps, so the offset every range
+        reached is checkpointed to a sidecar file next to it, after the
+        .part file was synced. A download that stopped in any way, even
+        by a crash or a power cut, resumes its ranges from there. A .part
+        file without a sidecar was written by HttpFD and is resumed by
+        it; one whose sidecar cannot be read is started over.
+
+        Every range stops while the download is paused or cancelled, see
+        TRANSFER_CHECK_PARAM, and all of them together stay within a
+        ``ratelimit`` set while they run.
+
+        Small, rate limited and HttpFD's resumed downloads, and servers
+        that do not answer a range request with 206 Partial Content, are
+        handed to HttpFD. A sharded .part file handed over is first cut
+        back to the part that is complete from its start.
+        """
+        EXE_NAME: str = SHARDED_DOWNLOADER
+        # Smaller ranges gain less than a connection costs
+        MIN_SHARD_SIZE: int = 4 * 1024 * 1024
+        # Seconds between progress reports
+        PROGRESS_INTERVAL: float = 0.25
+        # Seconds between checkpoints of the range offsets
+        CHECKPOINT_INTERVAL: float = 2.0
+        # Bytes read from a connection at once; pause, cancel and the
+        # rate limit act between reads, writes are batched to buffersize
+        READ_SIZE: int = 64 * 1024
+        # The smallest read while a rate limit is set
+        MIN_LIMITED_READ: int = 16 * 1024
+
+        @classmethod
+        def get_basename(cls) -> str:
+            return SHARDED_DOWNLOADER
+
+        @classmethod
+        def can_download(
+                cls, info_dict: Dict[str, Any], path: Optional[str] = None
+        ) -> bool:
+            return (
+                info_dict.get('protocol') in ('http', 'https')
+                and not info_dict.get('to_stdout')
+                and not info_dict.get('is_live')
+                and not info_dict.get('request_data')
+            )
+
+        def real_download(
+                self, filename: str, info_dict: Dict[str, Any]
+        ) -> bool:
+            tmpfilename: str = self.temp_name(filename)
+            state: Optional[Dict[str, Any]] = self._load_state(tmpfilename)
+            shards: int = min(
+                self.params.get('concurrent_fragment_downloads') or 1,
+                (info_dict.get('filesize') or 2 ** 62) // self.MIN_SHARD_SIZE
+            )
+            if (shards < 2 or self.params.get('ratelimit')
+                    or self.params.get('test')):
+                self._hand_over(tmpfilename, state)
+                return super().real_download(filename, info_dict)
+            if state is None and (self.params.get('continuedl', True)
+                                  and os.path.isfile(tmpfilename)):
+                return super().real_download(filename, info_dict)
+            headers = HTTPHeaderDict(
+                {'Accept-Encoding': 'identity'},
+                info_dict.get('http_headers')
+                )
+            total: Optional[int] = self._probe(info_dict['url'], headers)
+            if total is None or total < 2 * self.MIN_SHARD_SIZE:
+                self._hand_over(tmpfilename, state)
+                return super().real_download(filename, info_dict)
+            if state is not None and state['total'] == total:
+                bounds: List[Tuple[int, int]] = state['bounds']
+                done: List[int] = state['done']
+            else:
+                # Nothing to resume, or the file changed on the server
+                shards = min(shards, total // self.MIN_SHARD_SIZE)
+                bounds = [
+                    (total * index // shards, total * (index + 1) // shards)
+                    for index in range(shards)
+                ]
+                done = [0] * shards
+            return self._download_shards(
+                filename, tmpfilename, info_dict, headers, total, bounds,
+                done
+                )
+
+        @staticmethod
+        def state_name(tmpfilename: str) -> str:
+            """The sidecar file the range offsets are checkpointed to."""
+            return f"{tmpfilename}.shards"
+
+        def _load_state(self, tmpfilename: str) -> Optional[Dict[str, Any]]:
+            """
+            Reads the checkpoint of an interrupted sharded download.
+
+            Returns None if there is none to resume from. A .part file
+            whose checkpoint cannot be read has gaps in unknown places,
+            so it is deleted along with the checkpoint.
+            """
+            path: str = self.state_name(tmpfilename)
+            if not os.path.isfile(path):
+                return None
+            try:
+                with open(path, encoding='utf-8') as state_file:
+                    state: Dict[str, Any] = json.load(state_file)
+                total: int = int(state['total'])
+                bounds: List[Tuple[int, int]] = [
+                    (int(begin), int(end)) for begin, end in state['bounds']
+                ]
+                done: List[int] = [int(count) for count in state['done']]
+                size: int = os.path.getsize(tmpfilename)
+                valid: bool = (
+                    self.params.get('continuedl', True)
+                    and len(bounds) == len(done) > 0
+                    and bounds[0][0] == 0 and bounds[-1][1] == total
+                    and all(
+                        begin <= end == following
+                        for (begin, end), (following, _) in zip(
+                            bounds, bounds[1:])
+                    )
+                    and all(
+                        0 <= count <= end - begin
+                        for (begin, end), count in zip(bounds, done)
+                    )
+                )
+            except (OSError, ValueError, KeyError, TypeError):
+                valid = False
+            if not valid:
+                for stale in (tmpfilename, path):
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+                return None
+            # Bytes past the end of the file were cut off by _hand_over
+            done = [
+                min(count, max(0, size - begin))
+                for (begin, _), count in zip(bounds, done)
+            ]
+            return {'total': total, 'bounds': bounds, 'done': done}
+
+        def _save_state(
+                self, tmpfilename: str, total: int,
+                bounds: List[Tuple[int, int]], done: List[int]
+        ) -> None:
+            """Writes the checkpoint, replacing the previous one whole."""
+            path: str = self.state_name(tmpfilename)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as state_file:
+                json.dump(
+                    {'total': total, 'bounds': bounds, 'done': done},
+                    state_file
+                    )
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace(f"{path}.tmp", path)
+
+        def _checkpoint(
+                self, fd: int, tmpfilename: str, total: int,
+                bounds: List[Tuple[int, int]], done: List[int]
+        ) -> None:
+            """Checkpoints the range offsets once the bytes below them are
+            on disk."""
+            reached: List[int] = list(done)
+            os.fsync(fd)
+            self._save_state(tmpfilename, total, bounds, reached)
+
+        def _hand_over(
+                self, tmpfilename: str, state: Optional[Dict[str, Any]]
+        ) -> None:
+            """
+            Cuts a sharded .part file back to the part complete from its
+            start and drops its checkpoint, so HttpFD can resume it.
+            """
+            if state is None:
+                return
+            prefix: int = self._complete_prefix(
+                state['bounds'], state['done']
+                )
+            if os.path.getsize(tmpfilename) > prefix:
+                os.truncate(tmpfilename, prefix)
+            os.remove(self.state_name(tmpfilename))
+
+        def _probe(self, url: str, headers: Any) -> Optional[int]:
+            """The size of the file, if the server serves ranges of it."""
+            try:
+                response = self.ydl.urlopen(Request(
+                    url, headers={**headers, 'Range': 'bytes=0-0'}
+                    ))
+            except (HTTPError, TransportError):
+                return None  # HttpFD reports the error with its retries
+            with response:
+                match = re.fullmatch(
+                    r'bytes 0-0/(\d+)',
+                    response.headers.get('Content-Range') or ''
+                    )
+                if response.status != 206 or not match:
+                    return None
+                return int(match.group(1))
+
+        def _download_shards(
+                self, filename: str, tmpfilename: str,
+                info_dict: Dict[str, Any], headers: Any, total: int,
+                bounds: List[Tuple[int, int]], done: List[int]
+        ) -> bool:
+            chunk: int = (
+                info_dict.get('downloader_options', {}).get('http_chunk_size')
+                or self.params.get('http_chunk_size') or total
+            )
+            resumed: bool = any(done)
+            stop = threading.Event()
+            # Bytes read by every shard, including ones not written yet
+            received: List[int] = list(done)
+            # The rate limit, and when and at what total it was set
+            self._rate_mark: Tuple[Optional[float], float, int] = (
+                None, time.monotonic(), sum(received)
+            )
+            self._rate_lock = threading.Lock()
+            self.report_destination(filename)
+            if resumed:
+                self.report_resuming_byte(sum(done))
+                flags: int = os.O_RDWR
+            else:
+                # Checkpointed before anything is written, so a .part file
+                # with gaps never goes without its checkpoint
+                self._save_state(tmpfilename, total, bounds, done)
+                flags = os.O_RDWR | os.O_CREAT | os.O_TRUNC
+            fd: int = os.open(tmpfilename, flags, 0o666)
+            checkpoint: Callable[[], None] = partial(
+                self._checkpoint, fd, tmpfilename, total, bounds, done
+                )
+            finished: bool = False
+            try:
+                preallocate(tmpfilename, total)
+                start: float = time.time()
+                with ThreadPoolExecutor(
+                        len(bounds), thread_name_prefix='shard'
+                ) as executor:
+                    futures: List[Future] = [
+                        executor.submit(
+                            self._download_shard, info_dict['url'], headers,
+                            fd, begin, end, chunk, done, received, index,
+                            stop
+                            )
+                        for index, (begin, end) in enumerate(bounds)
+                    ]
+                    try:
+                        self._wait_for_shards(
+                            futures, filename, tmpfilename, info_dict,
+                            total, done, start, checkpoint
+                            )
+                    finally:
+                        stop.set()
+                downloaded: int = sum(done)
+                if downloaded != total or os.fstat(fd).st_size != total:
+                    raise ContentTooShortError(downloaded, total)
+                finished = True
+            finally:
+                if not finished:
+                    checkpoint()
+                os.close(fd)
+            self.try_rename(tmpfilename, filename)
+            os.remove(self.state_name(tmpfilename))
+            self._hook_progress({
+                'downloaded_bytes': total,
+                'total_bytes': total,
+                'filename': filename,
+                'status': 'finished',
+                'elapsed': time.time() - start,
+            }, info_dict)
+            return True
+
+        def _wait_for_shards(
+                self, futures: List[Future], filename: str,
+                tmpfilename: str, info_dict: Dict[str, Any], total: int,
+                done: List[int], start: float,
+                checkpoint: Callable[[], None]
+        ) -> None:
+            """
+            Reports progress and checkpoints on this thread until every
+            shard is done. Raises the first error of a shard, or the
+            cancel of a hook.
+            """
+            resumed: int = sum(done)
+            last_checkpoint: float = time.monotonic()
+            pending: Set[Future] = set(futures)
+            while pending:
+                _, pending = wait(
+                    pending, self.PROGRESS_INTERVAL, FIRST_EXCEPTION
+                    )
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                if (pending and time.monotonic() - last_checkpoint
+                        >= self.CHECKPOINT_INTERVAL):
+                    checkpoint()
+                    last_checkpoint = time.monotonic()
+                downloaded: int = sum(done)
+                now: float = time.time()
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'tmpfilename': tmpfilename,
+                    'filename': filename,
+                    'eta': self.calc_eta(
+                        start, now, total - resumed, downloaded - resumed
+                        ),
+                    'speed': self.calc_speed(
+                        start, now, downloaded - resumed
+                        ),
+                    'elapsed': now - start,
+                }, info_dict)
+
+        def _download_shard(
+                self, url: str, headers: Any, fd: int, begin: int,
+                end: int, chunk: int, done: List[int], received: List[int],
+                index: int, stop: threading.Event
+        ) -> None:
+            """Writes the bytes ``begin`` to ``end`` of the file."""
+            retries: int = self.params.get('retries', 10)
+            block_size: int = self.params.get('buffersize', 1024)
+            attempt: int = 0
+            position: int = begin + done[index]
+            while position < end:
+                self._check_transfer(stop)
+                last: int = min(end, position + chunk) - 1
+                try:
+                    with self.ydl.urlopen(Request(url, headers={
+                            **headers, 'Range': f'bytes={position}-{last}'
+                    })) as response:
+                        content_range: str = (
+                            response.headers.get('Content-Range') or ''
+                        )
+                        if (response.status != 206 or not
+                                content_range.startswith(
+                                    f'bytes {position}-{last}/')):
+                            raise ContentTooShortError(position, end)
+                        buffer = bytearray()
+                        try:
+                            while position + len(buffer) <= last:
+                                self._check_transfer(stop)
+                                size: int = min(
+                                    self.READ_SIZE,
+                                    last + 1 - position - len(buffer)
+                                    )
+                                limit: Optional[float] = self.params.get(
+                                    'ratelimit'
+                                    )
+                                if limit:
+                                    # A tenth of a second worth, so the
+                                    # shards do not burst past a low limit
+                                    size = min(size, max(
+                                        self.MIN_LIMITED_READ,
+                                        int(limit) // 10
+                                        ))
+                                data: bytes = response.read(size)
+                                if not data:
+                                    raise ContentTooShortError(
+                                        position + len(buffer), end
+                                        )
+                                buffer += data
+                                received[index] += len(data)
+                                attempt = 0
+                                if len(buffer) >= block_size:
+                                    position = self._write_buffer(
+                                        fd, buffer, position, begin, done,
+                                        index
+                                        )
+                                self._slow_down_shards(received, stop)
+                        finally:
+                            # Also on errors, so the checkpoint has them
+                            position = self._write_buffer(
+                                fd, buffer, position, begin, done, index
+                                )
+                except (TransportError, ContentTooShortError) as e:
+                    error: Exception = e
+                except HTTPError as e:
+                    if e.status < 500:
+                        raise
+                    error = e
+                else:
+                    continue
+                attempt += 1
+                if attempt > retries:
+                    raise error
+                # Sleeps as retry_sleep_functions['http'] says
+                self.report_retry(error, attempt, retries, fatal=False)
+
+        @staticmethod
+        def _write_buffer(
+                fd: int, buffer: bytearray, position: int, begin: int,
+                done: List[int], index: int
+        ) -> int:
+            """
+            Writes the bytes a shard read at ``position`` and empties the
+            buffer.
+
+            Returns:
+                int: The position after the bytes written.
+            """
+            if buffer:
+                os.pwrite(fd, buffer, position)
+                position += len(buffer)
+                done[index] = position - begin
+                buffer.clear()
+            return position
+
+        def _check_transfer(self, stop: threading.Event) -> None:
+            """Waits while the download is paused, and raises once it is
+            cancelled or another shard failed."""
+            check: Optional[Callable[[], None]] = self.params.get(
+                TRANSFER_CHECK_PARAM
+                )
+            if check is not None:
+                check()
+            if stop.is_set():
+                raise DownloadCancelled()
+
+        def _slow_down_shards(
+                self, received: List[int], stop: threading.Event
+        ) -> None:
+            """
+            Keeps all shards together within ``ratelimit``.
+
+            The bandwidth scheduler changes the limit while the shards
+            run, so the rate is measured from when it was last changed.
+            """
+            limit: Optional[float] = self.params.get('ratelimit')
+            downloaded: int = sum(received)
+            now: float = time.monotonic()
+            with self._rate_lock:
+                if limit != self._rate_mark[0]:
+                    self._rate_mark = (limit, now, downloaded)
+                _, since, base = self._rate_mark
+            if limit:
+                delay: float = (downloaded - base) / limit - (now - since)
+                if delay > 0:
+                    stop.wait(delay)
+
+        @staticmethod
+        def _complete_prefix(
+                bounds: List[Tuple[int, int]], done: List[int]
+        ) -> int:
+            """The bytes complete from the start of the file, for resuming."""
+            prefix: int = 0
+            for (begin, end), count in zip(bounds, done):
+                prefix = begin + count
+                if prefix < end:
+                    break
+            return prefix
+
+    yt_dlp.downloader.external._BY_NAME[SHARDED_DOWNLOADER] = ShardedHttpFD
+    return ShardedHttpFD
+
+
+class FragmentConcurrencyTuner:
+    """
+    Picks ``concurrent_fragment_downloads`` from measured throughput.
+
+    The tuner hill-climbs over powers of two between ``min_fragments``
+    and ``max_fragments``: while a level is faster than the one before
+    it, it keeps stepping the same way. When it gets slower, or more
+    connections bring no clear gain, it steps back, turns around and
+    settles for a few streams before probing again, so it keeps following
+    changes in link speed. Suggestions are also capped so that all active
+    jobs together open at most ``total_fragments`` connections. It is
+    shared by all workers and is thread safe.
+
+    Args:
+        min_fragments (int, optional): The lowest concurrency suggested.
+        max_fragments (int, optional): The highest concurrency suggested.
+        total_fragments (int, optional): The fragment connections shared
+            by all active jobs.
+        initial (int, optional): The concurrency to start from.
+    """
+    DEFAULT_INITIAL: int = 4
+    DEFAULT_MAX_FRAGMENTS: int = 16
+    DEFAULT_TOTAL_FRAGMENTS: int = 32
+    # Relative change in throughput treated as a real difference
+    TOLERANCE: float = 0.1
+    SMOOTHING: float = 0.5
+    # Streams to stay at a level after settling, before probing again
+    SETTLE_STREAMS: int = 5
+
+    def __init__(
+            self, min_fragments: int = 1,
+            max_fragments: int = DEFAULT_MAX_FRAGMENTS,
+            total_fragments: int = DEFAULT_TOTAL_FRAGMENTS,
+            initial: int = DEFAULT_INITIAL
+    ):
+        self.min_fragments = max(1, min_fragments)
+        self.max_fragments = max(self.min_fragments, max_fragments)
+        self.total_fragments = total_fragments
+        self.active_jobs: int = 1
+        self._level: int = min(
+            max(initial, self.min_fragments), self.max_fragments
+            )
+        self._previous_level: Optional[int] = None
+        self._direction: int = 1
+        self._hold: int = 0
+        self._throughput: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def set_active_jobs(self, active_jobs: int) -> None:
+        """Sets the number of jobs sharing the fragment budget."""
+        with self._lock:
+            self.active_jobs = max(1, active_jobs)
+
+    def suggest(self) -> int:
+        """Returns the concurrency to use for the next stream."""
+        with self._lock:
+            share: int = self.total_fragments // self.active_jobs
+            return max(self.min_fragments, min(self._level, share))
+
+    def record(self, concurrency: int, throughput: float) -> None:
+        """
+        Records the throughput of a stream and moves the level.
+
+        Args:
+            concurrency (int): The concurrency the stream ran with.
+            throughput (float): Its average throughput in bytes per second.
+        """
+        with self._lock:
+            previous: Optional[float] = self._throughput.get(concurrency)
+            self._throughput[concurrency] = (
+                throughput if previous is None else
+                self.SMOOTHING * throughput
+                + (1 - self.SMOOTHING) * previous
+            )
+            if concurrency != self._level:
+                return  # Capped or stale run, only kept as a data point
+            if self._hold:
+                self._hold -= 1
+                return
+
+            current: float = self._throughput[self._level]
+            before: Optional[float] = self._throughput.get(
+                self._previous_level
+                )
+            if before is not None:
+                moved_up: bool = self._level > self._previous_level
+                if (current < before * (1 - self.TOLERANCE)
+                        or moved_up
+                        and current < before * (1 + self.TOLERANCE)):
+                    # Slower, or more connections for no clear gain:
+                    # go back, turn around and settle there for a while
+                    self._direction = -self._direction
+                    self._level, self._previous_level = (
+                        self._previous_level, self._level
+                        )
+                    self._hold = self.SETTLE_STREAMS
+                    return
+                if current < before * (1 + self.TOLERANCE):
+                    self._hold = self.SETTLE_STREAMS
+                    return
+
+            next_level: int = self._step(self._level, self._direction)
+            if next_level == self._level:
+                self._direction = -self._direction
+                return
+            self._previous_level, self._level = self._level, next_level
+
+    def _step(self, level: int, direction: int) -> int:
+        """Returns the neighbouring level in the given direction."""
+        if direction > 0:
+            return min(level * 2, self.max_fragments)
+        return max(level // 2, self.min_fragments)
+
+
+class BandwidthScheduler:
+    """
+    Splits a global download rate limit across the running jobs.
+
+    Every job gets a share of the budget proportional to the weight of
+    its priority, so an interactive download runs several times faster
+    than background ones next to it. Bandwidth a job cannot use, because
+    it is slower than its share anyway, goes to the other jobs. Shares
+    are pushed to the jobs through a callback whenever jobs start or
+    finish, the limit changes, or a job's demand changes. It is shared by
+    all workers and is thread safe.
+
+    Args:
+        limit (float, optional): The budget in bytes per second for all
+            jobs together. None or 0 means unlimited.
+    """
+    PRIORITY_WEIGHTS: Dict[str, int] = {'interactive': 4, 'background': 1}
+    DEFAULT_PRIORITY: str = 'interactive'
+    # No job is throttled below this, whatever its share
+    MIN_RATE: float = 16 * 1024
+    # A job below this fraction of its share is not using all of it
+    UNDERUSE: float = 0.8
+    # Headroom given on top of the speed of a job not using its share
+    DEMAND_HEADROOM: float = 1.25
+
+    def __init__(self, limit: Optional[float] = None):
+        self.limit: Optional[float] = limit or None
+        self._jobs: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, limit: Optional[float]) -> None:
+        """Changes the budget. None or 0 lifts the limit."""
+        with self._lock:
+            self.limit = limit or None
+            self._rebalance()
+
+    def register(
+            self, job: Any, priority: str,
+            apply: Callable[[Optional[float]], None]
+    ) -> None:
+        """
+        Adds a running job.
+
+        Args:
+            job (Any): A hashable key for the job.
+            priority (str): A key of PRIORITY_WEIGHTS.
+            apply (Callable[[Optional[float]], None]): Called with the
+                job's rate limit in bytes per second, or None for no
+                limit. It may be called from any thread.
+        """
+        with self._lock:
+            self._jobs[job] = {
+                'weight': self.PRIORITY_WEIGHTS.get(
+                    priority, self.PRIORITY_WEIGHTS[self.DEFAULT_PRIORITY]
+                    ),
+                'apply': apply,
+                'rate': None,
+                'demand': None,
+            }
+            self._rebalance()
+
+    def unregister(self, job: Any) -> None:
+        """Removes a job that stopped, handing its share to the others."""
+        with self._lock:
+            if self._jobs.pop(job, None) is not None:
+                self._rebalance()
+
+    def report_speed(self, job: Any, speed: float) -> None:
+        """
+        Records the current speed of a job.
+
+        A job running well below its share is limited by something else,
+        such as the server. Its share is then lowered to what it uses, and
+        raised again once it catches up.
+        """
+        with self._lock:
+            state: Optional[Dict[str, Any]] = self._jobs.get(job)
+            if state is None or self.limit is None or not speed:
+                return
+            underused: bool = (
+                state['rate'] is not None
+                and speed < state['rate'] * self.UNDERUSE
+            )
+            if underused == (state['demand'] is not None):
+                return  # Nothing changed enough to rebalance
+            state['demand'] = (
+                speed * self.DEMAND_HEADROOM if underused else None
+                )
+            self._rebalance()
+
+    def _rebalance(self) -> None:
+        """Recomputes every share and applies the ones that changed."""
+        rates: Dict[Any, Optional[float]] = {}
+        if self.limit is None:
+            rates = dict.fromkeys(self._jobs)
+        else:
+            # Weighted water-filling: jobs needing less than their share
+            # are capped at their demand, the rest split what is left
+            remaining: float = self.limit
+            open_jobs: Dict[Any, Dict[str, Any]] = dict(self._jobs)
+            capped: bool = True
+            while open_jobs and capped:
+                capped = False
+                total_weight: int = sum(
+                    state['weight'] for state in open_jobs.values()
+                    )
+                for job, state in list(open_jobs.items()):
+                    share: float = remaining * state['weight'] / total_weight
+                    if state['demand'] is not None and state['demand'] < share:
+                        rates[job] = state['demand']
+                        remaining -= state['demand']
+                        del open_jobs[job]
+                        capped = True
+                        break
+            total_weight = sum(state['weight'] for state in open_jobs.values())
+            for job, state in open_jobs.items():
+                rates[job] = remaining * state['weight'] / total_weight
+        for job, rate in rates.items():
+            if rate is not None:
+                rate = max(rate, self.MIN_RATE)
+            state = self._jobs[job]
+            if rate != state['rate']:
+                state['rate'] = rate
+                state['apply'](rate)
+
+
+# How a failed download or extraction is classified by classify_failure
+FAILURE_TRANSIENT: str = "transient"
+FAILURE_THROTTLED: str = "throttled"
+FAILURE_EXPIRED: str = "expired"
+FAILURE_PERMANENT: str = "permanent"
+
+THROTTLED_RE = re.compile(
+    r"HTTP Error 429|Too Many Requests|rate.?limit", re.IGNORECASE
+    )
+EXPIRED_RE = re.compile(
+    r"HTTP Error 403|HTTP Error 410|Forbidden|expired", re.IGNORECASE
+    )
+# Checked before PERMANENT_RE, so "503: Service Unavailable" is retried
+TRANSIENT_RE = re.compile(
+    r"HTTP Error 5\d\d|Internal Server Error|Bad Gateway|"
+    r"Service Unavailable|Gateway Time-?out|timed out|"
+    r"Connection (reset|refused|aborted)|Temporary failure",
+    re.IGNORECASE
+    )
+# Bot checks need cookies, waiting does not get past them
+PERMANENT_RE = re.compile(
+    r"HTTP Error 40[14]|HTTP Error 451|Unsupported URL|"
+    r"Video unavailable|video is unavailable|private video|"
+    r"has been removed|terminated|copyright|not available|members.only|"
+    r"confirm your age|not a bot|not enough disk space",
+    re.IGNORECASE
+    )
+
+
+def _error_chain(error: BaseException) -> Iterator[BaseException]:
+    """Yields an error and the errors it was caused by, outermost first."""
+    seen: set = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        error = (
+            (exc_info[1] if isinstance(exc_info, tuple) else None)
+            or getattr(error, 'cause', None)
+            or error.__cause__ or error.__context__
+        )
+
+
+def classify_failure(error: BaseException) -> str:
+    """
+    Classifies a failed download or extraction by what helps against it.
+
+    Args:
+        error (BaseException): The error yt-dlp raised, usually a
+            DownloadError wrapping the original error.
+
+    Returns:
+        str: FAILURE_THROTTLED for 429 responses, which need a long wait;
+        FAILURE_EXPIRED for 403/410 responses to signed stream URLs, which
+        need a fresh extraction; FAILURE_PERMANENT for removed, private or
+        unsupported videos and bot checks that need cookies, which are not
+        retried; FAILURE_TRANSIENT for network errors, 5xx responses and
+        anything unknown, which are retried after a short wait.
+    """
+    import yt_dlp
+
+    chain: List[BaseException] = list(_error_chain(error))
+    for cause in chain:
+        if isinstance(cause, yt_dlp.utils.ReExtractInfo):
+            return FAILURE_EXPIRED
+        status: Optional[int] = (
+            getattr(cause, 'status', None) or getattr(cause, 'code', None)
+            )
+        if not isinstance(status, int):
+            continue
+        if status == 429:
+            return FAILURE_THROTTLED
+        if status in (403, 410):
+            return FAILURE_EXPIRED
+        if 400 <= status < 500:
+            return FAILURE_PERMANENT
+        if status >= 500:
+            return FAILURE_TRANSIENT
+    message: str = " ".join(str(cause) for cause in chain)
+    if THROTTLED_RE.search(message):
+        return FAILURE_THROTTLED
+    if EXPIRED_RE.search(message):
+        return FAILURE_EXPIRED
+    if TRANSIENT_RE.search(message):
+        return FAILURE_TRANSIENT
+    if PERMANENT_RE.search(message) or any(
+            isinstance(cause, yt_dlp.utils.ExtractorError) and cause.expected
+            for cause in chain):
+        return FAILURE_PERMANENT
+    return FAILURE_TRANSIENT
+
+
+class ExponentialBackoff:
+    """
+    Exponential backoff with jitter.
+
+    The n-th retry waits between half and all of ``base * 2 ** n``
+    seconds, capped at ``cap``. The jitter keeps jobs that failed together
+    from retrying together. Instances can be used as yt-dlp's
+    ``retry_sleep_functions``.
+
+    Args:
+        base (float): The longest wait before the first retry.
+        cap (float): The longest wait before any retry.
+    """
+    def __init__(self, base: float, cap: float):
+        self.base = base
+        self.cap = cap
+
+    def __call__(self, n: int) -> float:
+        """Returns the seconds to wait before retry ``n``, from 0."""
+        longest: float = min(self.cap, self.base * 2 ** n)
+        return random.uniform(longest / 2, longest)
+
+
+# The waits between yt-dlp's own retries of requests and fragments. They
+# are shared objects, so all jobs keep the same YoutubeDLPool profile.
+RETRY_SLEEP_FUNCTIONS: Dict[str, ExponentialBackoff] = {
+    'http': ExponentialBackoff(1.0, 30.0),
+    'fragment': ExponentialBackoff(0.5, 10.0),
+    'extractor': ExponentialBackoff(2.0, 60.0),
+}
+
+
+class HostCircuitBreaker:
+    """
+    Stops all jobs for a host for a while once the host keeps failing.
+
+    After FAILURE_THRESHOLD consecutive transient failures, or a single
+    throttling response, the circuit of the host opens for COOLDOWN
+    seconds. A failure after it closes again reopens it for twice as long,
+    up to MAX_COOLDOWN; a success closes it for good.
+    """
+    FAILURE_THRESHOLD: int = 3
+    COOLDOWN: float = 30.0
+    MAX_COOLDOWN: float = 600.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, float]] = {}
+
+    def record_failure(self, host: str, kind: str) -> None:
+        """Records a transient or throttling failure of a request."""
+        with self._lock:
+            state = self._hosts.setdefault(
+                host, {'failures': 0, 'open_until': 0.0, 'cooldown': 0.0}
+                )
+            state['failures'] += 1
+            if (kind == FAILURE_THROTTLED
+                    or state['failures'] >= self.FAILURE_THRESHOLD):
+                state['cooldown'] = min(
+                    self.MAX_COOLDOWN,
+                    state['cooldown'] * 2 or self.COOLDOWN
+                    )
+                state['open_until'] = time.monotonic() + state['cooldown']
+                state['failures'] = 0
+
+    def record_success(self, host: str) -> None:
+        """Closes the circuit of a host that answered again."""
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def retry_after(self, host: str) -> float:
+        """Returns the seconds until the host may be tried, 0 if now."""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return 0.0
+            return max(0.0, state['open_until'] - time.monotonic())
+
+
+class RetryPolicy:
+    """
+    Retries failed downloads and extractions depending on why they failed.
+
+    Every failure class has its own number of retries and backoff.
+    Expired URLs are retried at once, after the caller dropped its stale
+    info_dict. Transient and throttling failures are recorded in the
+    shared circuit breaker, so one struggling host pauses every job for
+    it instead of each one hammering it.
+
+    Args:
+        breaker (HostCircuitBreaker, optional): The circuit breaker
+            shared by the jobs. A new one by default.
+    """
+    MAX_RETRIES: Dict[str, int] = {
+        FAILURE_TRANSIENT: 4,
+        FAILURE_THROTTLED: 5,
+        FAILURE_EXPIRED: 1,
+        FAILURE_PERMANENT: 0,
+    }
+    BACKOFF: Dict[str, ExponentialBackoff] = {
+        FAILURE_TRANSIENT: ExponentialBackoff(5.0, 120.0),
+        FAILURE_THROTTLED: ExponentialBackoff(30.0, 600.0),
+    }
+
+    def __init__(self, breaker: Optional[HostCircuitBreaker] = None):
+        self.breaker = breaker or HostCircuitBreaker()
+
+    def call(
+            self, func: Callable[[], Any], host: str,
+            on_retry: Optional[Callable[[str, float], None]] = None,
+            sleep: Callable[[float], None] = time.sleep
+    ) -> Any:
+        """
+        Calls ``func`` until it succeeds or its failure is not retried.
+
+        Args:
+            func (Callable[[], Any]): The download or extraction.
+            host (str): The host_key of the URL.
+            on_retry (Callable[[str, float], None], optional): Called
+                before every wait with the failure class, or "circuit
+                open" while the host is paused, and the seconds to wait.
+            sleep (Callable[[float], None], optional): Waits the given
+                seconds. May raise to abort, e.g. when cancelled.
+
+        Returns:
+            Any: What ``func`` returned.
+
+        Raises:
+            yt_dlp.utils.DownloadError: The last failure, once it is
+                permanent or out of retries.
+        """
+        import yt_dlp
+
+        retries: Dict[str, int] = {}
+        while True:
+            wait: float = self.breaker.retry_after(host)
+            if wait > 0:
+                if on_retry is not None:
+                    on_retry("circuit open", wait)
+                sleep(wait)
+            try:
+                result: Any = func()
+            except yt_dlp.utils.DownloadCancelled:
+                raise
+            except (yt_dlp.utils.DownloadError,
+                    yt_dlp.utils.ExtractorError) as e:
+                kind: str = classify_failure(e)
+                if kind in (FAILURE_TRANSIENT, FAILURE_THROTTLED):
+                    self.breaker.record_failure(host, kind)
+                count: int = retries.get(kind, 0)
+                if count >= self.MAX_RETRIES[kind]:
+                    raise
+                retries[kind] = count + 1
+                backoff: Optional[ExponentialBackoff] = self.BACKOFF.get(kind)
+                delay: float = backoff(count) if backoff is not None else 0.0
+                if on_retry is not None:
+                    on_retry(kind, delay)
+                if delay:
+                    sleep(delay)
+            else:
+                self.breaker.record_success(host)
+                return result
+
+
+class JobMetrics:
+    """
+    Timings and counters of one download job.
+
+    The job moves through the phases in MetricsRegistry.PHASES. Entering
+    a phase closes the previous one, so the time between ``queue`` and
+    the end of the job is split between them without gaps.
+
+    Args:
+        url (str): The URL of the job.
+    """
+    RETRY_RE = re.compile(r'Retrying(?: (fragments?)\b[^(]*)? \(\d+/\d+\)')
+    SKIPPED_FRAGMENT_RE = re.compile(r'Skipping fragment \d+')
+
+    def __init__(self, url: str):
+        self.url = url
+        self.queued_at: float = time.time()
+        self.phases: Dict[str, float] = {}
+        self.downloaded_bytes: int = 0
+        self.retries: int = 0
+        self.fragment_failures: int = 0
+        self.status: str = "queued"
+        self._phase: Optional[str] = "queue"
+        self._phase_started: float = time.monotonic()
+
+    def enter(self, phase: str) -> None:
+        """Closes the current phase and starts ``phase``."""
+        if phase == self._phase:
+            return
+        self.stop()
+        self._phase = phase
+        self._phase_started = time.monotonic()
+
+    def stop(self) -> None:
+        """Closes the current phase."""
+        if self._phase is not None:
+            self.phases[self._phase] = (
+                self.phases.get(self._phase, 0.0)
+                + time.monotonic() - self._phase_started
+            )
+            self._phase = None
+
+    def record_message(self, msg: str) -> None:
+        """Counts the retries and failed fragments yt-dlp reports."""
+        match = self.RETRY_RE.search(msg)
+        if match:
+            self.retries += 1
+            if match.group(1):
+                self.fragment_failures += 1
+        elif self.SKIPPED_FRAGMENT_RE.search(msg):
+            self.fragment_failures += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the metrics as one JSON-serialisable record."""
+        return {
+            'url': self.url,
+            'status': self.status,
+            'queued_at': round(self.queued_at, 3),
+            'phases': {
+                phase: round(seconds, 3)
+                for phase, seconds in self.phases.items()
+            },
+            'downloaded_bytes': self.downloaded_bytes,
+            'retries': self.retries,
+            'fragment_failures': self.fragment_failures,
+        }
+
+
+class MetricsLogger:
+    """
+    Passes yt-dlp's messages on to a logger and counts the retries in them.
+
+    yt-dlp reports retries only as log messages, so the logger of a job
+    is the one place they can be counted.
+
+    Args:
+        logger: The logger the messages are passed on to.
+        metrics (JobMetrics): The metrics of the job.
+    """
+    def __init__(self, logger: Any, metrics: JobMetrics):
+        self.logger = logger
+        self.metrics = metrics
+
+    def debug(self, msg: str) -> None:
+        self.metrics.record_message(msg)
+        self.logger.debug(msg)
+
+    def info(self, msg: str) -> None:
+        self.metrics.record_message(msg)
+        self.logger.info(msg)
+
+    def warning(self, msg: str) -> None:
+        self.metrics.record_message(msg)
+        self.logger.warning(msg)
+
+    def error(self, msg: str) -> None:
+        self.metrics.record_message(msg)
+        self.logger.error(msg)
+
+
+class MetricsRegistry:
+    """
+    Collects the JobMetrics of all jobs and exposes their totals.
+
+    Finished jobs are added to running totals, which can be read with
+    ``snapshot``, served as Prometheus text on localhost with ``serve``,
+    and appended one JSON line per job to a file set with ``set_output``.
+    """
+    PHASES: Tuple[str, ...] = (
+        'queue', 'extraction', 'transfer', 'merge', 'postprocessing',
+        'backoff'
+        )
+
+    def __init__(self):
+        self.logger = LOGGER
+        self._lock = threading.Lock()
+        self._active: Dict[int, JobMetrics] = {}
+        self._jobs: Dict[str, int] = {}
+        self._phase_seconds: Dict[str, float] = dict.fromkeys(
+            self.PHASES, 0.0
+            )
+        self._downloaded_bytes: int = 0
+        self._retries: int = 0
+        self._fragment_failures: int = 0
+        self._output: Optional[str] = None
+        self._server = None
+
+    def new_job(self, url: str) -> JobMetrics:
+        """Starts the metrics of a newly queued job."""
+        metrics = JobMetrics(url)
+        with self._lock:
+            self._active[id(metrics)] = metrics
+        return metrics
+
+    def finish(self, metrics: JobMetrics, status: str) -> None:
+        """
+        Adds a job that ended to the totals.
+
+        Args:
+            metrics (JobMetrics): The metrics of the job.
+            status (str): finished, failed, cancelled or skipped.
+        """
+        metrics.stop()
+        metrics.status = status
+        with self._lock:
+            if self._active.pop(id(metrics), None) is None:
+                return  # Already counted
+            self._jobs[status] = self._jobs.get(status, 0) + 1
+            for phase, seconds in metrics.phases.items():
+                self._phase_seconds[phase] = (
+                    self._phase_seconds.get(phase, 0.0) + seconds
+                )
+            self._downloaded_bytes += metrics.downloaded_bytes
+            self._retries += metrics.retries
+            self._fragment_failures += metrics.fragment_failures
+            output: Optional[str] = self._output
+        if output is not None:
+            try:
+                with open(output, 'a', encoding='utf-8') as output_file:
+                    output_file.write(json.dumps(metrics.to_dict()) + "\n")
+            except OSError as e:
+                self.logger.warning(f"Failed to write metrics: {e}")
+
+    def set_output(self, path: Optional[str]) -> None:
+        """Appends the metrics of every finished job to ``path``."""
+        self._output = path
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the totals over all finished jobs."""
+        with self._lock:
+            return {
+                'active': len(self._active),
+                'jobs': dict(self._jobs),
+                'phase_seconds': dict(self._phase_seconds),
+                'downloaded_bytes': self._downloaded_bytes,
+                'retries': self._retries,
+                'fragment_failures': self._fragment_failures,
+            }
+
+    def prometheus_text(self) -> str:
+        """Returns the totals in the Prometheus text exposition format."""
+        snapshot: Dict[str, Any] = self.snapshot()
+        lines: List[str] = [
+            "# HELP vidoor_active_jobs Jobs queued or in progress.",
+            "# TYPE vidoor_active_jobs gauge",
+            f"vidoor_active_jobs {snapshot['active']}",
+            "# HELP vidoor_jobs_total Jobs that ended, by status.",
+            "# TYPE vidoor_jobs_total counter",
+        ]
+        lines += [
+            f'vidoor_jobs_total{{status="{status}"}} {count}'
+            for status, count in sorted(snapshot['jobs'].items())
+        ]
+        lines += [
+            "# HELP vidoor_phase_seconds_total Time jobs spent per phase.",
+            "# TYPE vidoor_phase_seconds_total counter",
+        ]
+        lines += [
+            f'vidoor_phase_seconds_total{{phase="{phase}"}} {seconds:.3f}'
+            for phase, seconds in snapshot['phase_seconds'].items()
+        ]
+        for name, help_text in (
+                ('downloaded_bytes', "Bytes downloaded."),
+                ('retries', "Retried requests."),
+                ('fragment_failures', "Fragments that failed."),
+        ):
+            lines += [
+                f"# HELP vidoor_{name}_total {help_text}",
+                f"# TYPE vidoor_{name}_total counter",
+                f"vidoor_{name}_total {snapshot[name]}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int) -> int:
+        """
+        Serves the totals at ``http://127.0.0.1:<port>/metrics``.
+
+        Args:
+            port (int): The port to listen on, 0 for any free port.
+
+        Returns:
+            int: The port the endpoint listens on.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body: bytes = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4'
+                    )
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.close()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True
+            ).start()
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        """Stops the endpoint, if it is being served."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Shared by the GUI and the command line
+METRICS: MetricsRegistry = MetricsRegistry()
+
+
+def preload_yt_dlp(
+        on_loaded: Optional[Callable[[float], None]] = None
+) -> threading.Thread:
+    """
+    Imports yt_dlp on a background thread.
+
+    Functions using yt_dlp import it themselves. If they run while the
+    preload is still going, Python's import lock makes them wait for it
+    rather than import yt_dlp a second time.
+
+    Args:
+        on_loaded (Callable[[float], None], optional): Called on the
+            background thread with the seconds the import took.
+
+    Returns:
+        threading.Thread: The started daemon thread.
+    """
+    def load() -> None:
+        started: float = time.perf_counter()
+        importlib.import_module('yt_dlp')
+        if on_loaded is not None:
+            on_loaded(time.perf_counter() - started)
+
+    thread = threading.Thread(target=load, name="yt-dlp-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+class YoutubeDLPool:
+    """
+    Keeps YoutubeDL instances alive between jobs.
+
+    A new YoutubeDL sets up its extractors and cookies from scratch and
+    opens new HTTP connections, and the YouTube extractor downloads the
+    player JS again. Pooled instances keep their connections, cookies
+    and extractor caches instead.
+
+    Instances are grouped by their options. Options in PER_JOB_PARAMS
+    are applied on every checkout, so jobs that only differ in those
+    share instances. An instance is only used by one thread at a time.
+
+    Args:
+        max_idle (int, optional): The number of idle instances kept.
+    """
+    # Options that may change between jobs sharing an instance
+    PER_JOB_PARAMS: Tuple[str, ...] = (
+        'logger', 'format', 'ratelimit', 'concurrent_fragment_downloads',
+        'continuedl', TRANSFER_CHECK_PARAM
+    )
+    # Not yt-dlp options: before_download_hooks are called with the
+    # info_dict of a video before it is downloaded
+    HOOK_PARAMS: Tuple[str, ...] = (
+        'progress_hooks', 'postprocessor_hooks', 'before_download_hooks'
+    )
+    DEFAULT_MAX_IDLE: int = 8
+
+    def __init__(self, max_idle: int = DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[_PooledSession]] = {}
+        self._idle_count: int = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def profile_key(cls, ydl_opts: Dict[str, Any]) -> str:
+        """
+        Returns the key of the instances that can run these options.
+
+        Objects that are not plain data, such as a DownloadArchive, are
+        compared by identity.
+        """
+        shared: Dict[str, Any] = {
+            key: value for key, value in ydl_opts.items()
+            if key not in cls.PER_JOB_PARAMS and key not in cls.HOOK_PARAMS
+        }
+        return json.dumps(
+            shared, sort_keys=True,
+            default=lambda value: f"<{type(value).__name__} {id(value)}>"
+            )
+
+    @contextmanager
+    def session(
+            self, ydl_opts: Dict[str, Any]
+    ) -> Iterator['yt_dlp.YoutubeDL']:
+        """
+        Checks out a YoutubeDL for the options, creating one if needed.
+
+        The instance goes back to the pool afterwards, also when a
+        generator using it is closed early, unless the job raised an
+        error that could have left it in a bad state; then it is closed.
+        """
+        key: str = self.profile_key(ydl_opts)
+        with self._lock:
+            idle: List[_PooledSession] = self._idle.get(key, [])
+            session: Optional[_PooledSession] = idle.pop() if idle else None
+            if session is not None:
+                self._idle_count -= 1
+        if session is None:
+            session = _PooledSession(ydl_opts)
+        session.prepare(ydl_opts)
+        reusable: bool = False
+        try:
+            yield session.ydl
+            reusable = True
+        except GeneratorExit:
+            # The caller stopped early, e.g. a playlist listing; nothing
+            # went wrong with the instance
+            reusable = True
+            raise
+        finally:
+            if reusable:
+                session.release()
+                with self._lock:
+                    if self._idle_count < self.max_idle:
+                        self._idle.setdefault(key, []).append(session)
+                        self._idle_count += 1
+                        session = None
+            if session is not None:
+                session.close()
+
+    def close(self) -> None:
+        """Closes the idle instances, saving their cookies."""
+        with self._lock:
+            sessions: List[_PooledSession] = [
+                session for idle in self._idle.values() for session in idle
+            ]
+            self._idle.clear()
+            self._idle_count = 0
+        for session in sessions:
+            session.close()
+
+
+class _PooledSession:
+    """
+    A YoutubeDL whose hooks and per-job options are swapped for each job.
+    """
+    def __init__(self, ydl_opts: Dict[str, Any]):
+        import yt_dlp
+
+        params: Dict[str, Any] = {
+            key: value for key, value in ydl_opts.items()
+            if key not in YoutubeDLPool.HOOK_PARAMS
+        }
+        # The hooks given to YoutubeDL forward to the current job's hooks
+        params['progress_hooks'] = [self._progress_hook]
+        params['postprocessor_hooks'] = [self._postprocessor_hook]
+        register_sharded_downloader()
+        self.ydl = yt_dlp.YoutubeDL(params)
+        self.ydl.add_post_processor(self, when='before_dl')
+        self.progress_hooks: List[Callable[[Dict[str, Any]], None]] = []
+        self.postprocessor_hooks: List[Callable[[Dict[str, Any]], None]] = []
+        self.before_download_hooks: List[
+            Callable[[Dict[str, Any]], None]
+        ] = []
+
+    def prepare(self, ydl_opts: Dict[str, Any]) -> None:
+        """Applies the hooks and per-job options of the next job."""
+        params: Dict[str, Any] = self.ydl.params
+        if ydl_opts.get('format') != params.get('format'):
+            # YoutubeDL only parses the format when it is created
+            self.ydl.format_selector = (
+                self.ydl.build_format_selector(ydl_opts['format'])
+                if ydl_opts.get('format') else None
+            )
+        for key in YoutubeDLPool.PER_JOB_PARAMS:
+            if key in ydl_opts:
+                params[key] = ydl_opts[key]
+            else:
+                params.pop(key, None)
+        self.progress_hooks = list(ydl_opts.get('progress_hooks', []))
+        self.postprocessor_hooks = list(
+            ydl_opts.get('postprocessor_hooks', [])
+            )
+        self.before_download_hooks = list(
+            ydl_opts.get('before_download_hooks', [])
+            )
+
+    def release(self) -> None:
+        """Drops the hooks of the finished job."""
+        self.progress_hooks = []
+        self.postprocessor_hooks = []
+        self.before_download_hooks = []
+
+    def close(self) -> None:
+        self.release()
+        self.ydl.close()
+
+    def _progress_hook(self, d: Dict[str, Any]) -> None:
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def _postprocessor_hook(self, d: Dict[str, Any]) -> None:
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+    # Registered as a 'before_dl' postprocessor. Not a PostProcessor
+    # subclass, so it does not report to the postprocessor hooks.
+    def set_downloader(self, downloader: 'yt_dlp.YoutubeDL') -> None:
+        pass
+
+    def run(
+            self, info: Dict[str, Any]
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        for hook in self.before_download_hooks:
+            hook(info)
+        return [], info
+
+
+# Shared by the GUI and the command line
+SESSION_POOL: YoutubeDLPool = YoutubeDLPool()
+
+
+def _run_postprocessors(
+        pp_opts: Dict[str, Any], downloads: List[Dict[str, Any]]
+) -> List[str]:
+    """
+    Runs the yt-dlp postprocessors on downloaded files.
+
+    This runs in a PostProcessingPool process.
+
+    Args:
+        pp_opts (Dict[str, Any]): The yt-dlp options of the postprocessors.
+        downloads (List[Dict[str, Any]]): The sanitized info_dicts of the
+            downloaded files, from ``requested_downloads``.
+
+    Returns:
+        List[str]: The paths of the final files.
+    """
+    import yt_dlp
+
+    try:
+        with yt_dlp.YoutubeDL({**pp_opts, 'logger': LOGGER}) as ydl:
+            return [
+                ydl.post_process(info['filepath'], info)['filepath']
+                for info in downloads
+            ]
+    except Exception as e:
+        # yt-dlp errors do not always survive pickling back to the parent
+        raise RuntimeError(f"Post-processing failed: {e}") from None
+
+
+class PostProcessingPool:
+    """
+    Runs yt-dlp postprocessors in worker processes.
+
+    Converting and embedding is CPU-bound ffmpeg work. Running it here
+    lets a download hand its file over and free its slot for the next
+    transfer, so network and CPU work overlap across the queue.
+
+    Processes are spawned rather than forked, which is safe with the
+    threads of the GUI, and only once the first job is submitted.
+
+    Args:
+        max_workers (int, optional): The number of processes. Defaults to
+            the number of CPUs.
+    """
+    # Options the postprocessors need, all of them plain data
+    PARAMS: Tuple[str, ...] = (
+        'postprocessors', 'postprocessor_args', 'keepvideo',
+        'ffmpeg_location', 'paths', 'outtmpl', 'verbose'
+    )
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers: int = max_workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(
+            self, ydl_opts: Dict[str, Any], downloads: List[Dict[str, Any]]
+    ) -> Future:
+        """
+        Queues the postprocessors of ``ydl_opts`` for the downloads.
+
+        Returns:
+            Future: Resolves to the paths of the final files.
+        """
+        pp_opts: Dict[str, Any] = {
+            key: ydl_opts[key] for key in self.PARAMS if key in ydl_opts
+        }
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, multiprocessing.get_context('spawn')
+                    )
+            return self._executor.submit(
+                _run_postprocessors, pp_opts, downloads
+                )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the processes once the running jobs are done."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Shared by the GUI and the command line
+POSTPROCESSING_POOL: PostProcessingPool = PostProcessingPool()
+
+
+# Codec families by the prefix of yt-dlp's codec strings
+CODEC_FAMILIES: Dict[str, str] = {
+    'av01': 'av1', 'av1': 'av1',
+    'vp09': 'vp9', 'vp9': 'vp9', 'vp8': 'vp8',
+    'hev1': 'h265', 'hvc1': 'h265', 'h265': 'h265',
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'mp4a': 'aac', 'aac': 'aac', 'opus': 'opus',
+}
+
+
+def codec_family(codec: Optional[str]) -> Optional[str]:
+    """
+    Maps a codec string such as ``avc1.64001F`` to its family, ``h264``.
+
+    Returns:
+        Optional[str]: The family, the bare codec name if it is not a
+        known one, or None for a missing stream.
+    """
+    if not codec or codec == 'none':
+        return None
+    name: str = codec.split('.')[0].lower()
+    return CODEC_FAMILIES.get(name, name)
+
+
+def _estimate_size(
+        fmt: Dict[str, Any], duration: Optional[float]
+) -> Optional[int]:
+    """The size of a format in bytes, estimated from its bitrate if needed."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+@dataclass(frozen=True)
+class FormatRecord:
+    """
+    A video format offered for a video, with numeric fields to sort on.
+
+    Attributes:
+        format_id (str): The yt-dlp format id.
+        ext (str): The container of the format.
+        height (int): The height in pixels.
+        fps (float): The frame rate, 0 if unknown.
+        vcodec (str): The video codec family, e.g. ``h264`` or ``av1``.
+        acodec (str, optional): The audio codec family, or None for a
+            video-only format.
+        hdr (bool): Whether the format has a high dynamic range.
+        bitrate (float): The total bitrate in KBit/s, 0 if unknown.
+        size (int, optional): The size of the format in bytes.
+        merged_size (int, optional): The estimated size of the download,
+            including the audio stream merged into video-only formats.
+    """
+    __slots__ = (
+        'format_id', 'ext', 'height', 'fps', 'vcodec', 'acodec', 'hdr',
+        'bitrate', 'size', 'merged_size'
+        )
+
+    format_id: str
+    ext: str
+    height: int
+    fps: float
+    vcodec: str
+    acodec: Optional[str]
+    hdr: bool
+    bitrate: float
+    size: Optional[int]
+    merged_size: Optional[int]
+
+    @classmethod
+    def from_format(
+            cls, fmt: Dict[str, Any], duration: Optional[float] = None,
+            audio_size: Optional[int] = None
+    ) -> Optional['FormatRecord']:
+        """
+        Builds a record from a yt-dlp format dict.
+
+        Args:
+            fmt (Dict[str, Any]): One of the ``formats`` of an info_dict.
+            duration (float, optional): The duration of the video, used
+                to estimate sizes from bitrates.
+            audio_size (int, optional): The size of the audio stream that
+                would be merged into a video-only format.
+
+        Returns:
+            Optional[FormatRecord]: The record, or None if the format has
+            no video.
+        """
+        vcodec: Optional[str] = codec_family(fmt.get('vcodec'))
+        if vcodec is None or not fmt.get('height'):
+            return None
+        acodec: Optional[str] = codec_family(fmt.get('acodec'))
+        size: Optional[int] = _estimate_size(fmt, duration)
+        merged_size: Optional[int] = size
+        if size is not None and acodec is None:
+            merged_size = size + audio_size if audio_size else None
+        return cls(
+            format_id=str(fmt['format_id']),
+            ext=fmt.get('ext') or '',
+            height=int(fmt['height']),
+            fps=float(fmt.get('fps') or 0),
+            vcodec=vcodec,
+            acodec=acodec,
+            hdr=(fmt.get('dynamic_range') or 'SDR') != 'SDR',
+            bitrate=float(fmt.get('tbr') or 0),
+            size=size,
+            merged_size=merged_size,
+        )
+
+    @property
+    def sort_key(self) -> Tuple[int, float, bool, float, str]:
+        """Orders records from the lowest to the highest quality."""
+        return (
+            self.height, self.fps, self.hdr, self.bitrate, self.format_id
+            )
+
+    @property
+    def label(self) -> str:
+        """A description such as ``1080p60 HDR (MP4, AV1) (12.34 MB)``."""
+        name: str = f"{self.height}p"
+        if self.fps > 30:
+            name += f"{self.fps:g}"
+        if self.hdr:
+            name += " HDR"
+        size: str = (
+            f"{self.merged_size / (1024 * 1024):.2f} MB"
+            if self.merged_size else "Unknown size"
+        )
+        return f"{name} ({self.ext.upper()}, {self.vcodec.upper()}) ({size})"
+
+
+@dataclass(frozen=True)
+class FormatRule:
+    """
+    Picks the best format by rules such as "up to 1080p, prefer AV1".
+
+    The same rule selects from the records of a fetched video, and is
+    turned into yt-dlp options for videos that are not extracted yet,
+    such as playlist entries.
+
+    Attributes:
+        max_height (int, optional): The highest resolution allowed.
+        vcodec (str, optional): The preferred codec family, e.g. ``av1``.
+        smallest (bool): Prefer the smallest download to the best quality.
+    """
+    max_height: Optional[int] = None
+    vcodec: Optional[str] = None
+    smallest: bool = False
+
+    def select(
+            self, records: List[FormatRecord]
+    ) -> Optional[FormatRecord]:
+        """
+        Selects the format that fits the rule best.
+
+        Formats above ``max_height`` are never selected. Among the rest
+        the preferred codec wins, then the smallest size or the best
+        quality. Ties are broken by the format id, so the choice does not
+        depend on the order of the records.
+
+        Returns:
+            Optional[FormatRecord]: The selected record, or None if no
+            format is low enough.
+        """
+        candidates: List[FormatRecord] = [
+            record for record in records
+            if self.max_height is None or record.height <= self.max_height
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=self._rank)
+
+    def _rank(self, record: FormatRecord) -> Tuple[Any, ...]:
+        preferred: bool = self.vcodec is None or record.vcodec == self.vcodec
+        if not self.smallest:
+            return (preferred, record.sort_key)
+        size: float = (
+            record.merged_size if record.merged_size is not None
+            else float('inf')
+        )
+        return (preferred, -size, record.sort_key)
+
+    def format_spec(self) -> str:
+        """The yt-dlp format selector limiting the resolution."""
+        limit: str = (
+            f"[height<=?{self.max_height}]" if self.max_height else ""
+            )
+        return (
+            f"bv*{limit}+ba[ext=m4a]/bv*{limit}+ba/b{limit}"
+            if limit else 'bestvideo+bestaudio/best'
+        )
+
+    def format_sort(self) -> List[str]:
+        """The yt-dlp sort fields that come before the default ones."""
+        fields: List[str] = []
+        if self.vcodec:
+            fields.append(f"vcodec:{self.vcodec}")
+        if self.smallest:
+            fields.append('+size')
+        return fields
+
+
+def load_video_info(
+        url: str, cache: Optional[MetadataCache] = None
+) -> Dict[str, Any]:
+    """
+    Returns the sanitized info_dict of a video, from the cache if possible.
+
+    The info is cleaned up like yt-dlp's --load-info-json, so it can be
+    stored as JSON and fed back to process_ie_result for the download.
+    Only the video itself is extracted, even if the URL also names a
+    playlist.
+
+    Args:
+        url (str): The URL of the video.
+        cache (MetadataCache, optional): A cache consulted before
+            extracting, and updated after a successful extraction.
+
+    Raises:
+        yt_dlp.utils.DownloadError: If the video info cannot be extracted.
+    """
+    key: Optional[str] = MetadataCache.key_for_url(url)
+    if cache is not None and key:
+        cached: Optional[Dict[str, Any]] = cache.get(key)
+        if cached is not None:
+            return cached
+
+    ydl_opts = {'logger': LOGGER, 'quiet': True, 'noplaylist': True}
+    with SESSION_POOL.session(ydl_opts) as ydl:
+        info_dict = ydl.sanitize_info(
+            ydl.extract_info(url, download=False),
+            remove_private_keys=True
+            )
+    if cache is not None and key:
+        cache.put(key, info_dict)
+    return info_dict
+
+
+class InfoPrefetcher:
+    """
+    Extracts video info in the background before it is asked for.
+
+    Extractions are started speculatively, e.g. while a URL is typed or
+    pasted, on a few threads of their own. Every URL is extracted at most
+    once at a time: ``get`` waits for an extraction that is already
+    running instead of starting another, and finished results are kept in
+    memory for ``ttl`` seconds on top of the MetadataCache. Callers get
+    copies of the info, as downloads modify it. Prefetches
+    that did not start yet are dropped when ``retain`` no longer lists
+    their URL. It is thread safe.
+
+    Args:
+        cache (MetadataCache, optional): Consulted before extracting, and
+            updated after a successful extraction.
+        retry (RetryPolicy, optional): Retries extractions that failed for
+            a transient reason.
+        max_workers (int, optional): The number of extractions prefetched
+            at the same time.
+        max_entries (int, optional): The number of results kept in memory.
+        ttl (float, optional): Seconds a result is kept in memory.
+    """
+    DEFAULT_MAX_WORKERS: int = 2
+    DEFAULT_MAX_ENTRIES: int = 64
+    # Short enough for the signed stream URLs to stay valid for the download
+    DEFAULT_TTL: float = 30 * 60
+
+    def __init__(
+            self, cache: Optional[MetadataCache] = None,
+            retry: Optional[RetryPolicy] = None,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            ttl: float = DEFAULT_TTL
+    ):
+        self.cache = cache
+        self.retry = retry
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # In insertion order, so the oldest results are evicted first
+        self._futures: Dict[str, Future] = {}
+        self._started: Dict[str, float] = {}
+
+    def prefetch(self, url: str) -> Future:
+        """
+        Starts extracting the info of ``url`` unless it is known already.
+
+        Returns:
+            Future: Resolves to the sanitized info_dict, which is shared;
+            use ``get`` or ``peek`` for a copy.
+        """
+        with self._lock:
+            future: Optional[Future] = self._lookup(url)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        self.max_workers, thread_name_prefix='prefetch'
+                        )
+                future = self._executor.submit(self._extract, url, None)
+                self._remember(url, future)
+            return future
+
+    def get(
+            self, url: str,
+            on_retry: Optional[Callable[[str, float], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Returns the info of ``url``, extracting it on this thread if it
+        was not prefetched.
+
+        Args:
+            url (str): The URL of the video.
+            on_retry (Callable[[str, float], None], optional): Called
+                before an extraction started here is retried, see
+                RetryPolicy.call.
+
+        Raises:
+            yt_dlp.utils.DownloadError: If the video info cannot be
+                extracted.
+        """
+        with self._lock:
+            future: Optional[Future] = self._lookup(url)
+            if future is not None and future.cancel():
+                future = None  # Not started, so extract it right here
+            if future is None:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self._remember(url, future)
+                owner: bool = True
+            else:
+                owner = False
+        if not owner:
+            return self._copy(future.result())
+        try:
+            info_dict: Dict[str, Any] = self._extract(url, on_retry)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(info_dict)
+        return self._copy(info_dict)
+
+    def peek(self, url: str) -> Optional[Dict[str, Any]]:
+        """Returns the info of ``url`` if it was already extracted."""
+        with self._lock:
+            future: Optional[Future] = self._lookup(url)
+        if future is None or not future.done() or future.cancelled():
+            return None
+        if future.exception() is not None:
+            return None
+        return self._copy(future.result())
+
+    def retain(self, urls: Iterable[str]) -> None:
+        """Drops the prefetches of other URLs that did not start yet."""
+        keep: Set[str] = set(urls)
+        with self._lock:
+            for url, future in list(self._futures.items()):
+                if url not in keep and future.cancel():
+                    self._forget(url)
+
+    def shutdown(self) -> None:
+        """Drops pending prefetches without waiting for running ones."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _extract(
+            self, url: str,
+            on_retry: Optional[Callable[[str, float], None]]
+    ) -> Dict[str, Any]:
+        if self.retry is None:
+            return load_video_info(url, self.cache)
+        return self.retry.call(
+            partial(load_video_info, url, self.cache), host_key(url),
+            on_retry
+            )
+
+    @staticmethod
+    def _copy(info_dict: Dict[str, Any]) -> Dict[str, Any]:
+        # Sanitized info is plain JSON, which copies faster than deepcopy
+        return json.loads(json.dumps(info_dict))
+
+    def _lookup(self, url: str) -> Optional[Future]:
+        """The usable future of ``url``, called with the lock held."""
+        future: Optional[Future] = self._futures.get(url)
+        if future is None:
+            return None
+        expired: bool = time.monotonic() - self._started[url] > self.ttl
+        # Failures are not kept, the next request tries again
+        if future.cancelled() or (future.done() and (
+                expired or future.exception() is not None)):
+            self._forget(url)
+            return None
+        return future
+
+    def _remember(self, url: str, future: Future) -> None:
+        """Stores a new future, called with the lock held."""
+        self._futures[url] = future
+        self._started[url] = time.monotonic()
+        for old in list(self._futures)[:-self.max_entries]:
+            if self._futures[old].done():
+                self._forget(old)
+
+    def _forget(self, url: str) -> None:
+        self._futures.pop(url, None)
+        self._started.pop(url, None)
+
+
+def list_formats(info_dict: Dict[str, Any]) -> List[FormatRecord]:
+    """
+    Lists the video formats offered for a video.
+
+    Video-only formats are sized with the audio stream the download would
+    merge in, the best m4a stream if there is one.
+
+    Args:
+        info_dict (Dict[str, Any]): The info_dict of the video.
+
+    Returns:
+        List[FormatRecord]: The video formats, from the lowest to the
+        highest quality.
+    """
+    formats: List[Dict[str, Any]] = info_dict.get('formats') or []
+    duration: Optional[float] = info_dict.get('duration')
+    audio_formats: List[Dict[str, Any]] = [
+        fmt for fmt in formats
+        if codec_family(fmt.get('vcodec')) is None
+        and codec_family(fmt.get('acodec')) is not None
+    ]
+    # Same preference as the format selector of build_download_options
+    audio: Optional[Dict[str, Any]] = max(
+        audio_formats, default=None,
+        key=lambda fmt: (fmt.get('ext') == 'm4a', fmt.get('abr') or 0)
+        )
+    audio_size: Optional[int] = (
+        _estimate_size(audio, duration) if audio is not None else None
+        )
+    records: List[FormatRecord] = []
+    for fmt in formats:
+        record = FormatRecord.from_format(fmt, duration, audio_size)
+        if record is not None:
+            records.append(record)
+    records.sort(key=lambda record: record.sort_key)
+    return records
+
+
+def iter_playlist_entries(url: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the entries of a playlist as they are extracted.
+
+    The playlist is extracted flat and lazily. ``process=False`` keeps
+    yt-dlp from collecting every entry before returning, so ``entries``
+    stays a lazy iterator. URL results, such as a watch URL pointing at
+    its playlist, are followed first. A URL that turns out not to be a
+    playlist yields itself.
+
+    Args:
+        url (str): The URL of the playlist.
+
+    Yields:
+        Dict[str, Any]: The ``url``, ``id``, ``ie_key`` and ``title``
+        of each entry.
+
+    Raises:
+        yt_dlp.utils.DownloadError: If the playlist cannot be extracted.
+    """
+    ydl_opts = {
+        'logger': LOGGER,
+        'quiet': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    with SESSION_POOL.session(ydl_opts) as ydl:
+        result: Dict[str, Any] = ydl.extract_info(
+            url, download=False, process=False
+            )
+        for _ in range(5):
+            if result.get('_type') not in ('url', 'url_transparent'):
+                break
+            result = ydl.extract_info(
+                result['url'], download=False, process=False,
+                ie_key=result.get('ie_key')
+                )
+
+        if result.get('_type') not in ('playlist', 'multi_video'):
+            # Not a playlist after all: download the URL itself
+            yield {
+                'url': result.get('webpage_url') or url,
+                'id': result.get('id'),
+                'ie_key': result.get('extractor_key'),
+                'title': result.get('title'),
+            }
+            return
+
+        for entry in result.get('entries') or []:
+            if not entry:
+                continue
+            entry_url: Optional[str] = (
+                entry.get('url') or entry.get('webpage_url')
+            )
+            if not entry_url and entry.get('id'):
+                entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+            if entry_url:
+                yield {
+                    'url': entry_url,
+                    'id': entry.get('id'),
+                    'ie_key': entry.get('ie_key'),
+                    'title': entry.get('title'),
+                }
+
+
+def build_download_options(
+        download_type: str, resolution: Optional[str],
+        downloads_folder: str = DOWNLOADS_FOLDER,
+        download_archive: Optional[DownloadArchive] = None,
+        format_rule: Optional[FormatRule] = None,
+        scratch_folder: Optional[str] = SCRATCH_FOLDER,
+        sharded: bool = True
+) -> Dict[str, Any]:
+    """
+    Set up yt-dlp options based on download type (video or audio).
+
+    Args:
+        download_type (str): "Video" or "Audio".
+        resolution (str, optional): The format id of the chosen video
+            resolution. Without it the best quality is downloaded.
+        downloads_folder (str, optional): The folder to save to.
+        download_archive (DownloadArchive, optional): When given, yt-dlp
+            skips the videos recorded in it.
+        format_rule (FormatRule, optional): Selects the video format when
+            no resolution was chosen.
+        scratch_folder (str, optional): Where .part files, fragments and
+            intermediate files are written; the finished file is moved to
+            ``downloads_folder``. Defaults to SCRATCH_FOLDER.
+        sharded (bool, optional): Download large progressive formats over
+            several connections with the sharded HTTP downloader.
+    """
+    paths: Dict[str, str] = {'home': downloads_folder}
+    if scratch_folder:
+        paths['temp'] = scratch_folder
+    ydl_opts: Dict[str, Any] = {
+        'format': (
+            f"{resolution}+bestaudio[ext=m4a]/{resolution}+bestaudio/best"
+            if resolution
+            else 'bestaudio/best' if download_type == "Audio"
+            else 'bestvideo+bestaudio/best'
+        ),
+        # Relative, so yt-dlp can put temporary files in paths['temp']
+        'outtmpl': '%(title)s.%(ext)s',
+        'paths': paths,
+        'buffersize': WRITE_BLOCK_SIZE,
+        'concurrent_fragment_downloads': 4,
+        'fragment_retries': 10,
+        'skip_unavailable_fragments': True,
+        'retries': 5,
+        'extractor_retries': 3,
+        'retry_sleep_functions': RETRY_SLEEP_FUNCTIONS,
+        'verbose': True,
+        'logger': LOGGER,
+    }
+    if sharded:
+        # Also covers https, see register_sharded_downloader
+        ydl_opts['external_downloader'] = {'http': SHARDED_DOWNLOADER}
+
+    if download_archive is not None:
+        # Also catches duplicates only recognisable after extraction
+        ydl_opts['download_archive'] = download_archive
+
+    if download_type == "Audio":
+        ydl_opts.update(get_audio_postprocessors())
+    else:
+        # Among the best resolutions prefer streams that fit into mp4 as
+        # they are, so the merge writes the final file in a single pass
+        ydl_opts['format_sort'] = ['res', 'fps', 'ext:mp4:m4a']
+        if format_rule is not None and not resolution:
+            ydl_opts['format'] = format_rule.format_spec()
+            ydl_opts['format_sort'] = (
+                format_rule.format_sort() + ydl_opts['format_sort']
+                )
+        ydl_opts['merge_output_format'] = 'mp4/mkv'
+        ydl_opts.update(get_video_postprocessors())
+
+    return ydl_opts
+
+
+def output_template(ydl_opts: Dict[str, Any]) -> str:
+    """Returns the absolute output template of yt-dlp options."""
+    return os.path.join(
+        (ydl_opts.get('paths') or {}).get('home', ''), ydl_opts['outtmpl']
+        )
+
+
+def get_audio_postprocessors() -> Dict[str, Any]:
+    """Return postprocessor options for audio downloads."""
+    return {
+        'postprocessors': [
+            {
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192'
+                },
+            {'key': 'EmbedThumbnail'},
+        ]
+    }
+
+
+def get_video_postprocessors() -> Dict[str, Any]:
+    """
+    Return postprocessor options for video downloads.
+
+    The convertor only remuxes files that did not come out as mp4, such
+    as mkv merges of webm streams, and its ``-c copy`` is scoped to it so
+    no other postprocessor is affected.
+    """
+    return {
+        'postprocessors': [
+            {'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}
+            ],
+        'postprocessor_args': {'videoconvertor': ['-c', 'copy']},
+    }
+
+
+def pending_postprocessors(
+        postprocessors: List[Dict[str, Any]],
+        downloads: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Drops the postprocessors that would leave the downloads unchanged.
+
+    A video convertor whose target format every download already has
+    would only log that it skips them, which is not worth a trip to the
+    post-processing pool.
+
+    Args:
+        postprocessors (List[Dict[str, Any]]): The postprocessor options.
+        downloads (List[Dict[str, Any]]): The ``requested_downloads`` of
+            the finished download.
+
+    Returns:
+        List[Dict[str, Any]]: The postprocessors that still have work.
+    """
+    extensions = {
+        (download.get('ext') or '').lower() for download in downloads
+    }
+    return [
+        pp for pp in postprocessors
+        if not (
+            pp.get('key') == 'FFmpegVideoConvertor'
+            and extensions == {pp.get('preferedformat')}
+        )
+    ]
+
+
+class DownloadTask:
+    """
+    Downloads a video or audio with yt_dlp on the calling thread.
+
+    This is the download engine shared by the GUI and the command line.
+    It supports cooperative pause and cancel from other threads: both are
+    checked from the yt_dlp progress hooks, which run between chunks.
+
+    Args:
+        url (str): The URL of the video.
+        ydl_opts (Dict[str, Any]): The yt-dlp options for the download.
+        info_dict (Dict[str, Any], optional): An info_dict already
+            extracted, e.g. by load_video_info. When given, the download
+            skips the second extraction.
+        tuner (FragmentConcurrencyTuner, optional): When given, the
+            fragment concurrency is chosen by the tuner before every
+            stream, and each stream's throughput is reported back.
+        archive (DownloadArchive, optional): The archive the video is
+            recorded in once it has been downloaded.
+        on_progress (Callable[[ProgressSnapshot], None], optional):
+            Called on the download thread with coalesced progress, at
+            most every ProgressAggregator.DEFAULT_INTERVAL seconds. A
+            percentage of -1 means only the status changed.
+        bandwidth (BandwidthScheduler, optional): When given, the
+            download is rate limited to the share the scheduler assigns.
+        priority (str, optional): The priority class of the download in
+            the bandwidth scheduler.
+        postprocessing (PostProcessingPool, optional): When given, the
+            postprocessors run on this pool after the transfer instead of
+            on the calling thread, and ``postprocess_future`` is set.
+        metrics (JobMetrics, optional): When given, the time spent in
+            every phase, the bytes and the retries are recorded in it,
+            and it is added to METRICS when the job ends.
+        retry (RetryPolicy, optional): When given, failed downloads are
+            retried as the policy decides, re-extracting expired URLs.
+        part_files (PartFileAllocator, optional): When given, the .part
+            files are preallocated and synced in batches.
+        disk_space (DiskSpaceGovernor, optional): When given, the
+            download waits until the disk has room for it before it
+            starts writing.
+    """
+    # The messages of runs that downloaded nothing
+    SKIPPED_MESSAGES: Tuple[str, ...] = (
+        "Already downloaded", "Nothing downloaded", "No new playlist videos"
+    )
+
+    def __init__(
+            self, url: str, ydl_opts: Dict[str, Any],
+            info_dict: Optional[Dict[str, Any]] = None,
+            tuner: Optional[FragmentConcurrencyTuner] = None,
+            archive: Optional[DownloadArchive] = None,
+            on_progress: Optional[Callable[[ProgressSnapshot], None]] = None,
+            bandwidth: Optional[BandwidthScheduler] = None,
+            priority: str = BandwidthScheduler.DEFAULT_PRIORITY,
+            postprocessing: Optional[PostProcessingPool] = None,
+            metrics: Optional[JobMetrics] = None,
+            retry: Optional[RetryPolicy] = None,
+            part_files: Optional[PartFileAllocator] = None,
+            disk_space: Optional[DiskSpaceGovernor] = None
+    ):
+        self.url = url
+        self.ydl_opts = ydl_opts
+        self.info_dict = info_dict
+        self.tuner = tuner
+        self.archive = archive
+        self.on_progress = on_progress
+        self.bandwidth = bandwidth
+        self.priority = priority
+        self.postprocessing = postprocessing
+        self.metrics = metrics
+        self.retry = retry
+        self.part_files = part_files
+        self.disk_space = disk_space
+        # The postprocessors still running on the pool after run()
+        self.postprocess_future: Optional[Future] = None
+        self.progress = ProgressAggregator()
+        self._ydl: Optional[yt_dlp.YoutubeDL] = None
+        self._rate_limit: Optional[float] = None
+        # The fragment concurrency in use before a rate limit was applied
+        self._unlimited_fragments: Optional[int] = None
+        self._cancel_requested = False
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+
+    def cancel(self) -> None:
+        """Requests the download to stop at the next progress callback."""
+        self._cancel_requested = True
+        self._cancel_event.set()  # Cut a retry wait short
+        self._resume_event.set()  # Wake the download up if it is paused
+        if self.disk_space is not None:
+            self.disk_space.wake()  # Stop waiting for disk space
+
+    def pause(self) -> None:
+        """Blocks the download at the next progress callback."""
+        self._resume_event.clear()
+
+    def resume(self) -> None:
+        """Resumes a paused download."""
+        self._resume_event.set()
+
+    def is_paused(self) -> bool:
+        """Returns True if the download is paused."""
+        return not self._resume_event.is_set()
+
+    def run(self) -> str:
+        """
+        Runs the download.
+
+        Returns:
+            str: A completion message, or "Post-processing..." if the
+            postprocessors were handed to the pool.
+
+        Raises:
+            yt_dlp.utils.DownloadCancelled: If the download was cancelled.
+            yt_dlp.utils.DownloadError: If the download failed.
+        """
+        import yt_dlp
+
+        if self.metrics is None:
+            return self._run_with_retry()
+        self.metrics.enter('extraction')
+        try:
+            message: str = self._run_with_retry()
+        except yt_dlp.utils.DownloadCancelled:
+            METRICS.finish(self.metrics, "cancelled")
+            raise
+        except Exception:
+            METRICS.finish(self.metrics, "failed")
+            raise
+        if self.postprocess_future is not None:
+            self.metrics.enter('postprocessing')
+            self.postprocess_future.add_done_callback(self._postprocessed)
+        elif message in self.SKIPPED_MESSAGES:
+            METRICS.finish(self.metrics, "skipped")
+        else:
+            METRICS.finish(self.metrics, "finished")
+        return message
+
+    def _run_with_retry(self) -> str:
+        """Runs the download, retrying it as the retry policy decides."""
+        if self.retry is None:
+            return self._run()
+        return self.retry.call(
+            self._run, host_key(self.url), self._on_retry, self._wait
+            )
+
+    def _on_retry(self, reason: str, delay: float) -> None:
+        """Prepares the next attempt and reports the wait before it."""
+        if reason == FAILURE_EXPIRED:
+            # The signed stream URLs in the info_dict are no longer valid
+            self.info_dict = None
+        if self.metrics is not None:
+            if reason != "circuit open":
+                self.metrics.retries += 1
+            if delay:
+                self.metrics.enter('backoff')
+        if delay:
+            self._report(ProgressSnapshot(
+                -1, 0.0, delay,
+                f"Retrying in {format_eta(delay)} ({reason})"
+                ))
+
+    def _wait(self, seconds: float) -> None:
+        """Waits before a retry, unless the download is cancelled."""
+        import yt_dlp
+
+        if self._cancel_event.wait(seconds):
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled by user")
+        if self.metrics is not None:
+            self.metrics.enter('extraction')
+
+    def _run(self) -> str:
+        """Runs one attempt of the download; see run."""
+        import yt_dlp
+
+        ydl_opts: Dict[str, Any] = dict(self.ydl_opts)
+        deferred: bool = (
+            self.postprocessing is not None
+            and bool(ydl_opts.get('postprocessors'))
+        )
+        if deferred:
+            ydl_opts['postprocessors'] = []
+            archive: Any = ydl_opts.get('download_archive')
+            if isinstance(archive, DownloadArchive):
+                # Recorded once the pool post-processed the video
+                ydl_opts['download_archive'] = archive.read_only
+        if self.bandwidth is not None:
+            self.bandwidth.register(
+                self, self.priority, self._set_rate_limit
+                )
+        try:
+            info = self._run_ydl(ydl_opts)
+        finally:
+            if self.bandwidth is not None:
+                self.bandwidth.unregister(self)
+            if self.disk_space is not None:
+                self.disk_space.release(self)
+
+        if not info:
+            # yt-dlp returns nothing for a video it found in the archive
+            # by the id in its URL, before extracting anything
+            if self.archive is not None and self.archive.has_url(self.url):
+                return "Already downloaded"
+            return "Nothing downloaded"
+        # URLs such as channels resolve to playlists only when extracted
+        playlist: bool = info.get('_type') == 'playlist' or 'entries' in info
+        videos: List[Dict[str, Any]] = self._videos(info)
+        downloaded: List[Dict[str, Any]] = [
+            video for video in videos if video.get('requested_downloads')
+        ]
+        if not downloaded:
+            if playlist:
+                # yt-dlp drops the entries it skips through the archive
+                return "No new playlist videos"
+            if self._is_archived(info):
+                return "Already downloaded"
+            # Skipped for another reason, e.g. a live stream not started
+            return "Nothing downloaded"
+        archive_ids: List[str] = [
+            archive_id for archive_id in map(self._archive_id, downloaded)
+            if archive_id is not None
+        ]
+        message: str = (
+            f"Downloaded {len(downloaded)} playlist videos"
+            if playlist else "Download Completed - 100%"
+        )
+        if deferred:
+            downloads: List[Dict[str, Any]] = [
+                yt_dlp.YoutubeDL.sanitize_info(download)
+                for video in downloaded
+                for download in video['requested_downloads']
+            ]
+            postprocessors = pending_postprocessors(
+                self.ydl_opts['postprocessors'], downloads
+                )
+            if postprocessors:
+                self.postprocess_future = self.postprocessing.submit(
+                    {**self.ydl_opts, 'postprocessors': postprocessors},
+                    downloads
+                    )
+                if archive_ids:
+                    self.postprocess_future.add_done_callback(
+                        partial(self._archive_postprocessed, archive_ids)
+                        )
+                return "Post-processing..."
+        for archive_id in archive_ids:
+            self.archive.add(archive_id)
+        return message
+
+    @classmethod
+    def _videos(cls, info: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The videos of a yt-dlp result, the entries of playlists."""
+        if info.get('_type') != 'playlist' and 'entries' not in info:
+            return [info]
+        return [
+            video for entry in info.get('entries') or [] if entry
+            for video in cls._videos(entry)
+        ]
+
+    def _archive_id(self, video: Dict[str, Any]) -> Optional[str]:
+        """The archive id of a video, if it is recorded in an archive."""
+        if self.archive is None or not video.get('id'):
+            return None
+        return DownloadArchive.make_id(
+            video.get('extractor_key') or 'generic', video['id']
+            )
+
+    def _is_archived(self, video: Dict[str, Any]) -> bool:
+        """Returns True if yt-dlp skipped the video as it is archived."""
+        archive_id: Optional[str] = self._archive_id(video)
+        return archive_id is not None and archive_id in self.archive
+
+    def _archive_postprocessed(
+            self, archive_ids: List[str], future: Future
+    ) -> None:
+        """Records the videos once the pool post-processed them."""
+        if not future.cancelled() and future.exception() is None:
+            for archive_id in archive_ids:
+                self.archive.add(archive_id)
+
+    def _postprocessed(self, future: Future) -> None:
+        """Ends the metrics once the pool has run the postprocessors."""
+        if future.cancelled():
+            METRICS.finish(self.metrics, "cancelled")
+        elif future.exception() is not None:
+            METRICS.finish(self.metrics, "failed")
+        else:
+            METRICS.finish(self.metrics, "finished")
+
+    def _run_ydl(self, ydl_opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Downloads on a pooled YoutubeDL and returns the info_dict."""
+        ydl_opts['progress_hooks'] = [self._progress_hook]
+        ydl_opts['postprocessor_hooks'] = [self._postprocessor_hook]
+        ydl_opts[TRANSFER_CHECK_PARAM] = self._check_transfer
+        if self.disk_space is not None:
+            ydl_opts['before_download_hooks'] = [self._reserve_disk_space]
+        if self.tuner is not None:
+            ydl_opts['concurrent_fragment_downloads'] = self.tuner.suggest()
+        self._apply_rate_limit(ydl_opts)
+        if self.metrics is not None:
+            ydl_opts['logger'] = MetricsLogger(
+                ydl_opts.get('logger') or LOGGER, self.metrics
+                )
+        with SESSION_POOL.session(ydl_opts) as ydl:
+            self._ydl = ydl
+            try:
+                if self.info_dict is not None:
+                    return self._download_with_info(ydl)
+                return ydl.extract_info(self.url, download=True)
+            finally:
+                self._ydl = None
+
+    def _reserve_disk_space(self, info: Dict[str, Any]) -> None:
+        """Waits until the disk has room for the selected formats."""
+        import yt_dlp
+
+        paths: Dict[str, str] = self.ydl_opts.get('paths') or {}
+        folder: str = paths.get('home') or os.path.dirname(
+            os.path.abspath(output_template(self.ydl_opts))
+            )
+
+        def on_wait(status: str) -> None:
+            if self.metrics is not None:
+                self.metrics.enter('queue')
+            self._report(ProgressSnapshot(-1, 0.0, -1.0, status))
+
+        reserved: bool = self.disk_space.reserve(
+            self, estimate_download_size(info), folder, paths.get('temp'),
+            on_wait, lambda: self._cancel_requested
+            )
+        if not reserved:
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled by user")
+
+    def _set_rate_limit(self, rate: Optional[float]) -> None:
+        """
+        Applies the share given by the bandwidth scheduler.
+
+        yt-dlp reads ``ratelimit`` while a progressive stream downloads,
+        so the new share takes effect immediately. Fragmented streams copy
+        their options when they start and pick it up with the next stream.
+        """
+        self._rate_limit = rate
+        ydl: Optional[yt_dlp.YoutubeDL] = self._ydl
+        if ydl is not None:
+            self._apply_rate_limit(ydl.params)
+
+    def _apply_rate_limit(self, params: Dict[str, Any]) -> None:
+        """
+        Sets the rate limit in the yt-dlp options.
+
+        yt-dlp limits every fragment connection separately, so limited
+        downloads fetch one fragment at a time to stay within the share.
+        Once the limit is lifted, the concurrency from before comes back,
+        or the tuner's suggestion if there is a tuner.
+        """
+        if self._rate_limit is None:
+            params.pop('ratelimit', None)
+            fragments: Optional[int] = self._unlimited_fragments
+            self._unlimited_fragments = None
+            if fragments is not None:
+                params['concurrent_fragment_downloads'] = (
+                    self.tuner.suggest() if self.tuner is not None
+                    else fragments
+                )
+            return
+        if self._unlimited_fragments is None:
+            self._unlimited_fragments = params.get(
+                'concurrent_fragment_downloads', 1
+                )
+        params['ratelimit'] = int(self._rate_limit)
+        params['concurrent_fragment_downloads'] = 1
+
+    def _download_with_info(
+            self, ydl: 'yt_dlp.YoutubeDL'
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Download from the pre-extracted info_dict.
+
+        Stream URLs in the info_dict are signed and expire, so an attempt
+        that failed because of that falls back to a fresh extraction, like
+        yt-dlp does for --load-info-json. Other failures are raised, as a
+        new extraction would not help against them.
+        """
+        import yt_dlp
+
+        try:
+            return ydl.process_ie_result(self.info_dict, download=True)
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ReExtractInfo) as e:
+            if classify_failure(e) != FAILURE_EXPIRED:
+                raise
+            self.ydl_opts['logger'].warning(
+                f"Cached video info failed to download: {e}; "
+                f"extracting {self.url} again"
+                )
+            return ydl.extract_info(
+                self.info_dict.get('webpage_url') or self.url, download=True
+                )
+
+    def _report(self, snapshot: ProgressSnapshot) -> None:
+        """Passes a snapshot to the on_progress callback, if any."""
+        if self.on_progress is not None:
+            self.on_progress(snapshot)
+
+    def _check_cancel_and_pause(self) -> None:
+        """Waits while paused and aborts the download if cancelled."""
+        import yt_dlp
+
+        if not self._resume_event.is_set():
+            self._report(ProgressSnapshot(-1, 0.0, -1.0, "Paused"))
+            self._resume_event.wait()
+        if self._cancel_requested:
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled by user")
+
+    def _check_transfer(self) -> None:
+        """
+        Waits while paused and aborts if cancelled, on the transfer
+        threads of the sharded downloader; see TRANSFER_CHECK_PARAM.
+
+        The progress hook reports the pause, so this stays quiet.
+        """
+        import yt_dlp
+
+        self._resume_event.wait()
+        if self._cancel_requested:
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled by user")
+
+    def _progress_hook(self, d: Dict[str, Any]) -> None:
+        """Report coalesced yt-dlp download progress."""
+        self._check_cancel_and_pause()
+        if self.part_files is not None:
+            self.part_files.update(d)
+        if self.disk_space is not None:
+            self.disk_space.update(self, d)
+        if self.metrics is not None:
+            if d['status'] == 'downloading':
+                self.metrics.enter('transfer')
+            elif d['status'] == 'finished':
+                self.metrics.downloaded_bytes += (
+                    d.get('total_bytes') or d.get('downloaded_bytes') or 0
+                )
+        snapshot: Optional[ProgressSnapshot] = self.progress.update(d)
+        if snapshot is not None:
+            self._report(snapshot)
+            if self.bandwidth is not None and d['status'] == 'downloading':
+                self.bandwidth.report_speed(self, snapshot.speed)
+        if d['status'] == 'finished' and self.tuner is not None:
+            self._retune_fragments()
+
+    def _retune_fragments(self) -> None:
+        """
+        Report the finished stream to the tuner and pick the concurrency
+        for the next one.
+
+        yt-dlp reads ``concurrent_fragment_downloads`` from the YoutubeDL
+        params each time it starts a stream, so the audio stream of a
+        video download already uses the new value.
+        """
+        if self._ydl is None:
+            return
+        params: Dict[str, Any] = self._ydl.params
+        if self._rate_limit is not None:
+            return  # Throttled throughput says nothing about the link
+        if self.progress.stream_throughput:
+            self.tuner.record(
+                params.get('concurrent_fragment_downloads', 1),
+                self.progress.stream_throughput
+                )
+        params['concurrent_fragment_downloads'] = self.tuner.suggest()
+
+    def _postprocessor_hook(self, d: Dict[str, Any]) -> None:
+        """Report yt-dlp post-processing progress."""
+        self._check_cancel_and_pause()
+        if d['status'] == 'started':
+            if self.metrics is not None:
+                self.metrics.enter(
+                    'merge' if d.get('postprocessor') == 'Merger'
+                    else 'postprocessing'
+                    )
+            status: str = (
+                "Merging Audio and Video..."
+                if d.get('postprocessor') == 'Merger'
+                else "Post-processing..."
+            )
+            self._report(ProgressSnapshot(100, 0.0, -1.0, status))
@@ -0,0 +1,1830 @@
+import re
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from functools import partial
+from typing import Optional, Dict, Any, List, Tuple, Deque
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QVBoxLayout, QLabel,
+    QLineEdit, QPushButton, QComboBox, QWidget,
+    QMessageBox, QProgressBar, QGroupBox, QHBoxLayout,
+    QTableView, QHeaderView, QAbstractItemView, QSpinBox,
+    QStyledItemDelegate, QStyleOptionProgressBar, QStyle, QCheckBox
+)
+from PyQt5.QtCore import (
+    Qt, QThread, QObject, QTimer, QEvent, pyqtSignal, QAbstractTableModel,
+    QAbstractListModel, QModelIndex
+)
+from PyQt5.QtGui import QMovie, QPixmap, QIcon
+
+from core import (
+    APP_DATA_DIR, DOWNLOADS_FOLDER, LOGGER, youtube_video_id,
+    is_playlist_url, MetadataCache, JobJournal, DownloadArchive, format_bytes,
+    ProgressSnapshot, FragmentConcurrencyTuner, BandwidthScheduler,
+    FormatRecord, DownloadTask, split_urls,
+    host_key, load_video_info, list_formats, iter_playlist_entries,
+    build_download_options, preload_yt_dlp, SESSION_POOL,
+    POSTPROCESSING_POOL, PostProcessingPool, JobMetrics, METRICS,
+    RetryPolicy, PartFileAllocator, output_template, InfoPrefetcher,
+    DiskSpaceGovernor
+)
+
+# Determine the directory of the script
+script_dir = os.path.dirname(__file__)
+
+
+class ResolutionFetcherThread(QThread):
+    """
+    Fetches available video resolutions from a YouTube URL using yt_dlp.
+
+    Emits:
+        resolution_fetched:
+            Signal emitted with the FormatRecords of the video formats,
+            from the lowest to the highest quality.
+        info_fetched:
+            Signal emitted with the sanitized info_dict of the video,
+            before resolution_fetched, so the download can reuse it.
+        retry_signal:
+            Signal emitted with a status message while a throttled or
+            failed extraction waits to be retried.
+        error_signal: Signal emitted with an error message string.
+    """
+    resolution_fetched = pyqtSignal(list)
+    info_fetched = pyqtSignal(object)
+    retry_signal = pyqtSignal(str)
+    error_signal = pyqtSignal(str)
+
+    def __init__(
+            self, url: str, cache: Optional[MetadataCache] = None,
+            retry: Optional[RetryPolicy] = None,
+            prefetcher: Optional[InfoPrefetcher] = None
+    ):
+        """
+        Initializes the thread with the given YouTube URL.
+
+        Args:
+            url (str): The URL of the YouTube video.
+            cache (MetadataCache, optional): A cache consulted before
+                extracting, and updated after a successful extraction.
+            retry (RetryPolicy, optional): Retries extractions that
+                failed for a transient reason before reporting an error.
+            prefetcher (InfoPrefetcher, optional): When given, the info
+                is taken from it, waiting for a prefetch of the URL that
+                is still running, instead of using ``cache`` and
+                ``retry``.
+        """
+
+        super().__init__()
+        # Validate YouTube URL format
+        if not re.match(r'https?://([\w-]+\.)?(youtube\.com|youtu\.be)/', url):
+            raise ValueError("Invalid YouTube URL")
+        self.url = url
+        self.cache = cache
+        self.retry = retry
+        self.prefetcher = prefetcher
+
+    def run(self):
+        """
+        Fetches video resolutions in a separate thread.
+        """
+        import yt_dlp
+
+        try:
+            if self.prefetcher is not None:
+                info_dict = self.prefetcher.get(self.url, self._emit_retry)
+            elif self.retry is None:
+                info_dict = load_video_info(self.url, self.cache)
+            else:
+                info_dict = self.retry.call(
+                    partial(load_video_info, self.url, self.cache),
+                    host_key(self.url), self._emit_retry
+                    )
+            if self.isInterruptionRequested():
+                return
+            resolutions = list_formats(info_dict)
+            if resolutions:
+                self.info_fetched.emit(info_dict)
+                self.resolution_fetched.emit(resolutions)
+            else:
+                self.error_signal.emit(
+                    "No resolutions available for this video."
+                    )
+        except yt_dlp.utils.DownloadError as e:
+            error_message = (
+                f"Failed to fetch video info. "
+                f"Check the URL or your internet connection. Error: {str(e)}"
+                )
+
+            self.error_signal.emit(error_message)
+            LOGGER.error(error_message)
+
+        except Exception as e:
+            error_message = f"Failed to fetch resolutions: {str(e)}"
+            self.error_signal.emit(error_message)
+            LOGGER.error(error_message)
+
+    def _emit_retry(self, reason: str, delay: float) -> None:
+        """Report that the extraction is retried after ``delay`` seconds."""
+        self.retry_signal.emit(
+            f"Fetching resolutions failed ({reason}), "
+            f"retrying in {delay:.0f}s"
+            )
+
+
+class PlaylistExpanderThread(QThread):
+    """
+    Lists the entries of a playlist without resolving each video.
+
+    The entries from iter_playlist_entries are emitted in batches while
+    the remaining pages are still being fetched, so downloads can start
+    before the whole playlist is known.
+
+    Emits:
+        entries_fetched:
+            Signal emitted with a list of dicts holding the ``url``,
+            ``id``, ``ie_key`` and ``title`` of each entry in the batch.
+        finished_signal: Signal emitted with the number of entries found.
+        error_signal: Signal emitted with an error message string.
+    """
+    entries_fetched = pyqtSignal(object)
+    finished_signal = pyqtSignal(int)
+    error_signal = pyqtSignal(str)
+
+    BATCH_SIZE: int = 50
+    BATCH_INTERVAL: float = 0.5  # Seconds before a partial batch is emitted
+
+    def __init__(self, url: str):
+        """
+        Initializes the thread with the given playlist URL.
+
+        Args:
+            url (str): The URL of the playlist.
+        """
+        super().__init__()
+        self.url = url
+
+    def stop(self) -> None:
+        """Stops listing entries after the current one."""
+        self.requestInterruption()
+
+    def run(self):
+        """
+        Lists the playlist entries in a separate thread.
+        """
+        count: int = 0
+        batch: List[Dict[str, Any]] = []
+        last_emit: float = time.monotonic()
+        try:
+            for entry in iter_playlist_entries(self.url):
+                if self.isInterruptionRequested():
+                    break
+                batch.append(entry)
+                count += 1
+                now: float = time.monotonic()
+                if (len(batch) >= self.BATCH_SIZE
+                        or now - last_emit >= self.BATCH_INTERVAL):
+                    self.entries_fetched.emit(batch)
+                    batch = []
+                    last_emit = now
+            if batch:
+                self.entries_fetched.emit(batch)
+            self.finished_signal.emit(count)
+        except Exception as e:
+            error_message = f"Failed to list playlist entries: {str(e)}"
+            if batch:
+                self.entries_fetched.emit(batch)
+            self.error_signal.emit(error_message)
+            LOGGER.error(error_message)
+
+
+class DownloadWorker(QThread):
+    """
+    Runs a DownloadTask outside the GUI thread.
+
+    Emits:
+        progress_signal:
+            Signal emitted at most ProgressAggregator.DEFAULT_INTERVAL
+            apart with the download percentage, the smoothed speed in
+            bytes per second, the ETA in seconds (-1 if unknown) and a
+            status string.
+        finished_signal: Signal emitted with a completion message.
+        postprocessing_signal:
+            Signal emitted instead of finished_signal when the transfer
+            is done and the postprocessors were handed to the
+            PostProcessingPool, with the Future of their result.
+        error_signal: Signal emitted with an error message string.
+        cancelled_signal: Signal emitted when the download was cancelled.
+    """
+    progress_signal = pyqtSignal(int, float, float, str)
+    finished_signal = pyqtSignal(str)
+    postprocessing_signal = pyqtSignal(object)
+    error_signal = pyqtSignal(str)
+    cancelled_signal = pyqtSignal()
+
+    def __init__(
+            self, url: str, ydl_opts: Dict[str, Any],
+            info_dict: Optional[Dict[str, Any]] = None,
+            tuner: Optional[FragmentConcurrencyTuner] = None,
+            archive: Optional[DownloadArchive] = None,
+            bandwidth: Optional[BandwidthScheduler] = None,
+            priority: str = BandwidthScheduler.DEFAULT_PRIORITY,
+            postprocessing: Optional[PostProcessingPool] = None,
+            metrics: Optional[JobMetrics] = None,
+            retry: Optional[RetryPolicy] = None,
+            part_files: Optional[PartFileAllocator] = None,
+            disk_space: Optional[DiskSpaceGovernor] = None
+    ):
+        """
+        Initializes the worker with the URL and yt-dlp options to use.
+
+        The arguments are passed on to DownloadTask.
+        """
+        super().__init__()
+        self.task = DownloadTask(
+            url, ydl_opts, info_dict, tuner, archive,
+            on_progress=self._emit_progress, bandwidth=bandwidth,
+            priority=priority, postprocessing=postprocessing,
+            metrics=metrics, retry=retry, part_files=part_files,
+            disk_space=disk_space
+            )
+
+    def cancel(self) -> None:
+        """Requests the download to stop at the next progress callback."""
+        self.task.cancel()
+
+    def pause(self) -> None:
+        """Blocks the download at the next progress callback."""
+        self.task.pause()
+
+    def resume(self) -> None:
+        """Resumes a paused download."""
+        self.task.resume()
+
+    def is_paused(self) -> bool:
+        """Returns True if the download is paused."""
+        return self.task.is_paused()
+
+    def run(self):
+        """
+        Runs the download in a separate thread.
+        """
+        import yt_dlp
+
+        try:
+            message: str = self.task.run()
+        except yt_dlp.utils.DownloadCancelled:
+            self.cancelled_signal.emit()
+        except Exception as e:
+            error_message = f"Failed to download: {str(e)}"
+            self.error_signal.emit(error_message)
+            self.task.ydl_opts['logger'].error(error_message)
+        else:
+            if self.task.postprocess_future is not None:
+                self.postprocessing_signal.emit(self.task.postprocess_future)
+            else:
+                self.finished_signal.emit(message)
+
+    def _emit_progress(self, snapshot: ProgressSnapshot) -> None:
+        """Forward download progress to the GUI thread."""
+        self.progress_signal.emit(
+            snapshot.percent, snapshot.speed, snapshot.eta, snapshot.status
+            )
+
+
+class DownloadJob:
+    """
+    A queued download and the last state reported by its worker.
+
+    Jobs are kept for the whole session, so they are slotted records,
+    and compact() drops what is only needed while the job is active.
+
+    Attributes:
+        job_id (int): The unique id of the job.
+        url (str): The URL to download.
+        ydl_opts (Dict[str, Any], optional): The yt-dlp options for the
+            download, None once the job was compacted.
+        host (str): The host used for per-host limits.
+        state (str): One of queued, running, paused, postprocessing,
+            finished, skipped, failed or cancelled.
+        status (str): A human readable status line.
+        percent (int): The download progress in percent.
+        info_dict (Dict[str, Any], optional): A pre-extracted info_dict
+            to download from instead of extracting the URL again. It is
+            dropped once the job has started.
+        title (str, optional): The video title, if already known.
+        speed (float): The smoothed download speed in bytes per second.
+        eta (float): Seconds left for the current stream, or -1.
+        download_type (str): "Video" or "Audio".
+        journal_id (int, optional): The id of the job in the JobJournal.
+        priority (str): The priority class in the BandwidthScheduler.
+        metrics (JobMetrics, optional): The timings and counters of the
+            job, registered in METRICS.
+        format (str): The yt-dlp format selector of the download.
+        size (int, optional): The bytes downloaded, once compacted.
+    """
+    __slots__ = (
+        'job_id', 'url', 'ydl_opts', 'host', 'state', 'status', 'percent',
+        'info_dict', 'title', 'speed', 'eta', 'download_type', 'journal_id',
+        'priority', 'metrics', 'format', 'size'
+    )
+
+    def __init__(
+            self, job_id: int, url: str, ydl_opts: Dict[str, Any], host: str,
+            state: str = "queued", status: str = "Queued", percent: int = 0,
+            info_dict: Optional[Dict[str, Any]] = None,
+            title: Optional[str] = None, speed: float = 0.0,
+            eta: float = -1.0, download_type: str = "Video",
+            journal_id: Optional[int] = None,
+            priority: str = BandwidthScheduler.DEFAULT_PRIORITY,
+            metrics: Optional[JobMetrics] = None
+    ):
+        self.job_id = job_id
+        self.url = url
+        self.ydl_opts: Optional[Dict[str, Any]] = ydl_opts
+        self.host = host
+        self.state = state
+        self.status = status
+        self.percent = percent
+        self.info_dict = info_dict
+        self.title = title
+        self.speed = speed
+        self.eta = eta
+        self.download_type = download_type
+        self.journal_id = journal_id
+        self.priority = priority
+        self.metrics = metrics
+        self.format: str = ydl_opts['format']
+        self.size: Optional[int] = None
+
+    def is_active(self) -> bool:
+        """Returns True if the job is queued, downloading or still
+        post-processing."""
+        return self.state in ("queued", "running", "paused", "postprocessing")
+
+    def compact(self) -> None:
+        """
+        Drops the options, info_dict and metrics of a job that ended,
+        keeping its id, title, format and size for the job list.
+        """
+        if self.metrics is not None:
+            self.size = self.metrics.downloaded_bytes
+        self.ydl_opts = None
+        self.info_dict = None
+        self.metrics = None
+
+
+class DownloadManager(QObject):
+    """
+    Runs queued downloads on a bounded pool of DownloadWorker threads.
+
+    At most ``max_concurrent`` jobs run at the same time and at most
+    ``max_per_host`` of them may target the same host. Jobs that cannot
+    start yet keep their place in the queue, except that interactive
+    jobs are queued ahead of background ones. Fragment concurrency is
+    tuned per stream by ``fragment_tuner`` across all running jobs, and
+    ``bandwidth`` splits the global rate limit between them. Once a
+    transfer is done, its postprocessors run on ``postprocessing`` and
+    the slot goes to the next job. Jobs for a host that keeps failing
+    wait in the queue until ``retry`` lets them try it again, and
+    started jobs wait for ``disk_space`` before they write anything.
+    When a ``journal`` is given, every job is recorded in it so
+    unfinished downloads can be resumed after a restart. With
+    ``low_memory`` set, jobs that ended are compacted so tens of
+    thousands of them fit in a modest amount of memory.
+
+    Emits:
+        job_added: Signal emitted with the id of a newly queued job.
+        job_changed: Signal emitted with the id of a job whose state changed.
+    """
+    job_added = pyqtSignal(int)
+    job_changed = pyqtSignal(int)
+    # Carries finished post-processing from the pool to the GUI thread
+    _postprocessing_done = pyqtSignal(int, object)
+
+    MAX_CONCURRENT_DOWNLOADS: int = 4
+    MAX_DOWNLOADS_PER_HOST: int = 3
+    # Milliseconds shutdown() waits for the running downloads to stop
+    SHUTDOWN_TIMEOUT_MS: int = 10000
+
+    def __init__(
+            self, parent: Optional[QObject] = None,
+            journal: Optional[JobJournal] = None
+    ):
+        """
+        Initializes an empty download queue.
+
+        Args:
+            parent (QObject, optional): The Qt parent of the manager.
+            journal (JobJournal, optional): The journal jobs are recorded in.
+        """
+        super().__init__(parent)
+        self.journal = journal
+        # Downloaded videos are recorded here when set
+        self.archive: Optional[DownloadArchive] = None
+        self.max_concurrent: int = self.MAX_CONCURRENT_DOWNLOADS
+        self.max_per_host: int = self.MAX_DOWNLOADS_PER_HOST
+        self.jobs: Dict[int, DownloadJob] = {}
+        # The number of jobs in each state, kept up to date as they change
+        self.state_counts: Counter = Counter()
+        # Queued job ids by priority and host, in the order they were
+        # queued. Jobs that left the queue are dropped when reached.
+        self._pending: Dict[str, Dict[str, Deque[int]]] = {}
+        self._workers: Dict[int, DownloadWorker] = {}
+        self._next_job_id: int = 1
+        # Set to None to use the fixed concurrency from the job options
+        self.fragment_tuner: Optional[FragmentConcurrencyTuner] = (
+            FragmentConcurrencyTuner()
+        )
+        self.bandwidth: BandwidthScheduler = BandwidthScheduler()
+        # Set to None to post-process on the download threads
+        self.postprocessing: Optional[PostProcessingPool] = (
+            POSTPROCESSING_POOL
+        )
+        self._postprocessing: Dict[int, Future] = {}
+        self._postprocessing_done.connect(self._on_postprocessed)
+        # Shared by the jobs, so a failing host pauses all of them
+        self.retry: RetryPolicy = RetryPolicy()
+        # Runs _schedule again when a paused host may be tried again
+        self._host_timer: QTimer = QTimer(self)
+        self._host_timer.setSingleShot(True)
+        self._host_timer.timeout.connect(self._schedule)
+        # Set to None to let the file system allocate .part files lazily
+        self.part_files: Optional[PartFileAllocator] = PartFileAllocator()
+        # Set to None to start downloads without checking free space
+        self.disk_space: Optional[DiskSpaceGovernor] = DiskSpaceGovernor()
+        # Compact the jobs that ended, see DownloadJob.compact()
+        self.low_memory: bool = False
+        # Set by shutdown(), after which nothing is started or recorded
+        self._closed: bool = False
+
+    def enqueue(
+            self, url: str, ydl_opts: Dict[str, Any],
+            info_dict: Optional[Dict[str, Any]] = None,
+            title: Optional[str] = None,
+            download_type: str = "Video",
+            journal_id: Optional[int] = None,
+            priority: str = BandwidthScheduler.DEFAULT_PRIORITY
+    ) -> DownloadJob:
+        """
+        Adds a download to the queue and starts it if a slot is free.
+
+        Args:
+            url (str): The URL to download.
+            ydl_opts (Dict[str, Any]): The yt-dlp options for the download.
+            info_dict (Dict[str, Any], optional): A pre-extracted info_dict
+                for the URL.
+            title (str, optional): The video title, if already known.
+            download_type (str, optional): "Video" or "Audio".
+            journal_id (int, optional): The journal id of a job resumed
+                from the journal. New jobs are added to the journal.
+            priority (str, optional): "interactive" or "background".
+
+        Returns:
+            DownloadJob: The queued job.
+        """
+        job = DownloadJob(
+            self._next_job_id, url, ydl_opts, sys.intern(host_key(url)),
+            info_dict=info_dict, title=title, download_type=download_type,
+            journal_id=journal_id, priority=priority,
+            metrics=METRICS.new_job(url)
+            )
+        self._next_job_id += 1
+        if self.journal is not None:
+            if journal_id is None:
+                job.journal_id = self.journal.add(
+                    url, download_type, ydl_opts['format'],
+                    output_template(ydl_opts), title
+                    )
+            else:
+                self.journal.set_state(journal_id, "queued")
+        self.jobs[job.job_id] = job
+        self.state_counts[job.state] += 1
+        self._queue(job)
+        self.job_added.emit(job.job_id)
+        self._schedule()
+        return job
+
+    def _queue(self, job: DownloadJob) -> None:
+        """Queues a job after the pending jobs of the same priority."""
+        self._pending.setdefault(job.priority, {}).setdefault(
+            job.host, deque()
+            ).append(job.job_id)
+
+    def set_limits(self, max_concurrent: int, max_per_host: int) -> None:
+        """
+        Changes the global and per-host concurrency limits.
+
+        Running downloads are never interrupted; lowering a limit only
+        delays the start of queued jobs.
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_host = max(1, max_per_host)
+        self._schedule()
+
+    def pause(self, job_id: int) -> None:
+        """Pauses a running job."""
+        worker: Optional[DownloadWorker] = self._workers.get(job_id)
+        if worker is not None and not worker.is_paused():
+            worker.pause()
+            self._set_state(job_id, "paused", "Pausing...")
+
+    def resume(self, job_id: int) -> None:
+        """Resumes a paused job."""
+        worker: Optional[DownloadWorker] = self._workers.get(job_id)
+        if worker is not None and worker.is_paused():
+            worker.resume()
+            self._set_state(job_id, "running", "Resuming...")
+
+    def cancel(self, job_id: int) -> None:
+        """
+        Cancels a queued or running job.
+
+        Post-processing can only be cancelled before it has started.
+        """
+        if self.jobs[job_id].state == "queued":
+            # _schedule drops the job from _pending when it reaches it
+            METRICS.finish(self.jobs[job_id].metrics, "cancelled")
+            self._set_state(job_id, "cancelled", "Cancelled")
+            return
+        future: Optional[Future] = self._postprocessing.get(job_id)
+        if future is not None:
+            future.cancel()
+            return
+        worker: Optional[DownloadWorker] = self._workers.get(job_id)
+        if worker is not None:
+            worker.cancel()
+            self._set_state(job_id, "running", "Cancelling...")
+
+    def shutdown(self) -> None:
+        """
+        Stops the running downloads when the application exits.
+
+        Their journal entries stay as they are, so they are offered for
+        resuming on the next start, and nothing queued is started.
+        """
+        self._closed = True
+        self._host_timer.stop()
+        workers: List[DownloadWorker] = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        deadline: float = time.monotonic() + self.SHUTDOWN_TIMEOUT_MS / 1000
+        for worker in workers:
+            worker.wait(max(0, int((deadline - time.monotonic()) * 1000)))
+
+    def active_count(self) -> int:
+        """Returns the number of jobs that are running or paused."""
+        return len(self._workers)
+
+    def running_jobs(self) -> List[DownloadJob]:
+        """Returns the jobs that are downloading or paused."""
+        return [
+            job for job in map(self.jobs.__getitem__, self._workers)
+            if job.state in ("running", "paused")
+        ]
+
+    def _schedule(self) -> None:
+        """
+        Starts queued jobs while the global and per-host limits allow.
+
+        Higher priorities go first. Within a priority, the oldest job of
+        a host that may start is started next, so jobs held back by
+        their host limit keep their place in the queue.
+        """
+        if self._closed:
+            return
+        running_per_host: Counter = Counter(
+            self.jobs[job_id].host for job_id in self._workers
+            )
+        for priority in sorted(
+                self._pending, reverse=True,
+                key=lambda name: BandwidthScheduler.PRIORITY_WEIGHTS.get(
+                    name, 0)):
+            hosts: Dict[str, Deque[int]] = self._pending[priority]
+            while hosts and len(self._workers) < self.max_concurrent:
+                job: Optional[DownloadJob] = self._next_queued(
+                    hosts, running_per_host
+                    )
+                if job is None:
+                    break
+                running_per_host[job.host] += 1
+                self._start(job)
+            if not hosts:
+                del self._pending[priority]
+
+    def _next_queued(
+            self, hosts: Dict[str, Deque[int]], running_per_host: Counter
+    ) -> Optional[DownloadJob]:
+        """
+        Takes the oldest job of ``hosts`` whose host may start a job.
+
+        Returns None if no host may, or no job is left.
+        """
+        best: Optional[Deque[int]] = None
+        for host in list(hosts):
+            queue: Deque[int] = hosts[host]
+            while queue and self.jobs[queue[0]].state != "queued":
+                queue.popleft()  # Cancelled while it waited
+            if not queue:
+                del hosts[host]
+                continue
+            if running_per_host[host] >= self.max_per_host:
+                continue
+            paused_for: float = self.retry.breaker.retry_after(host)
+            if paused_for > 0:
+                # The host keeps failing; try it again once it may be
+                self._wake_up_in(paused_for)
+                continue
+            if best is None or queue[0] < best[0]:
+                best = queue
+        if best is None:
+            return None
+        return self.jobs[best.popleft()]
+
+    def _wake_up_in(self, seconds: float) -> None:
+        """Schedules queued jobs again in ``seconds``, if not sooner."""
+        msec: int = int(seconds * 1000) + 1
+        if (not self._host_timer.isActive()
+                or self._host_timer.remainingTime() > msec):
+            self._host_timer.start(msec)
+
+    def _start(self, job: DownloadJob) -> None:
+        """Starts a DownloadWorker thread for the job."""
+        worker = DownloadWorker(
+            job.url, job.ydl_opts, job.info_dict, self.fragment_tuner,
+            self.archive, self.bandwidth, job.priority, self.postprocessing,
+            job.metrics, self.retry, self.part_files, self.disk_space
+            )
+        worker.progress_signal.connect(partial(self._on_progress, job.job_id))
+        worker.finished_signal.connect(partial(self._on_finished, job.job_id))
+        worker.postprocessing_signal.connect(
+            partial(self._on_postprocessing, job.job_id)
+            )
+        worker.error_signal.connect(partial(self._on_error, job.job_id))
+        worker.cancelled_signal.connect(
+            partial(self._on_cancelled, job.job_id)
+            )
+        # QThread.finished fires once run() has returned, so the slot is
+        # only reused after the thread has really stopped.
+        worker.finished.connect(partial(self._on_worker_stopped, job.job_id))
+        self._workers[job.job_id] = worker
+        # The worker has what it needs, the job keeps the decision only
+        job.info_dict = None
+        self._update_tuner()
+        self._set_state(job.job_id, "running", "Starting...")
+        worker.start()
+
+    def _update_tuner(self) -> None:
+        """Tell the fragment tuner how many jobs share the connections."""
+        if self.fragment_tuner is not None:
+            self.fragment_tuner.set_active_jobs(len(self._workers))
+
+    def _set_state(
+            self, job_id: int, state: str, status: str,
+            percent: Optional[int] = None
+    ) -> None:
+        """Updates a job and notifies listeners."""
+        if self._closed:
+            return  # Stopped by shutdown(), resumed on the next start
+        job: DownloadJob = self.jobs[job_id]
+        state_changed: bool = state != job.state
+        if state_changed:
+            self.state_counts[job.state] -= 1
+            self.state_counts[state] += 1
+        job.state = state
+        job.status = status
+        if state != "running":
+            job.speed = 0.0
+        if percent is not None and percent >= 0:
+            job.percent = percent
+        if self.journal is not None and job.journal_id is not None:
+            if state_changed:
+                self.journal.set_state(job.journal_id, state, job.percent)
+            else:
+                self.journal.record_progress(job.journal_id, job.percent)
+        if self.low_memory and not job.is_active():
+            job.compact()
+        self.job_changed.emit(job_id)
+
+    def _on_progress(
+            self, job_id: int, percent: int, speed: float, eta: float,
+            status: str
+    ) -> None:
+        job: DownloadJob = self.jobs[job_id]
+        job.speed = speed
+        job.eta = eta
+        state: str = "paused" if status == "Paused" else "running"
+        self._set_state(job_id, state, status, percent)
+
+    def _on_finished(self, job_id: int, message: str) -> None:
+        state: str = (
+            "skipped" if message in DownloadTask.SKIPPED_MESSAGES
+            else "finished"
+        )
+        self._set_state(job_id, state, message, 100)
+
+    def _on_postprocessing(self, job_id: int, future: Future) -> None:
+        self._postprocessing[job_id] = future
+        self._set_state(job_id, "postprocessing", "Post-processing...", 100)
+        future.add_done_callback(
+            partial(self._postprocessing_done.emit, job_id)
+            )
+
+    def _on_postprocessed(self, job_id: int, future: Future) -> None:
+        self._postprocessing.pop(job_id, None)
+        if future.cancelled():
+            self._set_state(job_id, "cancelled", "Cancelled")
+        elif future.exception() is not None:
+            self._set_state(job_id, "failed", str(future.exception()))
+        else:
+            self._set_state(
+                job_id, "finished", "Download Completed - 100%", 100
+                )
+
+    def _on_error(self, job_id: int, error_message: str) -> None:
+        self._set_state(job_id, "failed", error_message)
+
+    def _on_cancelled(self, job_id: int) -> None:
+        self._set_state(job_id, "cancelled", "Cancelled")
+
+    def _on_worker_stopped(self, job_id: int) -> None:
+        self._workers.pop(job_id, None)
+        self._update_tuner()
+        self._schedule()
+
+
+class JobTableModel(QAbstractTableModel):
+    """
+    Table model showing one row per job of a DownloadManager.
+
+    The progress column exposes the job percentage under Qt.UserRole so
+    ProgressBarDelegate can draw it as a progress bar.
+    """
+    COLUMNS: Tuple[str, ...] = ("Video", "Status", "Progress")
+    PROGRESS_COLUMN: int = 2
+
+    def __init__(self, manager: DownloadManager):
+        """
+        Initializes the model for the given manager.
+
+        Args:
+            manager (DownloadManager): The manager whose jobs are shown.
+        """
+        super().__init__(manager)
+        self.manager = manager
+        self._job_ids: List[int] = []
+        self._rows: Dict[int, int] = {}
+        manager.job_added.connect(self._on_job_added)
+        manager.job_changed.connect(self._on_job_changed)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._job_ids)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        job: DownloadJob = self.manager.jobs[self._job_ids[index.row()]]
+        column: int = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return job.title or job.url
+            if column == 1:
+                return job.status
+            return f"{job.percent}%"
+        if role == Qt.ToolTipRole and column == 0:
+            if job.size is None:
+                return f"{job.url}\n{job.format}"
+            return f"{job.url}\n{job.format}, {format_bytes(job.size)}"
+        if role == Qt.ToolTipRole and column == 1:
+            return job.status
+        if role == Qt.UserRole and column == self.PROGRESS_COLUMN:
+            return job.percent
+        return None
+
+    def job_id_at(self, row: int) -> int:
+        """Returns the id of the job shown in the given row."""
+        return self._job_ids[row]
+
+    def _on_job_added(self, job_id: int) -> None:
+        row: int = len(self._job_ids)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._job_ids.append(job_id)
+        self._rows[job_id] = row
+        self.endInsertRows()
+
+    def _on_job_changed(self, job_id: int) -> None:
+        row: Optional[int] = self._rows.get(job_id)
+        if row is not None:
+            self.dataChanged.emit(
+                self.index(row, 0), self.index(row, len(self.COLUMNS) - 1)
+                )
+
+
+class FormatListModel(QAbstractListModel):
+    """
+    List model of the FormatRecords offered for a video.
+
+    The resolution combo box shows the records through this model, with
+    the format id under Qt.UserRole, instead of holding an item of its
+    own for each of them.
+    """
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._records: List[FormatRecord] = []
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._records)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record: FormatRecord = self._records[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{record.label} - {record.format_id}"
+        if role == Qt.UserRole:
+            return record.format_id
+        return None
+
+    def set_records(self, records: List[FormatRecord]) -> None:
+        """Replaces the records shown, an empty list clears the model."""
+        self.beginResetModel()
+        self._records = list(records)
+        self.endResetModel()
+
+
+class ProgressBarDelegate(QStyledItemDelegate):
+    """
+    Draws the percentage stored under Qt.UserRole as a progress bar.
+    """
+    def paint(self, painter, option, index) -> None:
+        percent = index.data(Qt.UserRole)
+        if percent is None:
+            super().paint(painter, option, index)
+            return
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 2, -2, -2)
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = percent
+        bar.text = f"{percent}%"
+        bar.textVisible = True
+        bar.textAlignment = Qt.AlignCenter
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+
+
+class YouTubeDownloader(QMainWindow):
+    """
+    A Qt-based GUI application for downloading YouTube videos or audio.
+
+    This class handles the video downloader UI, manages input from the user,
+    and coordinates the download process using yt-dlp.
+    """
+
+    # Global variable for downloads folder
+    DOWNLOADS_FOLDER: str = DOWNLOADS_FOLDER
+    # How often the statistics panel is refreshed
+    STATS_INTERVAL_MS: int = 1000
+    # Quiet time after typing before the entered videos are prefetched
+    PREFETCH_DELAY_MS: int = 400
+    # The most videos of a pasted list prefetched at once
+    PREFETCH_LIMIT: int = 8
+
+    def __init__(self, low_memory: bool = False):
+        """
+        Initializes the main window of the YouTubeDownloader application.
+
+        Sets up the layout, user interface elements, and connects signals.
+
+        Args:
+            low_memory (bool, optional): Keep as little as possible of
+                the jobs that ended and the videos extracted, for very
+                large playlists and long sessions.
+        """
+        super().__init__()
+        self.low_memory: bool = low_memory
+        self.setWindowTitle("Sonic Video Downloader")
+        self.setGeometry(200, 200, 700, 800)
+        # Set the window icon. The icon is decoded once and also shown in
+        # the header.
+        app_icon_pixmap: QPixmap = QPixmap(
+            os.path.join(script_dir, 'Assets', 'app_icon.ico')
+            )
+        self.setWindowIcon(QIcon(app_icon_pixmap.scaled(
+            70, 70, Qt.KeepAspectRatio, Qt.SmoothTransformation
+            )))
+
+        # Set Downloads folder
+        self.downloads_folder: str = os.path.expanduser("~/Downloads")
+        # URL the resolutions in resolution_combo were fetched for, and the
+        # info_dict extracted along with them
+        self.fetched_url: Optional[str] = None
+        self.fetched_info: Optional[Dict[str, Any]] = None
+        # Bumped when the fetch for fetched_url no longer applies, so its
+        # late results are ignored
+        self._fetch_generation: int = 0
+        # Extracted video info survives restarts until its stream URLs expire
+        self.metadata_cache: MetadataCache = MetadataCache()
+        # Playlists still being listed, fed into the queue as they stream in
+        self.playlist_threads: List[PlaylistExpanderThread] = []
+        # The last resolution fetch, which may still be running
+        self.fetcher_thread: Optional[ResolutionFetcherThread] = None
+        # Videos not queued because they are in the download archive
+        self.skipped_downloads: int = 0
+
+        # Central Widget
+        self.central_widget: QWidget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.layout: QVBoxLayout = QVBoxLayout()
+        self.central_widget.setLayout(self.layout)
+
+        # App Icon
+        self.icon_label: QLabel = QLabel()
+        self.icon_label.setPixmap(app_icon_pixmap)
+        self.icon_label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(self.icon_label)
+
+        # Header
+        self.header_label: QLabel = QLabel(
+            "<h1 style='color: #0078d7;'>Sonic Video Downloader</h1>"
+            )
+        self.header_label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(self.header_label)
+
+        # Step 1: URL Input
+        self.url_group: QGroupBox = QGroupBox("Step 1: Enter YouTube URL")
+        self.url_layout: QVBoxLayout = QVBoxLayout()
+        self.url_group.setLayout(self.url_layout)
+        self.url_label: QLabel = QLabel("YouTube URL:")
+        self.url_input: QLineEdit = QLineEdit()
+        self.url_input.setPlaceholderText(
+            "Enter one or more YouTube video or playlist URLs here..."
+            )
+        self.url_input.textChanged.connect(self.on_url_text_changed)
+        self.url_layout.addWidget(self.url_label)
+        self.url_layout.addWidget(self.url_input)
+        self.layout.addWidget(self.url_group)
+
+        # Step 2: Select Type and Resolution
+        self.type_group: QGroupBox = QGroupBox(
+            "Step 2: Select Download Type and Resolution"
+            )
+        self.type_layout: QVBoxLayout = QVBoxLayout()
+        self.type_group.setLayout(self.type_layout)
+        self.type_label: QLabel = QLabel("Select download type:")
+        self.type_combo: QComboBox = QComboBox()
+        self.type_combo.addItem("Select Type", None)
+        self.type_combo.addItems(["Video", "Audio"])
+        self.type_combo.setCurrentIndex(0)
+        self.type_combo.setEnabled(True)
+        self.type_combo.currentIndexChanged.connect(self.update_ui)
+        self.type_layout.addWidget(self.type_label)
+        self.type_layout.addWidget(self.type_combo)
+
+        # Loading animation setup. The GIF is only loaded the first time
+        # resolutions are fetched.
+        self.loading_container: QHBoxLayout = QHBoxLayout()
+        self.loading_label: QLabel = QLabel()
+        self.loading_movie: Optional[QMovie] = None
+        self.loading_label.setFixedSize(50, 50)
+        self.loading_label.setScaledContents(True)
+        self.loading_label.setVisible(False)
+        self.loading_container.addWidget(self.loading_label)
+        self.loading_text: QLabel = QLabel("Fetching resolutions please wait")
+        self.loading_text.setVisible(False)
+        self.loading_container.addWidget(self.loading_text)
+        self.type_layout.addLayout(self.loading_container)
+
+        self.resolution_label: QLabel = QLabel("Select Video resolution ")
+        self.resolution_combo: QComboBox = QComboBox()
+        self.format_model: FormatListModel = FormatListModel(self)
+        self.resolution_combo.setModel(self.format_model)
+        self.resolution_combo.setEnabled(False)
+        self.type_layout.addWidget(self.resolution_label)
+        self.type_layout.addWidget(self.resolution_combo)
+        self.layout.addWidget(self.type_group)
+
+        # Step 3: Download
+        self.download_group: QGroupBox = QGroupBox("Step 3: Download")
+        self.download_layout: QVBoxLayout = QVBoxLayout()
+        self.download_group.setLayout(self.download_layout)
+
+        # Load the download icon
+        icon_path = os.path.join(script_dir, 'Assets', 'download.png')
+        pixmap = QPixmap(icon_path)
+        icon = QIcon(pixmap)  # Convert QPixmap to QIcon
+
+        # Set up the download button with icon
+        self.download_button: QPushButton = QPushButton("Download")
+        self.download_button.setIcon(icon)
+        self.download_button.setIconSize(pixmap.size())
+        self.download_button.setLayoutDirection(Qt.LeftToRight)
+        self.download_button.setStyleSheet("""
+            QPushButton {
+                text-align: left;
+                padding-left: 5px; /* Adjust padding as needed */
+            }
+        """)
+        self.download_button.clicked.connect(self.download_video)
+
+        # Concurrency limits for the download queue. Jobs are journaled so
+        # they can be resumed after a crash or restart.
+        self.journal: JobJournal = JobJournal()
+        self.download_manager: DownloadManager = DownloadManager(
+            self, self.journal
+            )
+        # Every downloaded video is recorded in the archive
+        self.download_archive: DownloadArchive = DownloadArchive()
+        self.download_manager.archive = self.download_archive
+        self.download_manager.low_memory = low_memory
+        # Videos are extracted while their URLs are typed or pasted, once
+        # the input stopped changing for PREFETCH_DELAY_MS
+        self.prefetcher: InfoPrefetcher = InfoPrefetcher(
+            self.metadata_cache, self.download_manager.retry,
+            max_entries=(
+                self.PREFETCH_LIMIT if low_memory
+                else InfoPrefetcher.DEFAULT_MAX_ENTRIES
+            )
+            )
+        self.prefetch_timer: QTimer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(self.PREFETCH_DELAY_MS)
+        self.prefetch_timer.timeout.connect(self.prefetch_url_info)
+        self.limits_layout: QHBoxLayout = QHBoxLayout()
+        self.concurrent_label: QLabel = QLabel("Parallel downloads:")
+        self.concurrent_spin: QSpinBox = QSpinBox()
+        self.concurrent_spin.setRange(1, 16)
+        self.concurrent_spin.setValue(self.download_manager.max_concurrent)
+        self.per_host_label: QLabel = QLabel("Per site:")
+        self.per_host_spin: QSpinBox = QSpinBox()
+        self.per_host_spin.setRange(1, 16)
+        self.per_host_spin.setValue(self.download_manager.max_per_host)
+        self.concurrent_spin.valueChanged.connect(self.update_queue_limits)
+        self.per_host_spin.valueChanged.connect(self.update_queue_limits)
+        self.limits_layout.addWidget(self.concurrent_label)
+        self.limits_layout.addWidget(self.concurrent_spin)
+        self.limits_layout.addWidget(self.per_host_label)
+        self.limits_layout.addWidget(self.per_host_spin)
+        self.skip_downloaded_checkbox: QCheckBox = QCheckBox(
+            "Skip already downloaded"
+            )
+        self.skip_downloaded_checkbox.setChecked(True)
+        self.limits_layout.addWidget(self.skip_downloaded_checkbox)
+
+        # Bandwidth shared by all downloads, split by priority
+        self.bandwidth_layout: QHBoxLayout = QHBoxLayout()
+        self.rate_limit_label: QLabel = QLabel("Speed limit:")
+        self.rate_limit_spin: QSpinBox = QSpinBox()
+        self.rate_limit_spin.setRange(0, 1000000)
+        self.rate_limit_spin.setSingleStep(100)
+        self.rate_limit_spin.setSuffix(" KB/s")
+        self.rate_limit_spin.setSpecialValueText("Unlimited")
+        self.rate_limit_spin.valueChanged.connect(self.update_rate_limit)
+        self.priority_label: QLabel = QLabel("Priority:")
+        self.priority_combo: QComboBox = QComboBox()
+        self.priority_combo.addItem("Interactive", "interactive")
+        self.priority_combo.addItem("Background", "background")
+        self.bandwidth_layout.addWidget(self.rate_limit_label)
+        self.bandwidth_layout.addWidget(self.rate_limit_spin)
+        self.bandwidth_layout.addWidget(self.priority_label)
+        self.bandwidth_layout.addWidget(self.priority_combo)
+
+        # One row per queued download
+        self.job_model: JobTableModel = JobTableModel(self.download_manager)
+        self.job_table: QTableView = QTableView()
+        self.job_table.setModel(self.job_model)
+        self.job_table.setItemDelegateForColumn(
+            JobTableModel.PROGRESS_COLUMN, ProgressBarDelegate(self.job_table)
+            )
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.verticalHeader().setVisible(False)
+        self.job_table.horizontalHeader().setSectionResizeMode(
+            0, QHeaderView.Stretch
+            )
+        self.job_table.horizontalHeader().setSectionResizeMode(
+            1, QHeaderView.Stretch
+            )
+
+        # Pause, resume and cancel act on the selected jobs, or on all jobs
+        # when nothing is selected
+        self.controls_layout: QHBoxLayout = QHBoxLayout()
+        self.pause_button: QPushButton = QPushButton("Pause")
+        self.pause_button.clicked.connect(self.pause_downloads)
+        self.resume_button: QPushButton = QPushButton("Resume")
+        self.resume_button.clicked.connect(self.resume_downloads)
+        self.cancel_button: QPushButton = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_downloads)
+        self.controls_layout.addWidget(self.pause_button)
+        self.controls_layout.addWidget(self.resume_button)
+        self.controls_layout.addWidget(self.cancel_button)
+
+        self.progress_bar: QProgressBar = QProgressBar()
+        self.progress_bar.setAlignment(Qt.AlignCenter)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("Ready")
+        self.download_manager.job_changed.connect(self._update_progress_bar)
+        self.download_layout.addWidget(self.download_button)
+        self.download_layout.addLayout(self.limits_layout)
+        self.download_layout.addLayout(self.bandwidth_layout)
+        self.download_layout.addWidget(self.job_table)
+        self.download_layout.addLayout(self.controls_layout)
+        self.download_layout.addWidget(self.progress_bar)
+        self.layout.addWidget(self.download_group)
+
+        # Where the time goes, over all jobs that ended
+        self.stats_group: QGroupBox = QGroupBox("Statistics")
+        self.stats_layout: QVBoxLayout = QVBoxLayout()
+        self.stats_group.setLayout(self.stats_layout)
+        self.stats_label: QLabel = QLabel()
+        self.stats_label.setWordWrap(True)
+        self.stats_layout.addWidget(self.stats_label)
+        self.layout.addWidget(self.stats_group)
+        self.stats_timer: QTimer = QTimer(self)
+        self.stats_timer.timeout.connect(self._update_stats)
+        self.stats_timer.start(self.STATS_INTERVAL_MS)
+        self._update_stats()
+
+        # Styling
+        self.apply_styles()
+
+        # Offer to resume the last session once the window is shown. The
+        # jobs are read now, before anything new is queued.
+        unfinished: List[Dict[str, Any]] = self.journal.unfinished()
+        QTimer.singleShot(
+            0, partial(self.resume_unfinished_downloads, unfinished)
+            )
+
+    def apply_styles(self) -> None:
+        """
+        Applies custom styles to the UI elements of the application.
+
+        This method uses Qt style sheets to define visual properties like
+        background color, font size, colors, borders, and hover effects for
+        various widgets including QMainWindow, QLabel, QGroupBox, QLineEdit,
+        QPushButton, and QProgressBar.
+
+        :return: None
+        """
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #f4f4f4;
+            }
+            QLabel {
+                font-size: 14px;
+                color: #333333;
+            }
+            QGroupBox {
+                font-size: 14px;
+                font-weight: bold;
+                color: #0078d7;
+                border: 1px solid #0078d7;
+                border-radius: 5px;
+                margin-top: 10px;
+            }
+            QGroupBox::title {
+                subcontrol-origin: margin;
+                subcontrol-position: top center;
+                padding: 0 3px;
+            }
+            QLineEdit {
+                padding: 5px;
+                font-size: 14px;
+            }
+            QPushButton {
+                background-color: #0078d7;
+                color: white;
+                border-radius: 5px;
+                padding: 8px;
+            }
+            QPushButton:hover {
+                background-color: #005a9e;
+            }
+            QProgressBar {
+                text-align: center;
+                background-color: #e0e0e0;
+                color: #000000;
+            }
+        """)
+
+    def on_url_text_changed(self, text: str) -> None:
+        """
+        Restart the prefetch countdown when the URL input changes.
+
+        Resolutions fetched for a URL that is no longer the first one
+        entered are cleared, and results still coming in for it are
+        ignored.
+        """
+        urls: List[str] = split_urls(text)
+        if self.fetched_url is not None and urls[:1] != [self.fetched_url]:
+            self._fetch_generation += 1
+            self.fetched_url = None
+            self.fetched_info = None
+            self._stop_loading_movie()
+            self.loading_label.setVisible(False)
+            self.loading_text.setVisible(False)
+            self.format_model.set_records([])
+            self.resolution_combo.setEnabled(False)
+        self.check_url_input()
+        self.prefetch_timer.start()
+
+    def prefetch_url_info(self) -> None:
+        """
+        Start extracting the videos entered in the background, so their
+        resolutions are ready by the time they are asked for.
+
+        Prefetches for URLs that were removed are dropped unless they
+        already started. If "Video" is selected, the resolutions of the
+        first URL are fetched right away.
+        """
+        urls: List[str] = split_urls(self.url_input.text())
+        videos: List[str] = [
+            url for url in urls if youtube_video_id(url) is not None
+        ][:self.PREFETCH_LIMIT]
+        self.prefetcher.retain(videos)
+        for url in videos:
+            self.prefetcher.prefetch(url)
+        if (videos and videos[0] == urls[0]
+                and videos[0] != self.fetched_url
+                and self.type_combo.currentText() == "Video"):
+            self.update_ui()
+
+    def check_url_input(self) -> None:
+        url: str = self.url_input.text().strip()
+        if url:
+            self.type_combo.setEnabled(True)
+        else:
+            self.type_combo.setEnabled(False)
+            self.type_combo.setCurrentIndex(0)  # Reset to placeholder
+            self.format_model.set_records([])
+            self.resolution_combo.setEnabled(False)
+
+    def update_ui(self) -> None:
+        """
+        Adjusts UI elements based on the selected download type.
+        """
+        selected_type: str = self.type_combo.currentText()
+        if (self.type_combo.currentIndex() > 0
+                and not self.url_input.text().strip()):
+            QMessageBox.warning(
+                self, "URL Required",
+                "Please provide a YouTube URL before selecting download type."
+                )
+            self.type_combo.setCurrentIndex(0)
+            return
+
+        if selected_type == "Audio":
+            self.progress_bar.setFormat("Ready to download audio.")
+            self.resolution_combo.setEnabled(False)
+            self.format_model.set_records([])
+            self.loading_label.setVisible(False)
+            self.loading_text.setVisible(False)
+        elif (selected_type == "Video" and self._is_playlist_only(
+                split_urls(self.url_input.text())[0])):
+            # Playlist entries are resolved one by one when downloaded
+            self.progress_bar.setFormat(
+                "Ready to download the best quality of each playlist video."
+                )
+            self.resolution_combo.setEnabled(False)
+            self.format_model.set_records([])
+            self.loading_label.setVisible(False)
+            self.loading_text.setVisible(False)
+        elif selected_type == "Video":
+            self.progress_bar.setFormat("Ready to download video.")
+            self.resolution_combo.setEnabled(False)  # Disable while fetching
+            self.format_model.set_records([])
+            self.loading_label.setVisible(True)
+            self.loading_text.setVisible(True)
+            self._start_loading_movie()
+            self.fetch_resolutions_in_background()
+        else:  # Placeholder 'Select Type' is selected
+            self.progress_bar.setFormat("Please select download type.")
+            self.resolution_combo.setEnabled(False)
+            self.format_model.set_records([])
+            self.loading_label.setVisible(False)
+            self.loading_text.setVisible(False)
+
+    def _start_loading_movie(self) -> None:
+        """Start the loading animation, loading the GIF on first use."""
+        if self.loading_movie is None:
+            self.loading_movie = QMovie(
+                os.path.join(script_dir, 'Assets', 'loading.gif')
+                )
+            self.loading_label.setMovie(self.loading_movie)
+        self.loading_movie.start()
+
+    def _stop_loading_movie(self) -> None:
+        if self.loading_movie is not None:
+            self.loading_movie.stop()
+
+    @staticmethod
+    def _is_playlist_only(url: str) -> bool:
+        """Return True for playlist URLs that do not name a single video."""
+        return is_playlist_url(url) and youtube_video_id(url) is None
+
+    def fetch_resolutions_in_background(self) -> None:
+        """
+        Starts a background thread to fetch available resolutions for a video.
+
+        This method creates and starts a worker thread,
+        that fetches the available
+        resolutions for the provided URL.
+        """
+        url: str = split_urls(self.url_input.text())[0]
+        self.fetched_url = url
+        self.fetched_info = None
+        self._fetch_generation += 1
+        generation: int = self._fetch_generation
+        self.fetcher_thread = (
+            ResolutionFetcherThread(
+                url, self.metadata_cache, self.download_manager.retry,
+                self.prefetcher
+                )
+        )
+        self.fetcher_thread.retry_signal.connect(self.loading_text.setText)
+        self.fetcher_thread.info_fetched.connect(
+            partial(self.on_info_fetched, url)
+        )
+        self.fetcher_thread.resolution_fetched.connect(
+            partial(self.on_resolutions_fetched, generation)
+        )
+        self.fetcher_thread.error_signal.connect(
+            partial(self.on_fetch_error, generation)
+        )
+        self.fetcher_thread.start()
+
+    def on_resolutions_fetched(
+            self, generation: int, resolutions: List[FormatRecord]
+    ) -> None:
+        """
+        Handles the fetched resolutions and updates the resolution combo box.
+
+        Displays available resolutions in the resolution combo box, or shows an
+        information message if no resolutions are available. Resolutions
+        of a fetch that was superseded are ignored.
+        """
+        if generation != self._fetch_generation:
+            return
+        self._stop_loading_movie()
+        self.loading_label.setVisible(False)
+        self.loading_text.setVisible(False)
+        if resolutions:
+            self.format_model.set_records(resolutions)
+            self.resolution_combo.setCurrentIndex(0)
+            self.resolution_combo.setEnabled(True)
+        else:
+            QMessageBox.information(
+                self,
+                "Info", "No resolutions available for this video."
+                )
+            self.resolution_combo.setEnabled(False)
+
+    def on_info_fetched(self, url: str, info_dict: Dict[str, Any]) -> None:
+        """
+        Keeps the info_dict of the fetched video for the download step.
+
+        Results from an older fetch for a different URL are ignored.
+        """
+        if url == self.fetched_url:
+            self.fetched_info = info_dict
+
+    def on_fetch_error(self, generation: int, error_message: str) -> None:
+        """
+        Handle errors encountered while fetching video resolutions.
+
+        This method is called when an error occurs during,
+        the resolution fetching process.
+        It stops the loading animation,
+        hides the loading indicator, shows an error message
+        to the user via a dialog,
+        and disables the resolution selection dropdown.
+
+        Errors of a fetch that was superseded are ignored.
+
+        :param generation: The fetch generation the error belongs to.
+        :param error_message: The error message string to display to the user.
+        """
+        if generation != self._fetch_generation:
+            return
+        self._stop_loading_movie()
+        self.loading_label.setVisible(False)
+        QMessageBox.critical(self, "Error", error_message)
+        self.resolution_combo.setEnabled(False)
+
+    def download_video(self) -> None:
+        """
+        Queue the YouTube videos or audio entered in the URL input.
+
+        This method collects the URLs, download type,
+        and resolution (if applicable)
+        from the UI, sets up the download options for each URL,
+        and hands them to the download manager.
+        The selected resolution only applies to the URL it was fetched for.
+
+        :raises Exception:
+            Any exception that occurs while preparing the download is
+            caught and displayed to the user.
+        """
+        urls: List[str] = split_urls(self.url_input.text())
+        if not urls:
+            QMessageBox.warning(
+                self, "Error", "Please enter a valid YouTube URL."
+                )
+            return
+
+        download_type: str = self.type_combo.currentText()
+        resolution: Optional[str] = (
+            self.resolution_combo.currentData()
+            if download_type == "Video"
+            else None
+        )
+
+        skip_downloaded: bool = self._skip_downloaded()
+        priority: str = self.priority_combo.currentData()
+        try:
+            for url in urls:
+                if is_playlist_url(url):
+                    self._expand_playlist(url, download_type, priority)
+                    continue
+                if skip_downloaded and self.download_archive.has_url(url):
+                    self.skipped_downloads += 1
+                    continue
+                fetched: bool = url == self.fetched_url
+                ydl_opts: Dict[str, Any] = self._setup_download_options(
+                    download_type, resolution if fetched else None
+                    )
+                # Prefetched info spares the download an extraction
+                self._perform_download(
+                    url, ydl_opts,
+                    self.fetched_info if fetched
+                    else self.prefetcher.peek(url),
+                    download_type=download_type, priority=priority
+                    )
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to download: {e}")
+        if self.low_memory:
+            # The queued job holds the info_dict until it starts
+            self.fetched_info = None
+        self._update_progress_bar()
+
+    def _skip_downloaded(self) -> bool:
+        """Return True if videos in the download archive are skipped."""
+        return self.skip_downloaded_checkbox.isChecked()
+
+    def _expand_playlist(
+            self, url: str, download_type: str, priority: str
+    ) -> None:
+        """
+        List a playlist in the background and queue its entries as they
+        arrive.
+        """
+        thread = PlaylistExpanderThread(url)
+        thread.entries_fetched.connect(
+            partial(self.on_playlist_entries, download_type, priority)
+            )
+        thread.error_signal.connect(self.on_playlist_error)
+        thread.finished.connect(partial(self._on_playlist_stopped, thread))
+        self.playlist_threads.append(thread)
+        thread.start()
+        self._update_progress_bar()
+
+    def on_playlist_entries(
+            self, download_type: str, priority: str,
+            entries: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Queue a batch of playlist entries for download.
+
+        Entries found in the download archive are skipped before anything
+        is extracted for them, so re-syncing a playlist only fetches
+        new videos. The entries of a batch share one set of options.
+        """
+        skip_downloaded: bool = self._skip_downloaded()
+        ydl_opts: Dict[str, Any] = self._setup_download_options(
+            download_type, None
+            )
+        for entry in entries:
+            if skip_downloaded and self.download_archive.has_video(
+                    entry.get('ie_key'), entry.get('id')):
+                self.skipped_downloads += 1
+                continue
+            self._perform_download(
+                entry['url'], ydl_opts,
+                title=entry.get('title'), download_type=download_type,
+                priority=priority
+                )
+
+    def on_playlist_error(self, error_message: str) -> None:
+        """Report a playlist that could not be listed completely."""
+        QMessageBox.critical(self, "Error", error_message)
+
+    def _on_playlist_stopped(self, thread: PlaylistExpanderThread) -> None:
+        if thread in self.playlist_threads:
+            self.playlist_threads.remove(thread)
+        self._update_progress_bar()
+
+    def _setup_download_options(
+            self, download_type: str, resolution: Optional[str]
+    ) -> Dict[str, Any]:
+        """Set up yt-dlp options based on download type (video or audio)."""
+        return build_download_options(
+            download_type, resolution, self.DOWNLOADS_FOLDER,
+            self.download_archive if self._skip_downloaded() else None
+            )
+
+    def _perform_download(
+            self, url: str, ydl_opts: Dict[str, Any],
+            info_dict: Optional[Dict[str, Any]] = None,
+            title: Optional[str] = None, download_type: str = "Video",
+            priority: str = BandwidthScheduler.DEFAULT_PRIORITY
+    ) -> None:
+        """Queue a yt-dlp download on the download manager."""
+        self.download_manager.enqueue(
+            url, ydl_opts, info_dict, title, download_type,
+            priority=priority
+            )
+
+    def resume_unfinished_downloads(
+            self, unfinished: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Offer to resume the downloads the last session did not finish.
+
+        Resumed jobs keep their format and output template, so yt-dlp
+        continues from the existing .part files.
+
+        :param unfinished: The unfinished jobs read from the journal.
+        """
+        if not unfinished:
+            return
+        answer = QMessageBox.question(
+            self, "Resume Downloads",
+            f"{len(unfinished)} download(s) did not finish last time. "
+            "Resume them?"
+            )
+        for entry in unfinished:
+            if answer != QMessageBox.Yes:
+                self.journal.set_state(entry['id'], "cancelled")
+                continue
+            ydl_opts: Dict[str, Any] = self._setup_download_options(
+                entry['download_type'], None
+                )
+            # Journals store the absolute template, split it into the
+            # folder and the file name so the scratch folder still applies
+            folder, outtmpl = os.path.split(entry['outtmpl'])
+            ydl_opts.update({
+                'format': entry['format'],
+                'outtmpl': outtmpl,
+                'paths': {**ydl_opts.get('paths', {}), 'home': folder},
+                'continuedl': True,
+            })
+            self.download_manager.enqueue(
+                entry['url'], ydl_opts, title=entry['title'],
+                download_type=entry['download_type'],
+                journal_id=entry['id']
+                )
+
+    def closeEvent(self, event) -> None:
+        """
+        Write buffered journal progress and cookies before the window
+        closes. Post-processing that already started is finished by its
+        processes; the rest is offered for resuming on the next start.
+
+        Running jobs are stopped but stay recorded as running, so they are
+        offered for resuming on the next start. Playlists being listed and
+        a resolution fetch are waited for, so no thread outlives the
+        pools it uses.
+        """
+        for thread in self.playlist_threads:
+            # Batches still listed must not queue jobs while shutting down
+            thread.entries_fetched.disconnect()
+            thread.requestInterruption()
+        if self.fetcher_thread is not None:
+            self.fetcher_thread.requestInterruption()
+        for thread in [*self.playlist_threads, self.fetcher_thread]:
+            if thread is not None and thread.isRunning():
+                thread.wait()
+        self.download_manager.shutdown()
+        self.journal.close()
+        self.prefetcher.shutdown()
+        SESSION_POOL.close()
+        POSTPROCESSING_POOL.shutdown(wait=False)
+        METRICS.close()
+        super().closeEvent(event)
+
+    def _update_stats(self) -> None:
+        """Show the totals of METRICS in the statistics panel."""
+        stats: Dict[str, Any] = METRICS.snapshot()
+        ended: int = sum(stats['jobs'].values())
+        jobs: str = ", ".join(
+            f"{count} {status}" for status, count in sorted(
+                stats['jobs'].items()
+                )
+        ) or "none ended"
+        lines: List[str] = [f"Jobs: {jobs}; {stats['active']} active"]
+        if ended:
+            lines.append("Average time per job: " + ", ".join(
+                f"{phase} {seconds / ended:.1f}s"
+                for phase, seconds in stats['phase_seconds'].items()
+            ))
+        lines.append(
+            f"Downloaded {format_bytes(stats['downloaded_bytes'])}, "
+            f"{stats['retries']} retries, "
+            f"{stats['fragment_failures']} failed fragments"
+            )
+        self.stats_label.setText("\n".join(lines))
+
+    def _update_progress_bar(self) -> None:
+        """
+        Summarise the state of the download queue in the progress bar.
+
+        This runs on every job update, so it only looks at the running
+        jobs and the state counts of the manager, not at the whole queue.
+        """
+        counts: Counter = self.download_manager.state_counts
+        listing: str = (
+            f" - listing {len(self.playlist_threads)} playlist(s)"
+            if self.playlist_threads else ""
+        )
+        skipped: int = self.skipped_downloads + counts["skipped"]
+        if skipped:
+            listing += f" - {skipped} already downloaded"
+        processing: int = counts["postprocessing"]
+        if processing:
+            listing += f" - {processing} post-processing"
+        queued: int = counts["queued"]
+        downloading: List[DownloadJob] = self.download_manager.running_jobs()
+        active: int = queued + len(downloading) + processing
+        if not active:
+            finished: int = counts["finished"]
+            self.progress_bar.setValue(100 if finished else 0)
+            self.progress_bar.setFormat(
+                f"{finished} of {len(self.download_manager.jobs)} "
+                f"downloads completed{listing}"
+                )
+            return
+        running: int = self.download_manager.active_count()
+        # Queued jobs are at 0% and post-processing ones at 100%
+        percent: int = (
+            sum(job.percent for job in downloading) + 100 * processing
+        ) // active
+        speed: float = sum(job.speed for job in downloading)
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(
+            f"{running} running, {queued} queued - {percent}% - "
+            f"{format_bytes(speed)}/s{listing}"
+            )
+
+    def _selected_job_ids(self) -> List[int]:
+        """Return the selected jobs, or every job if none is selected."""
+        rows: List[int] = [
+            index.row()
+            for index in self.job_table.selectionModel().selectedRows()
+        ]
+        if not rows:
+            return list(self.download_manager.jobs)
+        return [self.job_model.job_id_at(row) for row in rows]
+
+    def pause_downloads(self) -> None:
+        """Pause the selected downloads."""
+        for job_id in self._selected_job_ids():
+            self.download_manager.pause(job_id)
+
+    def resume_downloads(self) -> None:
+        """Resume the selected downloads."""
+        for job_id in self._selected_job_ids():
+            self.download_manager.resume(job_id)
+
+    def cancel_downloads(self) -> None:
+        """
+        Cancel the selected downloads.
+
+        With nothing selected, playlists still being listed are stopped too.
+        """
+        if not self.job_table.selectionModel().selectedRows():
+            for thread in self.playlist_threads:
+                thread.stop()
+        for job_id in self._selected_job_ids():
+            self.download_manager.cancel(job_id)
+
+    def update_queue_limits(self) -> None:
+        """Apply the concurrency limits chosen in the spin boxes."""
+        self.download_manager.set_limits(
+            self.concurrent_spin.value(), self.per_host_spin.value()
+            )
+
+    def update_rate_limit(self) -> None:
+        """Apply the speed limit chosen in the spin box."""
+        self.download_manager.bandwidth.set_limit(
+            self.rate_limit_spin.value() * 1024
+            )
+
+
+class StartupMonitor(QObject):
+    """
+    Loads yt_dlp once the window is first painted, and optionally reports
+    how long the start took.
+
+    Phases are measured from ``started``, a time.perf_counter() value
+    taken when the program began running.
+
+    Args:
+        started (float): When the program started.
+        report (bool): Write the timings once yt_dlp has loaded.
+    """
+    yt_dlp_loaded = pyqtSignal(float)
+
+    # Load yt_dlp anyway if no paint event arrives, e.g. when minimized
+    PRELOAD_FALLBACK_MS: int = 2000
+
+    def __init__(self, started: float, report: bool = False):
+        super().__init__()
+        self.started = started
+        self.report = report
+        self.phases: List[Tuple[str, float]] = []
+        self._last: float = started
+        self._preloading: bool = False
+        self.yt_dlp_loaded.connect(self._on_yt_dlp_loaded)
+
+    def mark(self, phase: str) -> None:
+        """Records the time since the previous phase ended."""
+        now: float = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def watch(self, window: QWidget) -> None:
+        """Waits for the first paint of the window."""
+        window.installEventFilter(self)
+        QTimer.singleShot(self.PRELOAD_FALLBACK_MS, self._preload)
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        if event.type() == QEvent.Paint and not self._preloading:
+            obj.removeEventFilter(self)
+            self.mark("first paint")
+            # Defer until the paint has been flushed to the screen
+            QTimer.singleShot(0, self._preload)
+        return False
+
+    def _preload(self) -> None:
+        if not self._preloading:
+            self._preloading = True
+            preload_yt_dlp(self.yt_dlp_loaded.emit)
+
+    def _on_yt_dlp_loaded(self, seconds: float) -> None:
+        if not self.report:
+            return
+        total: float = sum(duration for _, duration in self.phases)
+        line: str = "Startup: " + ", ".join(
+            f"{phase} {duration * 1000:.0f} ms"
+            for phase, duration in self.phases
+        ) + (
+            f", total {total * 1000:.0f} ms; "
+            f"yt_dlp loaded in the background in {seconds * 1000:.0f} ms"
+        )
+        if sys.stderr is not None:
+            print(line, file=sys.stderr)
+            return
+        # Windowed builds have no console to write to
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(os.path.join(APP_DATA_DIR, 'startup-timing.log'),
+                  'a', encoding='utf-8') as log_file:
+            log_file.write(line + "\n")
+
+
+def run_gui(
+        argv: List[str], started: Optional[float] = None,
+        startup_timing: bool = False, low_memory: bool = False
+) -> int:
+    """
+    Runs the downloader window until it is closed.
+
+    Args:
+        argv (List[str]): The arguments passed to QApplication.
+        started (float, optional): The time.perf_counter() value when the
+            program started. Defaults to now.
+        startup_timing (bool, optional): Report how long the import,
+            window construction and first paint took.
+        low_memory (bool, optional): Run the window in low-memory mode.
+    """
+    monitor = StartupMonitor(
+        time.perf_counter() if started is None else started, startup_timing
+        )
+    monitor.mark("imports")
+    app = QApplication(argv)
+    downloader = YouTubeDownloader(low_memory)
+    monitor.mark("window")
+    monitor.watch(downloader)
+    downloader.show()
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(run_gui(sys.argv))
@@ -1,609 +1,448 @@
-import re
+import time
+
+# Taken before anything else is imported, for --startup-timing
+STARTED: float = time.perf_counter()
+
+import argparse
+import json
+import multiprocessing
 import os
 import sys
-import logging
-from typing import Optional, Dict, Any, List, Tuple
-from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QVBoxLayout, QLabel,
-    QLineEdit, QPushButton, QComboBox, QWidget,
-    QMessageBox, QProgressBar, QGroupBox, QHBoxLayout
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Optional, Dict, Any, List, Iterator, Tuple, TextIO
+
+from core import (
+    DOWNLOADS_FOLDER, METRICS, POSTPROCESSING_POOL, SCRATCH_FOLDER,
+    BandwidthScheduler, DiskSpaceGovernor, DownloadArchive, DownloadTask,
+    FormatRule, JobMetrics, PartFileAllocator, RetryPolicy,
+    FragmentConcurrencyTuner, ProgressSnapshot, build_download_options,
+    SESSION_POOL, is_playlist_url, iter_playlist_entries, split_urls
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
-from PyQt5.QtGui import QMovie, QPixmap, QIcon
-import yt_dlp
 
-# Determine the directory of the script
-script_dir = os.path.dirname(__file__)
 
-
-class MyLogger:
+class EventWriter:
     """
-    A simple logger class for custom logging.
-
-    Args:
-        name (str, optional): The name of the logger. Defaults to "MyLogger".
-        level (int, optional): The logging level. Defaults to logging.INFO.
+    Writes download events as JSON lines, one object per line.
 
+    Every event has an ``event`` name and a ``time`` stamp. Events from
+    download threads are serialised so lines never interleave.
     """
-    def __init__(self, name: str = "MyLogger", level: int = logging.INFO):
-        """
-        Initializes the logger with the given name and level.
-
-        Args:
-            name (str, optional):
-                The name of the logger. Defaults to "MyLogger".
-            level (int, optional): The logging level. Defaults to logging.INFO.
-        """
-        self.logger = logging.getLogger(name)
-        self.logger.setLevel(level)
-
-        # Create console handler and set the level
-        ch = logging.StreamHandler()
-        ch.setLevel(level)
-
-        # Create formatter and add it to the handler
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
+    def __init__(self, stream: TextIO = sys.stdout):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        """Writes one event with the given fields."""
+        line: str = json.dumps(
+            {'event': event, 'time': round(time.time(), 3), **fields}
             )
-        ch.setFormatter(formatter)
-
-        # Add the handler to the logger
-        if not self.logger.handlers:  # Prevent duplicate handlers
-            self.logger.addHandler(ch)
-
-    def debug(self, msg: str) -> None:
-        """
-        Logs a debug message.
-
-        Args:
-            msg (str): The debug message.
-        """
-        self.logger.debug(msg)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
 
-    def info(self, msg: str) -> None:
-        """
-        Logs an info message.
-
-        Args:
-            msg (str): The info message.
-        """
-        self.logger.info(msg)
-
-    def warning(self, msg: str) -> None:
-        """
-        Logs a warning message.
-
-        Args:
-            msg (str): The warning message.
-        """
-        self.logger.warning(msg)
 
-    def error(self, msg: str) -> None:
-        """
-        Logs an error message.
-
-        Args:
-            msg (str): The error message.
-        """
-        self.logger.error(msg)
-
-
-class ResolutionFetcherThread(QThread):
+class BatchDownloader:
     """
-    Fetches available video resolutions from a YouTube URL using yt_dlp.
+    Downloads a list of URLs without the GUI, on a pool of threads.
 
-    Emits:
-        resolution_fetched:
-            Signal emitted with a list of tuples containing
-            resolution strings and their corresponding format IDs.
-        error_signal: Signal emitted with an error message string.
-    """
-    resolution_fetched = pyqtSignal(list)
-    error_signal = pyqtSignal(str)
-
-    def __init__(self, url: str):
-        """
-        Initializes the thread with the given YouTube URL.
+    Uses the same DownloadTask engine, fragment tuner and download
+    archive as the GUI. Playlists are expanded while their first
+    entries are already downloading, and postprocessors run on the
+    shared PostProcessingPool while the next transfers start. Failed
+    downloads are retried by a RetryPolicy shared by all jobs, and
+    downloads wait for free disk space through a DiskSpaceGovernor.
 
-        Args:
-            url (str): The URL of the YouTube video.
+    Args:
+        download_type (str): "Video" or "Audio".
+        jobs (int): The number of parallel downloads.
+        downloads_folder (str): The folder to save to.
+        skip_downloaded (bool): Skip videos in the download archive.
+        events (EventWriter): Where progress is reported.
+        rate_limit (float, optional): The bytes per second all downloads
+            may use together.
+        priority (str, optional): The priority class of the downloads.
+        format_rule (FormatRule, optional): Selects the video formats.
+        scratch_folder (str, optional): Where files are written until they
+            are complete.
+    """
+    def __init__(
+            self, download_type: str, jobs: int, downloads_folder: str,
+            skip_downloaded: bool, events: EventWriter,
+            rate_limit: Optional[float] = None,
+            priority: str = BandwidthScheduler.DEFAULT_PRIORITY,
+            format_rule: Optional[FormatRule] = None,
+            scratch_folder: Optional[str] = SCRATCH_FOLDER
+    ):
+        self.download_type = download_type
+        self.jobs = max(1, jobs)
+        self.downloads_folder = downloads_folder
+        self.skip_downloaded = skip_downloaded
+        self.events = events
+        self.archive: DownloadArchive = DownloadArchive()
+        self.tuner: FragmentConcurrencyTuner = FragmentConcurrencyTuner()
+        self.bandwidth: BandwidthScheduler = BandwidthScheduler(rate_limit)
+        self.retry: RetryPolicy = RetryPolicy()
+        self.priority = priority
+        self.format_rule = format_rule
+        self.scratch_folder = scratch_folder
+        # Set to None to let the file system allocate .part files lazily
+        self.part_files: Optional[PartFileAllocator] = PartFileAllocator()
+        # Set to None to start downloads without checking free space
+        self.disk_space: Optional[DiskSpaceGovernor] = DiskSpaceGovernor()
+        # Large progressive files are downloaded over several connections
+        self.sharded: bool = True
+        self.failed: int = 0
+        self._tasks: Dict[int, DownloadTask] = {}
+        self._metrics: Dict[int, JobMetrics] = {}
+        self._postprocessing: List[Future] = []
+        self._next_job_id: int = 1
+        self._lock = threading.Lock()
+
+    def run(self, urls: List[str]) -> int:
         """
+        Downloads every URL and waits for all downloads to finish.
 
-        super().__init__()
-        # Validate YouTube URL format
-        if not re.match(r'https?://(www\.)?youtube\.com|youtu\.be', url):
-            raise ValueError("Invalid YouTube URL")
-        self.url = url
-        self.allowed_resolutions = {
-            '144p', '240p', '360p',
-            '480p', '720p', '1080p',
-            '1440p', '2160p'
-            }
-
-    def run(self):
+        Returns:
+            int: The process exit status, 1 if any download failed.
         """
-        Fetches video resolutions in a separate thread.
-        """
-
+        futures: List[Future] = []
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
         try:
-            ydl_opts = {'logger': MyLogger(), 'quiet': True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(self.url, download=False)
-                formats = info_dict.get('formats', [])
-                resolutions = []
-
-                for fmt in formats:
-                    format_note = fmt.get('format_note')
-                    ext = fmt.get('ext')
-                    filesize = fmt.get(
-                        'filesize', fmt.get('filesize_approx', 0)
-                    ) or 0
-                    if format_note in self.allowed_resolutions and ext:
-                        size_mb = filesize / (1024 * 1024)
-                        resolution = (
-                            f"{format_note} ({ext.upper()}) ({size_mb:.2f} MB)"
-                            if filesize > 0 else
-                            f"{format_note} ({ext.upper()}) (Unknown size)"
-                        )
-                        resolutions.append((resolution, fmt['format_id']))
-
-                # Sort by resolution
-                resolutions.sort(key=lambda x: int(x[0].split('p')[0]))
-                if resolutions:
-                    self.resolution_fetched.emit(resolutions)
-                else:
-                    self.error_signal.emit(
-                        "No resolutions available for this video."
-                        )
-        except yt_dlp.utils.DownloadError as e:
-            error_message = (
-                f"Failed to fetch video info. "
-                f"Check the URL or your internet connection. Error: {str(e)}"
-                )
-
-            self.error_signal.emit(error_message)
-            ydl_opts['logger'].error(error_message)
-
-        except Exception as e:
-            error_message = f"Failed to fetch resolutions: {str(e)}"
-            self.error_signal.emit(error_message)
-            ydl_opts['logger'].error(error_message)
-
-
-class YouTubeDownloader(QMainWindow):
-    """
-    A Qt-based GUI application for downloading YouTube videos or audio.
-
-    This class handles the video downloader UI, manages input from the user,
-    and coordinates the download process using yt-dlp.
-    """
-
-    # Global variable for downloads folder
-    DOWNLOADS_FOLDER: str = os.path.expanduser("~/Downloads")
-
-    def __init__(self):
+            for url, title in self._iter_downloads(urls):
+                futures.append(executor.submit(
+                    self._download, self._queue(url, title), url
+                    ))
+            wait(futures)
+            # No more are added once every transfer is done
+            wait(self._postprocessing)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            with self._lock:
+                tasks: List[DownloadTask] = list(self._tasks.values())
+            for task in tasks:
+                task.cancel()
+            return 130
+        finally:
+            executor.shutdown(wait=True)
+            POSTPROCESSING_POOL.shutdown()
+            SESSION_POOL.close()
+        return 1 if self.failed else 0
+
+    def _iter_downloads(
+            self, urls: List[str]
+    ) -> Iterator[Tuple[str, Optional[str]]]:
         """
-        Initializes the main window of the YouTubeDownloader application.
+        Yields the URL and known title of every video to download.
 
-        Sets up the layout, user interface elements, and connects signals.
+        Playlists are expanded lazily, and videos in the download
+        archive are skipped before anything is extracted for them.
         """
-        super().__init__()
-        self.setWindowTitle("Sonic Video Downloader")
-        self.setGeometry(200, 200, 600, 600)
-        # Set the window icon
-        icon_path = os.path.join(script_dir, 'Assets', 'app_icon.ico')
-        pixmap = QPixmap(icon_path).scaled(
-            70, 70, Qt.KeepAspectRatio, Qt.SmoothTransformation
-            )
-        self.setWindowIcon(QIcon(pixmap))
-
-        # Set Downloads folder
-        self.downloads_folder: str = os.path.expanduser("~/Downloads")
-
-        # Central Widget
-        self.central_widget: QWidget = QWidget()
-        self.setCentralWidget(self.central_widget)
-        self.layout: QVBoxLayout = QVBoxLayout()
-        self.central_widget.setLayout(self.layout)
-
-        # App Icon
-        self.icon_label: QLabel = QLabel()
-        app_icon_pixmap = QPixmap(icon_path)
-        self.icon_label.setPixmap(app_icon_pixmap)
-        self.icon_label.setAlignment(Qt.AlignCenter)
-        self.layout.addWidget(self.icon_label)
-
-        # Header
-        self.header_label: QLabel = QLabel(
-            "<h1 style='color: #0078d7;'>Sonic Video Downloader</h1>"
-            )
-        self.header_label.setAlignment(Qt.AlignCenter)
-        self.layout.addWidget(self.header_label)
-
-        # Step 1: URL Input
-        self.url_group: QGroupBox = QGroupBox("Step 1: Enter YouTube URL")
-        self.url_layout: QVBoxLayout = QVBoxLayout()
-        self.url_group.setLayout(self.url_layout)
-        self.url_label: QLabel = QLabel("YouTube URL:")
-        self.url_input: QLineEdit = QLineEdit()
-        self.url_input.setPlaceholderText(
-            "Enter the YouTube video or playlist URL here..."
-            )
-        self.url_layout.addWidget(self.url_label)
-        self.url_layout.addWidget(self.url_input)
-        self.layout.addWidget(self.url_group)
+        import yt_dlp
+
+        for url in urls:
+            if not is_playlist_url(url):
+                if self.skip_downloaded and self.archive.has_url(url):
+                    self.events.emit('skipped', url=url)
+                    continue
+                yield url, None
+                continue
+            try:
+                for entry in iter_playlist_entries(url):
+                    if self.skip_downloaded and self.archive.has_video(
+                            entry.get('ie_key'), entry.get('id')):
+                        self.events.emit('skipped', url=entry['url'])
+                        continue
+                    yield entry['url'], entry.get('title')
+            except yt_dlp.utils.DownloadError as e:
+                with self._lock:
+                    self.failed += 1
+                self.events.emit(
+                    'error', url=url,
+                    message=f"Failed to list playlist entries: {e}"
+                    )
 
-        # Step 2: Select Type and Resolution
-        self.type_group: QGroupBox = QGroupBox(
-            "Step 2: Select Download Type and Resolution"
+    def _queue(self, url: str, title: Optional[str]) -> int:
+        """Assigns a job id to a download and reports it as queued."""
+        job_id: int = self._next_job_id
+        self._next_job_id += 1
+        self._metrics[job_id] = METRICS.new_job(url)
+        self.events.emit('queued', job=job_id, url=url, title=title)
+        return job_id
+
+    def _download(self, job_id: int, url: str) -> None:
+        """Runs one download on a pool thread."""
+        import yt_dlp
+
+        ydl_opts: Dict[str, Any] = build_download_options(
+            self.download_type, None, self.downloads_folder,
+            self.archive if self.skip_downloaded else None,
+            self.format_rule, self.scratch_folder, self.sharded
             )
-        self.type_layout: QVBoxLayout = QVBoxLayout()
-        self.type_group.setLayout(self.type_layout)
-        self.type_label: QLabel = QLabel("Select download type:")
-        self.type_combo: QComboBox = QComboBox()
-        self.type_combo.addItem("Select Type", None)
-        self.type_combo.addItems(["Video", "Audio"])
-        self.type_combo.setCurrentIndex(0)
-        self.type_combo.setEnabled(True)
-        self.type_combo.currentIndexChanged.connect(self.update_ui)
-        self.type_layout.addWidget(self.type_label)
-        self.type_layout.addWidget(self.type_combo)
-
-        # Loading animation setup
-        gif_path: str = os.path.join(
-            os.path.dirname(__file__), 'Assets', 'loading.gif'
+        task = DownloadTask(
+            url, ydl_opts, tuner=self.tuner, archive=self.archive,
+            on_progress=lambda snapshot: self._report(job_id, snapshot),
+            bandwidth=self.bandwidth, priority=self.priority,
+            postprocessing=POSTPROCESSING_POOL,
+            metrics=self._metrics.pop(job_id), retry=self.retry,
+            part_files=self.part_files, disk_space=self.disk_space
             )
-        self.loading_container: QHBoxLayout = QHBoxLayout()
-        self.loading_label: QLabel = QLabel()
-        self.loading_movie: QMovie = QMovie(gif_path)
-        self.loading_label.setMovie(self.loading_movie)
-        self.loading_label.setFixedSize(50, 50)
-        self.loading_label.setScaledContents(True)
-        self.loading_label.setVisible(False)
-        self.loading_container.addWidget(self.loading_label)
-        self.loading_text: QLabel = QLabel("Fetching resolutions please wait")
-        self.loading_text.setVisible(False)
-        self.loading_container.addWidget(self.loading_text)
-        self.type_layout.addLayout(self.loading_container)
-
-        self.resolution_label: QLabel = QLabel("Select Video resolution ")
-        self.resolution_combo: QComboBox = QComboBox()
-        self.resolution_combo.setEnabled(False)
-        self.type_layout.addWidget(self.resolution_label)
-        self.type_layout.addWidget(self.resolution_combo)
-        self.layout.addWidget(self.type_group)
-
-        # Step 3: Download
-        self.download_group: QGroupBox = QGroupBox("Step 3: Download")
-        self.download_layout: QVBoxLayout = QVBoxLayout()
-        self.download_group.setLayout(self.download_layout)
-
-        # Load the download icon
-        icon_path = os.path.join(script_dir, 'Assets', 'download.png')
-        pixmap = QPixmap(icon_path)
-        icon = QIcon(pixmap)  # Convert QPixmap to QIcon
-
-        # Set up the download button with icon
-        self.download_button: QPushButton = QPushButton("Download")
-        self.download_button.setIcon(icon)
-        self.download_button.setIconSize(pixmap.size())
-        self.download_button.setLayoutDirection(Qt.LeftToRight)
-        self.download_button.setStyleSheet("""
-            QPushButton {
-                text-align: left;
-                padding-left: 5px; /* Adjust padding as needed */
-            }
-        """)
-        self.download_button.clicked.connect(self.download_video)
-        self.progress_bar: QProgressBar = QProgressBar()
-        self.progress_bar.setAlignment(Qt.AlignCenter)
-        self.progress_bar.setValue(0)
-        self.progress_bar.setFormat("Ready")
-        self.download_layout.addWidget(self.download_button)
-        self.download_layout.addWidget(self.progress_bar)
-        self.layout.addWidget(self.download_group)
-
-        # Styling
-        self.apply_styles()
-
-    def apply_styles(self) -> None:
-        """
-        Applies custom styles to the UI elements of the application.
-
-        This method uses Qt style sheets to define visual properties like
-        background color, font size, colors, borders, and hover effects for
-        various widgets including QMainWindow, QLabel, QGroupBox, QLineEdit,
-        QPushButton, and QProgressBar.
-
-        :return: None
-        """
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #f4f4f4;
-            }
-            QLabel {
-                font-size: 14px;
-                color: #333333;
-            }
-            QGroupBox {
-                font-size: 14px;
-                font-weight: bold;
-                color: #0078d7;
-                border: 1px solid #0078d7;
-                border-radius: 5px;
-                margin-top: 10px;
-            }
-            QGroupBox::title {
-                subcontrol-origin: margin;
-                subcontrol-position: top center;
-                padding: 0 3px;
-            }
-            QLineEdit {
-                padding: 5px;
-                font-size: 14px;
-            }
-            QPushButton {
-                background-color: #0078d7;
-                color: white;
-                border-radius: 5px;
-                padding: 8px;
-            }
-            QPushButton:hover {
-                background-color: #005a9e;
-            }
-            QProgressBar {
-                text-align: center;
-                background-color: #e0e0e0;
-                color: #000000;
-            }
-        """)
-
-    def check_url_input(self) -> None:
-        url: str = self.url_input.text().strip()
-        if url:
-            self.type_combo.setEnabled(True)
+        self._task_started(job_id, task)
+        try:
+            message: str = task.run()
+        except yt_dlp.utils.DownloadCancelled:
+            self.events.emit('cancelled', job=job_id, url=url)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            self.events.emit(
+                'error', job=job_id, url=url,
+                message=f"Failed to download: {e}"
+                )
         else:
-            self.type_combo.setEnabled(False)
-            self.type_combo.setCurrentIndex(0)  # Reset to placeholder
-            self.resolution_combo.clear()
-            self.resolution_combo.setEnabled(False)
-
-    def update_ui(self) -> None:
-        """
-        Adjusts UI elements based on the selected download type.
-        """
-        selected_type: str = self.type_combo.currentText()
-        if not self.url_input.text().strip():
-            QMessageBox.warning(
-                self, "URL Required",
-                "Please provide a YouTube URL before selecting download type."
+            future: Optional[Future] = task.postprocess_future
+            if future is None:
+                # Archived videos yt-dlp found only once the job ran
+                event: str = (
+                    'skipped' if message in DownloadTask.SKIPPED_MESSAGES
+                    else 'finished'
+                )
+                self.events.emit(event, job=job_id, url=url, message=message)
+                return
+            self.events.emit('postprocessing', job=job_id, url=url)
+            with self._lock:
+                self._postprocessing.append(future)
+            future.add_done_callback(
+                lambda done: self._postprocessed(job_id, url, done)
+                )
+        finally:
+            self._task_stopped(job_id)
+
+    def _postprocessed(self, job_id: int, url: str, future: Future) -> None:
+        """Reports the outcome of a job's postprocessors."""
+        if future.cancelled():
+            self.events.emit('cancelled', job=job_id, url=url)
+        elif future.exception() is not None:
+            with self._lock:
+                self.failed += 1
+            self.events.emit(
+                'error', job=job_id, url=url, message=str(future.exception())
                 )
-            self.type_combo.setCurrentIndex(0)
-            return
-
-        if selected_type == "Audio":
-            self.progress_bar.setFormat("Ready to download audio.")
-            self.resolution_combo.setEnabled(False)
-            self.resolution_combo.clear()
-            self.loading_label.setVisible(False)
-            self.loading_text.setVisible(False)
-        elif selected_type == "Video":
-            self.progress_bar.setFormat("Ready to download video.")
-            self.resolution_combo.setEnabled(False)  # Disable while fetching
-            self.resolution_combo.clear()
-            self.loading_label.setVisible(True)
-            self.loading_text.setVisible(True)
-            self.loading_movie.start()
-            self.fetch_resolutions_in_background()
-        else:  # Placeholder 'Select Type' is selected
-            self.progress_bar.setFormat("Please select download type.")
-            self.resolution_combo.setEnabled(False)
-            self.resolution_combo.clear()
-            self.loading_label.setVisible(False)
-            self.loading_text.setVisible(False)
-
-    def fetch_resolutions_in_background(self) -> None:
-        """
-        Starts a background thread to fetch available resolutions for a video.
-
-        This method creates and starts a worker thread,
-        that fetches the available
-        resolutions for the provided URL.
-        """
-        url: str = self.url_input.text().strip()
-        self.fetcher_thread: ResolutionFetcherThread = (
-            ResolutionFetcherThread(url)
-        )
-        self.fetcher_thread.resolution_fetched.connect(
-            self.on_resolutions_fetched
-        )
-        self.fetcher_thread.error_signal.connect(self.on_fetch_error)
-        self.fetcher_thread.start()
-
-    def on_resolutions_fetched(
-            self, resolutions: List[Tuple[str, str]]
-    ) -> None:
-        """
-        Handles the fetched resolutions and updates the resolution combo box.
-
-        Displays available resolutions in the resolution combo box, or shows an
-        information message if no resolutions are available.
-        """
-        self.loading_movie.stop()
-        self.loading_label.setVisible(False)
-        self.loading_text.setVisible(False)
-        if resolutions:
-            self.resolution_combo.clear()
-            for res in resolutions:
-                resolution_str, format_id = res
-                self.resolution_combo.addItem(
-                    f"{resolution_str} - {format_id}", format_id
-                    )
-            self.resolution_combo.setEnabled(True)
         else:
-            QMessageBox.information(
-                self,
-                "Info", "No resolutions available for this video."
+            self.events.emit(
+                'finished', job=job_id, url=url,
+                message="Download Completed - 100%"
                 )
-            self.resolution_combo.setEnabled(False)
 
-    def on_fetch_error(self, error_message: str) -> None:
-        """
-        Handle errors encountered while fetching video resolutions.
+    def _report(self, job_id: int, snapshot: ProgressSnapshot) -> None:
+        """Writes a progress event for the job."""
+        self.events.emit(
+            'progress', job=job_id, percent=snapshot.percent,
+            speed=round(snapshot.speed), eta=round(snapshot.eta, 1),
+            status=snapshot.status
+            )
 
-        This method is called when an error occurs during,
-        the resolution fetching process.
-        It stops the loading animation,
-        hides the loading indicator, shows an error message
-        to the user via a dialog,
-        and disables the resolution selection dropdown.
+    def _task_started(self, job_id: int, task: DownloadTask) -> None:
+        """Tell the fragment tuner how many jobs share the connections."""
+        with self._lock:
+            self._tasks[job_id] = task
+            self.tuner.set_active_jobs(len(self._tasks))
 
-        :param error_message: The error message string to display to the user.
-        """
-        self.loading_movie.stop()
-        self.loading_label.setVisible(False)
-        QMessageBox.critical(self, "Error", error_message)
-        self.resolution_combo.setEnabled(False)
+    def _task_stopped(self, job_id: int) -> None:
+        with self._lock:
+            self._tasks.pop(job_id, None)
+            self.tuner.set_active_jobs(len(self._tasks))
 
-    def download_video(self) -> None:
-        """
-        Initiate the download process for a YouTube video or audio.
 
-        This method collects the URL, download type,
-        and resolution (if applicable)
-        from the UI, sets up the download options,
-        and attempts to download the content.
-        It also manages the UI state during and after the download process.
+def read_batch_file(path: str) -> List[str]:
+    """
+    Reads URLs from a batch file, or from stdin for ``-``.
+
+    Blank lines and lines starting with ``#`` are ignored.
+    """
+    if path == '-':
+        text: str = sys.stdin.read()
+    else:
+        with open(path, encoding='utf-8') as batch_file:
+            text = batch_file.read()
+    return [
+        url
+        for line in text.splitlines()
+        if not line.lstrip().startswith('#')
+        for url in split_urls(line)
+    ]
+
+
+def parse_rate(text: str) -> float:
+    """Parses a rate such as ``500K`` or ``2.5M`` into bytes per second."""
+    from yt_dlp.utils import parse_bytes
+
+    rate: Optional[int] = parse_bytes(text)
+    if rate is None:
+        raise argparse.ArgumentTypeError(f"invalid rate: {text!r}")
+    return float(rate)
+
+
+def env_flag(name: str) -> bool:
+    """Returns True if the environment variable is set to 1/true/yes/on."""
+    return os.environ.get(name, '').strip().lower() in (
+        '1', 'true', 'yes', 'on'
+        )
 
-        :raises Exception:
-            Any exception that occurs during the download process is
-            caught and displayed to the user.
-        """
-        url: str = self.url_input.text().strip()
-        if not url:
-            QMessageBox.warning(
-                self, "Error", "Please enter a valid YouTube URL."
-                )
-            return
 
-        download_type: str = self.type_combo.currentText()
-        resolution: Optional[str] = (
-            self.resolution_combo.currentData()
-            if download_type == "Video"
-            else None
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="vidoor",
+        description=(
+            "Download YouTube videos or audio. Without URLs the "
+            "graphical downloader is started."
+        ),
+    )
+    parser.add_argument(
+        'urls', nargs='*', metavar='URL',
+        help="video or playlist URLs to download"
         )
-        self.download_button.setEnabled(False)
-
-        # Set initial message on the progress bar
-        self.progress_bar.setFormat("Download initiated, please wait...")
-        self.progress_bar.setValue(0)
-        QApplication.processEvents()  # Ensure immediate UI update
-
-        # Use QTimer for non-blocking delay
-        # Use QTimer for non-blocking delay
-        QTimer.singleShot(
-            500,
-            lambda: self._perform_download(
-                url, ydl_opts
-            )
+    parser.add_argument(
+        '-a', '--batch-file', metavar='FILE',
+        help="read URLs from FILE, one per line ('-' for stdin)"
+        )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=4,
+        help="number of parallel downloads (default: %(default)s)"
+        )
+    parser.add_argument(
+        '-t', '--type', choices=('video', 'audio'), default='video',
+        help="download the video or only the audio (default: %(default)s)"
+        )
+    parser.add_argument(
+        '-o', '--output-dir', default=DOWNLOADS_FOLDER,
+        help="folder to save downloads to (default: %(default)s)"
+        )
+    parser.add_argument(
+        '--scratch-dir', metavar='DIR', default=SCRATCH_FOLDER,
+        help=(
+            "write unfinished downloads to DIR, e.g. a faster disk, and "
+            "move them to the output folder when they are complete (also "
+            "set by VIDOOR_SCRATCH_DIR)"
+        )
+        )
+    parser.add_argument(
+        '--no-preallocate', action='store_true',
+        help="do not reserve disk space for downloads before writing them"
         )
-        QApplication.processEvents()  # Process UI events to update the display
+    parser.add_argument(
+        '--single-connection', action='store_true',
+        help="download large files over one connection instead of several"
+        )
+    parser.add_argument(
+        '--no-space-check', action='store_true',
+        help="start downloads without waiting for enough free disk space"
+        )
+    parser.add_argument(
+        '--no-skip-downloaded', action='store_true',
+        help="download videos again even if they are in the archive"
+        )
+    parser.add_argument(
+        '-r', '--limit-rate', type=parse_rate, metavar='RATE',
+        help="bytes per second all downloads may use together, e.g. 2M"
+        )
+    parser.add_argument(
+        '--priority', choices=tuple(BandwidthScheduler.PRIORITY_WEIGHTS),
+        default=BandwidthScheduler.DEFAULT_PRIORITY,
+        help="priority of the downloads (default: %(default)s)"
+        )
+    parser.add_argument(
+        '--max-height', type=int, metavar='PIXELS',
+        help="download videos of at most this height, e.g. 1080"
+        )
+    parser.add_argument(
+        '--prefer-codec', choices=('av1', 'vp9', 'h265', 'h264'),
+        help="prefer video formats with this codec"
+        )
+    parser.add_argument(
+        '--smallest', action='store_true',
+        help="prefer the smallest download to the best quality"
+        )
+    parser.add_argument(
+        '--metrics-file', metavar='FILE',
+        default=os.environ.get('VIDOOR_METRICS_FILE'),
+        help=(
+            "append the timings and counters of every job to FILE as JSON "
+            "lines (also set by VIDOOR_METRICS_FILE)"
+        )
+        )
+    parser.add_argument(
+        '--metrics-port', type=int, metavar='PORT',
+        default=os.environ.get('VIDOOR_METRICS_PORT'),
+        help=(
+            "serve Prometheus metrics at http://127.0.0.1:PORT/metrics "
+            "(also set by VIDOOR_METRICS_PORT)"
+        )
+        )
+    parser.add_argument(
+        '--startup-timing', action='store_true',
+        default=env_flag('VIDOOR_STARTUP_TIMING'),
+        help=(
+            "report how long the GUI took to start "
+            "(also set by VIDOOR_STARTUP_TIMING)"
+        )
+        )
+    parser.add_argument(
+        '--low-memory', action='store_true',
+        default=env_flag('VIDOOR_LOW_MEMORY'),
+        help=(
+            "keep only a compact record of finished GUI downloads, for "
+            "very large playlists (also set by VIDOOR_LOW_MEMORY)"
+        )
+        )
+    return parser.parse_args(argv)
 
-        try:
-            ydl_opts: Dict[str, Any] = self._setup_download_options(
-                download_type, resolution
-                )
-            # Correct to:
-            QTimer.singleShot(
-                500, lambda: self._perform_download(url, ydl_opts)
-                )
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to download: {e}")
-        finally:
-            self.download_button.setEnabled(True)
-
-    def _setup_download_options(
-            self, download_type: str, resolution: Optional[str]
-    ) -> Dict[str, Any]:
-        """Set up yt-dlp options based on download type (video or audio)."""
-        ydl_opts: Dict[str, Any] = {
-            'format': (
-                f"{resolution}+bestaudio/best"
-                if resolution else 'bestaudio/best'
-            ),
-            'outtmpl': (
-                os.path.join(self.DOWNLOADS_FOLDER, '%(title)s.%(ext)s')
-                ),
-            'concurrent_fragments': 4,
-            'fragment_retries': 10,
-            'skip_unavailable_fragments': True,
-            'retries': 3,
-            'verbose': True,
-            'logger': MyLogger(),
-        }
-
-        if download_type == "Audio":
-            ydl_opts.update(self._get_audio_postprocessors())
-        else:
-            ydl_opts.update(self._get_video_postprocessors())
-
-        return ydl_opts
-
-    def _get_audio_postprocessors(self) -> Dict[str, Any]:
-        """Return postprocessor options for audio downloads."""
-        return {
-            'postprocessors': [
-                {
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192'
-                    },
-                {'key': 'EmbedThumbnail'},
-            ]
-        }
-
-    def _get_video_postprocessors(self) -> Dict[str, Any]:
-        """Return postprocessor options for video downloads."""
-        return {
-            'postprocessors': [
-                {'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}
-                ],
-            'postprocessor_args': ['-c', 'copy'],
-        }
-
-    def _perform_download(self, url: str, ydl_opts: Dict[str, Any]) -> None:
-        """Download the video/audio using yt-dlp."""
-        def progress_hook(d: Dict[str, Any]) -> None:
-            self._update_progress_bar(d)
-
-        ydl_opts['progress_hooks'] = [progress_hook]
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-
-    def _update_progress_bar(self, d: Dict[str, Any]) -> None:
-        """Update the progress bar based on the download status."""
-        if d['status'] == 'downloading':
-            downloaded_bytes: int = d.get('downloaded_bytes', 0)
-            total_bytes: int = d.get('total_bytes', 1)
-            percent: float = downloaded_bytes / total_bytes * 100
-            status: str = (
-                "Downloading Audio"
-                if d['info_dict'].get('is_audio')
-                else "Downloading Video"
-            )
-            self.progress_bar.setFormat(f"{status} - {int(percent)}%")
-            self.progress_bar.setValue(int(percent))
 
-        elif d['status'] == 'finished':
-            self.progress_bar.setFormat("Download Completed - 100%")
-            self.progress_bar.setValue(100)
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the command line downloader, or the GUI when no URL is given.
 
-        elif d['status'] == 'post_processing':
-            self.progress_bar.setFormat("Merging Audio and Video...")
+    Progress is written to stdout as JSON lines.
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    urls: List[str] = [url for text in args.urls for url in split_urls(text)]
+    METRICS.set_output(args.metrics_file)
+    if args.metrics_port is not None:
+        port: int = METRICS.serve(args.metrics_port)
+        print(
+            f"Serving metrics at http://127.0.0.1:{port}/metrics",
+            file=sys.stderr
+            )
+    if args.batch_file:
+        urls.extend(read_batch_file(args.batch_file))
+    elif not urls:
+        # Qt is only imported when the window is actually needed
+        from gui import run_gui
+        return run_gui(
+            sys.argv[:1], STARTED, args.startup_timing, args.low_memory
+            )
+
+    downloader = BatchDownloader(
+        args.type.capitalize(), args.jobs, args.output_dir,
+        not args.no_skip_downloaded, EventWriter(), args.limit_rate,
+        args.priority,
+        FormatRule(args.max_height, args.prefer_codec, args.smallest),
+        args.scratch_dir
+        )
+    if args.no_preallocate:
+        downloader.part_files = None
+    if args.no_space_check:
+        downloader.disk_space = None
+    downloader.sharded = not args.single_connection
+    try:
+        return downloader.run(urls)
+    finally:
+        METRICS.close()
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    downloader = YouTubeDownloader()
-    downloader.show()
-    sys.exit(app.exec_())
+    # Lets the post-processing processes start in frozen builds
+    multiprocessing.freeze_support()
+    sys.exit(main())
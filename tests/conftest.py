@@ -0,0 +1,48 @@
+import os
+import sys
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+# The modules live at the repository root, next to this folder
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import core  # noqa: E402
+from benchmarks.fake_server import FakeMediaServer  # noqa: E402
+
+# Large enough to be split into four ranges by the sharded downloader
+SHARDED_SIZE: int = 16 * 1024 * 1024
+
+
+@pytest.fixture
+def media_server() -> Iterator[FakeMediaServer]:
+    """A fake media server whose progressive files are sharded."""
+    with FakeMediaServer(
+            latency=0, progressive_size=SHARDED_SIZE, extra_formats=0
+    ) as server:
+        yield server
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> List[float]:
+    """Replaces time.time with a clock the test moves by hand."""
+    now: List[float] = [1_000_000.0]
+    monkeypatch.setattr(core.time, 'time', lambda: now[0])
+    return now
+
+
+def download_options(folder: str, **options: Any) -> Dict[str, Any]:
+    """The options the GUI downloads a direct file with, minus ffmpeg."""
+    ydl_opts: Dict[str, Any] = core.build_download_options(
+        "Video", None, folder, scratch_folder=None
+        )
+    ydl_opts.update({
+        'format': 'best',
+        'postprocessors': [],
+        'verbose': False,
+        'quiet': True,
+    })
+    ydl_opts.update(options)
+    return ydl_opts
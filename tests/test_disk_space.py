@@ -0,0 +1,87 @@
+import collections
+import threading
+from typing import List
+
+import pytest
+import yt_dlp
+
+import core
+
+MiB: int = 1024 * 1024
+
+DiskUsage = collections.namedtuple('DiskUsage', 'total used free')
+
+
+@pytest.fixture
+def free_space(monkeypatch: pytest.MonkeyPatch) -> List[int]:
+    """Replaces the free space of every disk with a value set by hand."""
+    free: List[int] = [100 * MiB]
+    monkeypatch.setattr(
+        core.shutil, 'disk_usage',
+        lambda path: DiskUsage(1000 * MiB, 0, free[0])
+        )
+    return free
+
+
+def governor() -> core.DiskSpaceGovernor:
+    return core.DiskSpaceGovernor(overhead=2.0, margin=0, poll_interval=0.05)
+
+
+def test_reserves_what_fits(tmp_path, free_space) -> None:
+    disk_space = governor()
+    assert disk_space.reserve('a', 30 * MiB, str(tmp_path))
+    assert disk_space.reserve('b', 20 * MiB, str(tmp_path))
+
+
+def test_fails_what_can_never_fit(tmp_path, free_space) -> None:
+    with pytest.raises(yt_dlp.utils.DownloadError, match="disk space"):
+        governor().reserve('a', 60 * MiB, str(tmp_path))
+
+
+def test_waits_for_other_reservations(tmp_path, free_space) -> None:
+    disk_space = governor()
+    assert disk_space.reserve('a', 40 * MiB, str(tmp_path))
+    waits: List[str] = []
+    reserved = threading.Event()
+
+    def reserve() -> None:
+        if disk_space.reserve('b', 40 * MiB, str(tmp_path), None,
+                              waits.append):
+            reserved.set()
+
+    thread = threading.Thread(target=reserve)
+    thread.start()
+    assert not reserved.wait(0.2)
+    assert waits and waits[0].startswith("Waiting for disk space")
+    disk_space.release('a')
+    thread.join(5)
+    assert reserved.is_set()
+
+
+def test_written_bytes_count_against_reservation(
+        tmp_path, free_space) -> None:
+    disk_space = governor()
+    assert disk_space.reserve('a', 40 * MiB, str(tmp_path))
+    # a wrote all it reserved, which the free space already reflects
+    disk_space.update('a', {
+        'filename': str(tmp_path / 'a.part'), 'downloaded_bytes': 80 * MiB
+    })
+    free_space[0] -= 80 * MiB
+    assert disk_space.reserve('b', 10 * MiB, str(tmp_path))
+
+
+def test_waiting_stops_when_cancelled(tmp_path, free_space) -> None:
+    disk_space = governor()
+    assert disk_space.reserve('a', 40 * MiB, str(tmp_path))
+    cancelled = threading.Event()
+    result: List[bool] = []
+    thread = threading.Thread(target=lambda: result.append(
+        disk_space.reserve(
+            'b', 40 * MiB, str(tmp_path), cancelled=cancelled.is_set
+            )
+        ))
+    thread.start()
+    cancelled.set()
+    disk_space.wake()
+    thread.join(5)
+    assert result == [False]
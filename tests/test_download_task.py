@@ -0,0 +1,170 @@
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator
+
+import pytest
+
+import core
+from benchmarks.fake_server import FakeMediaServer
+from conftest import download_options
+
+
+@pytest.fixture
+def small_server() -> Iterator[FakeMediaServer]:
+    """A media server with small progressive files."""
+    with FakeMediaServer(
+            latency=0, progressive_size=300_000, extra_formats=0
+    ) as server:
+        yield server
+
+
+def video(server: FakeMediaServer, video_id: str) -> Dict[str, Any]:
+    info: Dict[str, Any] = server.info_dict()
+    info.update(id=video_id, title=f"Video {video_id}")
+    return info
+
+
+def test_archives_downloaded_video(small_server, tmp_path) -> None:
+    archive = core.DownloadArchive(str(tmp_path / 'archive.txt'))
+    for message in ("Download Completed - 100%", "Already downloaded"):
+        task = core.DownloadTask(
+            small_server.url('/video'),
+            download_options(
+                str(tmp_path), format='progressive',
+                download_archive=archive
+                ),
+            info_dict=video(small_server, 'a'), archive=archive
+            )
+        assert task.run() == message
+    assert set(archive) == {"generic a"}
+
+
+def test_archived_video_skipped_before_extraction(tmp_path) -> None:
+    url: str = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    archive = core.DownloadArchive(str(tmp_path / 'archive.txt'))
+    archive.add("youtube dQw4w9WgXcQ")
+    metrics: core.JobMetrics = core.METRICS.new_job(url)
+    task = core.DownloadTask(
+        url, download_options(str(tmp_path), download_archive=archive),
+        archive=archive, metrics=metrics
+        )
+    # yt-dlp finds the id of the URL in the archive, without any request
+    assert task.run() == "Already downloaded"
+    assert metrics.status == "skipped"
+
+
+def test_archives_playlist_videos_not_playlist(
+        small_server, tmp_path) -> None:
+    archive = core.DownloadArchive(str(tmp_path / 'archive.txt'))
+    playlist: Dict[str, Any] = {
+        '_type': 'playlist', 'id': 'list', 'title': "List",
+        'extractor': 'generic', 'extractor_key': 'Generic',
+        'webpage_url': small_server.url('/list'),
+        'entries': [video(small_server, 'a'), video(small_server, 'b')],
+    }
+    messages = []
+    for _ in range(2):
+        task = core.DownloadTask(
+            small_server.url('/list'),
+            download_options(
+                str(tmp_path), format='progressive',
+                download_archive=archive
+                ),
+            info_dict=playlist, archive=archive
+            )
+        messages.append(task.run())
+    assert messages == [
+        "Downloaded 2 playlist videos", "No new playlist videos"
+    ]
+    assert set(archive) == {"generic a", "generic b"}
+
+
+def test_deferred_video_archived_only_once_postprocessed(tmp_path) -> None:
+    archive = core.DownloadArchive(str(tmp_path / 'archive.txt'))
+    task = core.DownloadTask('https://example.com/v', {}, archive=archive)
+
+    failed: Future = Future()
+    failed.set_exception(RuntimeError("ffmpeg failed"))
+    task._archive_postprocessed(["generic a"], failed)
+    assert "generic a" not in archive
+
+    succeeded: Future = Future()
+    succeeded.set_result(["/videos/a.mkv"])
+    task._archive_postprocessed(["generic a"], succeeded)
+    assert "generic a" in archive
+
+
+def test_failed_postprocessing_is_not_archived(
+        small_server, tmp_path) -> None:
+    archive = core.DownloadArchive(str(tmp_path / 'archive.txt'))
+    pool = core.PostProcessingPool(1)
+    try:
+        task = core.DownloadTask(
+            small_server.url('/video'),
+            download_options(
+                str(tmp_path), format='progressive',
+                download_archive=archive, ffmpeg_location='/nonexistent',
+                postprocessors=[{
+                    'key': 'FFmpegVideoConvertor', 'preferedformat': 'mkv'
+                }]
+                ),
+            info_dict=video(small_server, 'a'), archive=archive,
+            postprocessing=pool
+            )
+        assert task.run() == "Post-processing..."
+        assert task.postprocess_future.exception(60) is not None
+    finally:
+        pool.shutdown()
+    assert "generic a" not in archive
+
+
+def test_rate_limit_restores_fragment_concurrency() -> None:
+    task = core.DownloadTask('https://example.com/v', {})
+    params: Dict[str, Any] = {'concurrent_fragment_downloads': 8}
+    task._set_rate_limit(500_000)
+    task._apply_rate_limit(params)
+    assert params == {
+        'concurrent_fragment_downloads': 1, 'ratelimit': 500_000
+    }
+    task._set_rate_limit(250_000)
+    task._apply_rate_limit(params)
+    task._set_rate_limit(None)
+    task._apply_rate_limit(params)
+    assert params == {'concurrent_fragment_downloads': 8}
+
+
+def test_rate_limit_restores_tuned_concurrency() -> None:
+    tuner = core.FragmentConcurrencyTuner(initial=16)
+    task = core.DownloadTask('https://example.com/v', {}, tuner=tuner)
+    params: Dict[str, Any] = {'concurrent_fragment_downloads': 4}
+    task._set_rate_limit(500_000)
+    task._apply_rate_limit(params)
+    task._set_rate_limit(None)
+    task._apply_rate_limit(params)
+    assert params == {'concurrent_fragment_downloads': 16}
+
+
+def test_session_returned_when_generator_closed_early() -> None:
+    pool = core.YoutubeDLPool()
+    ydl_opts: Dict[str, Any] = {'quiet': True, 'logger': core.LOGGER}
+
+    def entries() -> Iterator[int]:
+        with pool.session(ydl_opts):
+            yield 1
+            yield 2
+
+    listing = entries()
+    assert next(listing) == 1
+    listing.close()
+    assert pool._idle_count == 1
+    with pool.session(ydl_opts):
+        assert pool._idle_count == 0  # The same instance is reused
+    assert pool._idle_count == 1
+    pool.close()
+
+
+def test_session_closed_after_error() -> None:
+    pool = core.YoutubeDLPool()
+    with pytest.raises(ValueError):
+        with pool.session({'quiet': True}):
+            raise ValueError("broken")
+    assert pool._idle_count == 0
@@ -0,0 +1,88 @@
+from typing import Any, Dict, List
+
+import core
+
+
+def video_info() -> Dict[str, Any]:
+    formats: List[Dict[str, Any]] = [
+        {'format_id': 'a-m4a', 'ext': 'm4a', 'vcodec': 'none',
+         'acodec': 'mp4a.40.2', 'abr': 128, 'filesize': 1_000},
+        {'format_id': 'a-webm', 'ext': 'webm', 'vcodec': 'none',
+         'acodec': 'opus', 'abr': 160, 'filesize': 2_000},
+        {'format_id': '360-h264', 'ext': 'mp4', 'vcodec': 'avc1.4d401e',
+         'acodec': 'mp4a.40.2', 'height': 360, 'filesize': 5_000},
+        {'format_id': '720-h264', 'ext': 'mp4', 'vcodec': 'avc1.64001f',
+         'acodec': 'none', 'height': 720, 'filesize': 20_000},
+        {'format_id': '720-av1', 'ext': 'mp4', 'vcodec': 'av01.0.05M.08',
+         'acodec': 'none', 'height': 720, 'filesize': 12_000},
+        {'format_id': '1080-vp9', 'ext': 'webm', 'vcodec': 'vp9',
+         'acodec': 'none', 'height': 1080, 'fps': 60, 'filesize': 40_000},
+        {'format_id': '2160-vp9', 'ext': 'webm', 'vcodec': 'vp09.00.50.08',
+         'acodec': 'none', 'height': 2160, 'dynamic_range': 'HDR10',
+         'filesize': 90_000},
+    ]
+    return {'id': 'v', 'duration': 10, 'formats': formats}
+
+
+def test_list_formats_sorts_videos_and_sizes_merges() -> None:
+    records: List[core.FormatRecord] = core.list_formats(video_info())
+    assert [record.format_id for record in records] == [
+        '360-h264', '720-av1', '720-h264', '1080-vp9', '2160-vp9'
+    ]
+    by_id: Dict[str, core.FormatRecord] = {
+        record.format_id: record for record in records
+    }
+    # Video-only formats are merged with the best m4a audio
+    assert by_id['720-h264'].merged_size == 21_000
+    assert by_id['360-h264'].merged_size == 5_000
+    assert by_id['2160-vp9'].hdr
+    assert by_id['1080-vp9'].label == (
+        "1080p60 (WEBM, VP9) (0.04 MB)"
+    )
+
+
+def test_format_rule_selects_best_within_height() -> None:
+    records = core.list_formats(video_info())
+    assert core.FormatRule().select(records).format_id == '2160-vp9'
+    assert core.FormatRule(max_height=1080).select(
+        records
+        ).format_id == '1080-vp9'
+    assert core.FormatRule(max_height=240).select(records) is None
+
+
+def test_format_rule_prefers_codec_then_quality() -> None:
+    records = core.list_formats(video_info())
+    assert core.FormatRule(max_height=1080, vcodec='av1').select(
+        records
+        ).format_id == '720-av1'
+    # Without a format of the codec the best one is taken
+    assert core.FormatRule(max_height=720, vcodec='vp9').select(
+        records
+        ).format_id == '720-h264'
+
+
+def test_format_rule_smallest() -> None:
+    records = core.list_formats(video_info())
+    assert core.FormatRule(smallest=True).select(
+        records
+        ).format_id == '360-h264'
+    assert core.FormatRule(vcodec='vp9', smallest=True).select(
+        records
+        ).format_id == '1080-vp9'
+
+
+def test_format_rule_select_ignores_record_order() -> None:
+    records = core.list_formats(video_info())
+    rule = core.FormatRule(max_height=720)
+    assert rule.select(records) == rule.select(records[::-1])
+
+
+def test_format_rule_as_ydl_options() -> None:
+    rule = core.FormatRule(max_height=1080, vcodec='av1', smallest=True)
+    assert rule.format_spec() == (
+        "bv*[height<=?1080]+ba[ext=m4a]/bv*[height<=?1080]+ba"
+        "/b[height<=?1080]"
+    )
+    assert rule.format_sort() == ['vcodec:av1', '+size']
+    assert core.FormatRule().format_spec() == 'bestvideo+bestaudio/best'
+    assert core.FormatRule().format_sort() == []
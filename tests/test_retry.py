@@ -0,0 +1,142 @@
+import io
+from typing import List, Tuple
+
+import pytest
+import yt_dlp
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError
+
+import core
+
+
+def http_error(status: int) -> yt_dlp.utils.DownloadError:
+    """A DownloadError wrapping an HTTP error, as yt-dlp raises it."""
+    response = Response(
+        io.BytesIO(b''), 'https://example.com/video', {}, status=status
+        )
+    error = HTTPError(response)
+    return yt_dlp.utils.DownloadError(
+        f"ERROR: {error}", exc_info=(HTTPError, error, None)
+        )
+
+
+@pytest.mark.parametrize('message, kind', [
+    ("HTTP Error 503: Service Unavailable", core.FAILURE_TRANSIENT),
+    ("HTTP Error 502: Bad Gateway", core.FAILURE_TRANSIENT),
+    ("Read timed out.", core.FAILURE_TRANSIENT),
+    ("Connection reset by peer", core.FAILURE_TRANSIENT),
+    ("something nobody has seen before", core.FAILURE_TRANSIENT),
+    ("HTTP Error 429: Too Many Requests", core.FAILURE_THROTTLED),
+    ("HTTP Error 403: Forbidden", core.FAILURE_EXPIRED),
+    ("HTTP Error 410: Gone", core.FAILURE_EXPIRED),
+    ("[youtube] abc: Video unavailable", core.FAILURE_PERMANENT),
+    ("This video is unavailable", core.FAILURE_PERMANENT),
+    ("Private video. Sign in if you've been granted access",
+     core.FAILURE_PERMANENT),
+    ("Sign in to confirm you're not a bot", core.FAILURE_PERMANENT),
+    ("Unsupported URL: https://example.com/", core.FAILURE_PERMANENT),
+])
+def test_classify_failure_by_message(message: str, kind: str) -> None:
+    error = yt_dlp.utils.DownloadError(f"ERROR: {message}")
+    assert core.classify_failure(error) == kind
+
+
+@pytest.mark.parametrize('status, kind', [
+    (503, core.FAILURE_TRANSIENT),
+    (500, core.FAILURE_TRANSIENT),
+    (429, core.FAILURE_THROTTLED),
+    (403, core.FAILURE_EXPIRED),
+    (404, core.FAILURE_PERMANENT),
+])
+def test_classify_failure_by_status(status: int, kind: str) -> None:
+    assert core.classify_failure(http_error(status)) == kind
+
+
+def test_classify_failure_of_expected_extractor_error() -> None:
+    error = yt_dlp.utils.ExtractorError("No video formats", expected=True)
+    assert core.classify_failure(error) == core.FAILURE_PERMANENT
+
+
+def test_classify_failure_of_re_extraction() -> None:
+    assert core.classify_failure(
+        yt_dlp.utils.ReExtractInfo("URL expired")
+        ) == core.FAILURE_EXPIRED
+
+
+def test_exponential_backoff_doubles_within_cap() -> None:
+    backoff = core.ExponentialBackoff(1.0, 10.0)
+    for n, longest in enumerate((1.0, 2.0, 4.0, 8.0, 10.0, 10.0)):
+        for _ in range(50):
+            assert longest / 2 <= backoff(n) <= longest
+
+
+def test_circuit_opens_after_consecutive_failures() -> None:
+    breaker = core.HostCircuitBreaker()
+    for _ in range(breaker.FAILURE_THRESHOLD - 1):
+        breaker.record_failure('host', core.FAILURE_TRANSIENT)
+        assert breaker.retry_after('host') == 0
+    breaker.record_failure('host', core.FAILURE_TRANSIENT)
+    assert 0 < breaker.retry_after('host') <= breaker.COOLDOWN
+    assert breaker.retry_after('other') == 0
+
+
+def test_circuit_opens_on_throttling_and_backs_off() -> None:
+    breaker = core.HostCircuitBreaker()
+    breaker.record_failure('host', core.FAILURE_THROTTLED)
+    first: float = breaker.retry_after('host')
+    breaker.record_failure('host', core.FAILURE_THROTTLED)
+    assert breaker.COOLDOWN < breaker.retry_after('host')
+    assert first <= breaker.COOLDOWN
+    breaker.record_success('host')
+    assert breaker.retry_after('host') == 0
+
+
+def test_retry_policy_retries_transient_failures() -> None:
+    attempts: List[int] = []
+    waits: List[float] = []
+    retries: List[Tuple[str, float]] = []
+
+    def flaky() -> str:
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise yt_dlp.utils.DownloadError(
+                "ERROR: Connection reset by peer"
+                )
+        return "done"
+
+    policy = core.RetryPolicy()
+    result = policy.call(
+        flaky, 'host', lambda kind, delay: retries.append((kind, delay)),
+        waits.append
+        )
+    assert result == "done"
+    assert len(attempts) == 3
+    assert [kind for kind, _ in retries] == [core.FAILURE_TRANSIENT] * 2
+    assert waits == [delay for _, delay in retries]
+    assert policy.breaker.retry_after('host') == 0
+
+
+def test_retry_policy_does_not_retry_permanent_failures() -> None:
+    attempts: List[int] = []
+
+    def removed() -> None:
+        attempts.append(1)
+        raise yt_dlp.utils.DownloadError("ERROR: Video unavailable")
+
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        core.RetryPolicy().call(removed, 'host', sleep=pytest.fail)
+    assert len(attempts) == 1
+
+
+def test_retry_policy_retries_expired_urls_at_once() -> None:
+    attempts: List[int] = []
+
+    def expired() -> None:
+        attempts.append(1)
+        raise yt_dlp.utils.DownloadError("ERROR: HTTP Error 403: Forbidden")
+
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        core.RetryPolicy().call(expired, 'host', sleep=pytest.fail)
+    assert len(attempts) == 1 + core.RetryPolicy.MAX_RETRIES[
+        core.FAILURE_EXPIRED
+    ]
@@ -0,0 +1,91 @@
+from typing import Dict, Optional
+
+import pytest
+
+import core
+
+
+@pytest.fixture
+def rates() -> Dict[str, Optional[float]]:
+    """The rate limits the scheduler applied, by job."""
+    return {}
+
+
+def register(
+        scheduler: core.BandwidthScheduler,
+        rates: Dict[str, Optional[float]], job: str, priority: str
+) -> None:
+    scheduler.register(
+        job, priority, lambda rate: rates.__setitem__(job, rate)
+        )
+
+
+def test_bandwidth_is_shared_by_priority(rates) -> None:
+    scheduler = core.BandwidthScheduler(500_000)
+    register(scheduler, rates, 'a', 'interactive')
+    assert rates == {'a': 500_000}
+    register(scheduler, rates, 'b', 'background')
+    assert rates == {'a': 400_000, 'b': 100_000}
+    scheduler.unregister('a')
+    assert rates['b'] == 500_000
+
+
+def test_unused_bandwidth_goes_to_other_jobs(rates) -> None:
+    scheduler = core.BandwidthScheduler(1_000_000)
+    register(scheduler, rates, 'a', 'interactive')
+    register(scheduler, rates, 'b', 'interactive')
+    assert rates == {'a': 500_000, 'b': 500_000}
+    # The server limits a to 100 kB/s, far below its share
+    scheduler.report_speed('a', 100_000)
+    assert rates['a'] == pytest.approx(125_000)
+    assert rates['b'] == pytest.approx(875_000)
+    # Once a uses what it gets, it is given its share again
+    scheduler.report_speed('a', 125_000)
+    assert rates == {'a': 500_000, 'b': 500_000}
+
+
+def test_bandwidth_limit_can_be_lifted(rates) -> None:
+    scheduler = core.BandwidthScheduler()
+    register(scheduler, rates, 'a', 'interactive')
+    assert rates == {}  # Jobs start unlimited
+    scheduler.set_limit(1_000)
+    assert rates['a'] == core.BandwidthScheduler.MIN_RATE
+    scheduler.set_limit(None)
+    assert rates['a'] is None
+
+
+def test_tuner_climbs_while_faster_and_settles_back() -> None:
+    tuner = core.FragmentConcurrencyTuner(max_fragments=16, initial=4)
+    assert tuner.suggest() == 4
+    tuner.record(4, 1_000_000)
+    assert tuner.suggest() == 8
+    tuner.record(8, 2_000_000)
+    assert tuner.suggest() == 16
+    # No clear gain from 16 connections: back to 8, and stay there
+    tuner.record(16, 2_050_000)
+    assert tuner.suggest() == 8
+    for _ in range(tuner.SETTLE_STREAMS):
+        tuner.record(8, 2_000_000)
+        assert tuner.suggest() == 8
+
+
+def test_tuner_steps_down_when_slower() -> None:
+    tuner = core.FragmentConcurrencyTuner(max_fragments=16, initial=4)
+    tuner.record(4, 1_000_000)
+    tuner.record(8, 500_000)
+    assert tuner.suggest() == 4
+
+
+def test_tuner_shares_connections_between_jobs() -> None:
+    tuner = core.FragmentConcurrencyTuner(
+        max_fragments=16, total_fragments=16, initial=16
+        )
+    assert tuner.suggest() == 16
+    tuner.set_active_jobs(4)
+    assert tuner.suggest() == 4
+    tuner.set_active_jobs(32)
+    assert tuner.suggest() == 1
+    # Runs capped by the share do not move the level
+    tuner.record(1, 10)
+    tuner.set_active_jobs(1)
+    assert tuner.suggest() == 16
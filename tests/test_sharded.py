@@ -0,0 +1,274 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Tuple
+
+import pytest
+import yt_dlp
+
+import core
+from benchmarks.fake_server import FakeMediaServer, payload
+from conftest import ROOT, SHARDED_SIZE, download_options
+
+SHARDS: int = 4
+SHARD_SIZE: int = SHARDED_SIZE // SHARDS
+BOUNDS: List[Tuple[int, int]] = [
+    (index * SHARD_SIZE, (index + 1) * SHARD_SIZE) for index in range(SHARDS)
+]
+# Stands in for bytes that must not be downloaded again
+MARKER: bytes = b'\xaa'
+
+# Downloads a URL into a folder, in a process the test can kill
+DOWNLOAD_SCRIPT: str = """
+import sys
+import core
+url, folder = sys.argv[1:]
+ydl_opts = core.build_download_options(
+    "Video", None, folder, scratch_folder=None
+    )
+ydl_opts.update(format='best', postprocessors=[], quiet=True, verbose=False)
+core.DownloadTask(url, ydl_opts).run()
+"""
+
+
+@pytest.fixture
+def throttled_server() -> Iterator[FakeMediaServer]:
+    """A media server that serves every connection at 1 MB/s."""
+    with FakeMediaServer(
+            latency=0, progressive_size=SHARDED_SIZE, extra_formats=0,
+            connection_rate=1e6
+    ) as server:
+        yield server
+
+
+def paths(folder: str) -> Tuple[str, str, str]:
+    """The file, .part file and checkpoint of video.mp4 in a folder."""
+    filename: str = os.path.join(folder, 'video.mp4')
+    return filename, f"{filename}.part", f"{filename}.part.shards"
+
+
+def download(
+        server: FakeMediaServer, folder: str, **task_args: Any
+) -> str:
+    task = core.DownloadTask(
+        server.url('/progressive/video.mp4'), download_options(folder),
+        **task_args
+        )
+    return task.run()
+
+
+def write_partial(
+        folder: str, done: List[int], state: Optional[Any] = None
+) -> bytes:
+    """
+    Writes an interrupted sharded download whose ranges reached ``done``,
+    with MARKER in place of the bytes downloaded so far.
+
+    Returns:
+        bytes: What the file is once the download resumed correctly.
+    """
+    _, tmpfilename, state_path = paths(folder)
+    expected = bytearray(payload(SHARDED_SIZE))
+    part = bytearray(SHARDED_SIZE)
+    for (begin, _), count in zip(BOUNDS, done):
+        expected[begin:begin + count] = MARKER * count
+        part[begin:begin + count] = MARKER * count
+    with open(tmpfilename, 'wb') as part_file:
+        part_file.write(part)
+    if state is None:
+        state = {'total': SHARDED_SIZE, 'bounds': BOUNDS, 'done': done}
+    with open(state_path, 'w', encoding='utf-8') as state_file:
+        state_file.write(
+            state if isinstance(state, str) else json.dumps(state)
+            )
+    return bytes(expected)
+
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def wait_for_checkpoint(state_path: str, timeout: float = 30) -> List[int]:
+    """Waits until a checkpoint records downloaded bytes."""
+    deadline: float = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open(state_path, encoding='utf-8') as state_file:
+                done: List[int] = json.load(state_file)['done']
+        except (OSError, ValueError):
+            done = []
+        if any(done):
+            return done
+        time.sleep(0.05)
+    pytest.fail("No checkpoint was written")
+
+
+def wait_until_unchanged(
+        path: str, checks: int = 5, timeout: float = 30
+) -> bytes:
+    """Waits until a file stayed the same over several checks."""
+    deadline: float = time.monotonic() + timeout
+    content: bytes = read(path)
+    unchanged: int = 0
+    while unchanged < checks:
+        if time.monotonic() > deadline:
+            pytest.fail("The file kept changing")
+        time.sleep(0.1)
+        current: bytes = read(path)
+        unchanged = unchanged + 1 if current == content else 0
+        content = current
+    return content
+
+
+def start(task: core.DownloadTask) -> Tuple[threading.Thread, List[Any]]:
+    """Runs a task in a thread, collecting its message or error."""
+    outcome: List[Any] = []
+
+    def run() -> None:
+        try:
+            outcome.append(task.run())
+        except BaseException as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_sharded_download(media_server, tmp_path) -> None:
+    assert download(media_server, str(tmp_path)) == (
+        "Download Completed - 100%"
+    )
+    filename, tmpfilename, state_path = paths(str(tmp_path))
+    assert read(filename) == payload(SHARDED_SIZE)
+    assert not os.path.exists(tmpfilename)
+    assert not os.path.exists(state_path)
+
+
+def test_resumes_ranges_from_checkpoint(media_server, tmp_path) -> None:
+    done: List[int] = [SHARD_SIZE, 1_000_000, 0, 123_457]
+    expected: bytes = write_partial(str(tmp_path), done)
+    download(media_server, str(tmp_path))
+    filename, _, state_path = paths(str(tmp_path))
+    # The checkpointed bytes were kept, only the rest was downloaded
+    assert read(filename) == expected
+    assert not os.path.exists(state_path)
+
+
+def test_resumes_after_killed_process(throttled_server, tmp_path) -> None:
+    folder: str = str(tmp_path)
+    filename, tmpfilename, state_path = paths(folder)
+    process = subprocess.Popen(
+        [sys.executable, '-c', DOWNLOAD_SCRIPT,
+         throttled_server.url('/progressive/video.mp4'), folder],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    try:
+        done: List[int] = wait_for_checkpoint(state_path)
+    finally:
+        process.kill()
+        process.wait()
+    assert sum(done) < SHARDED_SIZE
+    assert os.path.exists(tmpfilename)
+
+    throttled_server.connection_rate = None
+    download(throttled_server, folder)
+    assert read(filename) == payload(SHARDED_SIZE)
+    assert not os.path.exists(state_path)
+
+
+def test_cancel_stops_ranges_and_keeps_checkpoint(
+        throttled_server, tmp_path) -> None:
+    folder: str = str(tmp_path)
+    filename, _, state_path = paths(folder)
+    task = core.DownloadTask(
+        throttled_server.url('/progressive/video.mp4'),
+        download_options(folder)
+        )
+    thread, outcome = start(task)
+    try:
+        wait_for_checkpoint(state_path)
+    finally:
+        task.cancel()
+        thread.join(10)
+    assert not thread.is_alive()
+    assert len(outcome) == 1
+    assert isinstance(outcome[0], yt_dlp.utils.DownloadCancelled)
+    with open(state_path, encoding='utf-8') as state_file:
+        assert 0 < sum(json.load(state_file)['done']) < SHARDED_SIZE
+
+    throttled_server.connection_rate = None
+    download(throttled_server, folder)
+    assert read(filename) == payload(SHARDED_SIZE)
+
+
+def test_pause_stops_ranges(throttled_server, tmp_path) -> None:
+    folder: str = str(tmp_path)
+    filename, tmpfilename, state_path = paths(folder)
+    task = core.DownloadTask(
+        throttled_server.url('/progressive/video.mp4'),
+        download_options(folder)
+        )
+    thread, outcome = start(task)
+    try:
+        wait_for_checkpoint(state_path)
+        task.pause()
+        # Blocks already read are still written
+        paused: bytes = wait_until_unchanged(tmpfilename)
+        time.sleep(1)
+        assert read(tmpfilename) == paused
+        throttled_server.connection_rate = None
+        task.resume()
+        thread.join(30)
+        assert outcome == ["Download Completed - 100%"]
+    finally:
+        task.cancel()
+        thread.join(10)
+    assert read(filename) == payload(SHARDED_SIZE)
+
+
+def test_damaged_checkpoint_starts_over(media_server, tmp_path) -> None:
+    write_partial(str(tmp_path), [SHARD_SIZE] * SHARDS, state='{"total"')
+    download(media_server, str(tmp_path))
+    assert read(paths(str(tmp_path))[0]) == payload(SHARDED_SIZE)
+
+
+def test_changed_file_starts_over(media_server, tmp_path) -> None:
+    write_partial(str(tmp_path), [SHARD_SIZE] * SHARDS, state={
+        'total': SHARDED_SIZE + 1, 'bounds': BOUNDS[:-1] + [
+            (BOUNDS[-1][0], SHARDED_SIZE + 1)
+        ], 'done': [SHARD_SIZE] * SHARDS,
+    })
+    download(media_server, str(tmp_path))
+    assert read(paths(str(tmp_path))[0]) == payload(SHARDED_SIZE)
+
+
+def test_part_file_without_checkpoint_resumed_by_httpfd(
+        media_server, tmp_path) -> None:
+    filename, tmpfilename, _ = paths(str(tmp_path))
+    with open(tmpfilename, 'wb') as part_file:
+        part_file.write(MARKER * 1_000_000)
+    download(media_server, str(tmp_path))
+    assert read(filename) == (
+        MARKER * 1_000_000 + payload(SHARDED_SIZE)[1_000_000:]
+    )
+
+
+def test_rate_limited_resume_keeps_complete_prefix(
+        media_server, tmp_path) -> None:
+    # Rate limited downloads go over one connection, which can only
+    # continue the part that is complete from the start of the file
+    write_partial(str(tmp_path), [1_000_000, SHARD_SIZE, 0, 0])
+    download(
+        media_server, str(tmp_path),
+        bandwidth=core.BandwidthScheduler(1e9)
+        )
+    filename, _, state_path = paths(str(tmp_path))
+    assert read(filename) == (
+        MARKER * 1_000_000 + payload(SHARDED_SIZE)[1_000_000:]
+    )
+    assert not os.path.exists(state_path)
@@ -0,0 +1,94 @@
+from typing import Any, Dict, List
+
+import core
+
+
+def info(video_id: str) -> Dict[str, Any]:
+    return {
+        'id': video_id, 'title': f"Video {video_id}", 'formats': [],
+        'requested_downloads': [{'filepath': '/not/cached'}],
+    }
+
+
+def test_job_journal_keeps_unfinished_jobs(tmp_path) -> None:
+    path: str = str(tmp_path / 'jobs.sqlite3')
+    journal = core.JobJournal(path)
+    done = journal.add("https://a", "Video", "best", "%(title)s.%(ext)s")
+    running = journal.add(
+        "https://b", "Audio", "bestaudio", "%(title)s.%(ext)s", "B"
+        )
+    journal.set_state(done, "finished", 100)
+    journal.set_state(running, "running")
+    journal.record_progress(running, 42)
+    journal.close()
+
+    jobs: List[Dict[str, Any]] = core.JobJournal(path).unfinished()
+    assert jobs == [{
+        'id': running, 'url': "https://b", 'download_type': "Audio",
+        'format': "bestaudio", 'outtmpl': "%(title)s.%(ext)s",
+        'title': "B", 'state': "running", 'percent': 42,
+    }]
+
+
+def test_metadata_cache_round_trip(tmp_path) -> None:
+    cache = core.MetadataCache(str(tmp_path / 'cache.sqlite3'))
+    cache.put('youtube:a', info('a'))
+    assert cache.get('youtube:a') == {
+        'id': 'a', 'title': "Video a", 'formats': []
+    }
+    assert cache.get('youtube:b') is None
+
+
+def test_metadata_cache_expires_entries(tmp_path, clock) -> None:
+    cache = core.MetadataCache(str(tmp_path / 'cache.sqlite3'), ttl=60)
+    cache.put('youtube:a', info('a'))
+    clock[0] += 59
+    assert cache.get('youtube:a') is not None
+    clock[0] += 2
+    assert cache.get('youtube:a') is None
+
+
+def test_metadata_cache_evicts_least_recently_used(tmp_path, clock) -> None:
+    cache = core.MetadataCache(
+        str(tmp_path / 'cache.sqlite3'), max_entries=2
+        )
+    for video_id in 'ab':
+        cache.put(f'youtube:{video_id}', info(video_id))
+        clock[0] += 1
+    assert cache.get('youtube:a') is not None
+    clock[0] += 1
+    cache.put('youtube:c', info('c'))
+    assert cache.get('youtube:a') is not None
+    assert cache.get('youtube:b') is None
+    assert cache.get('youtube:c') is not None
+
+
+def test_metadata_cache_key_for_url() -> None:
+    assert core.MetadataCache.key_for_url(
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL1"
+        ) == "youtube:dQw4w9WgXcQ"
+    assert core.MetadataCache.key_for_url("https://example.com/") is None
+
+
+def test_download_archive_persists_ids(tmp_path) -> None:
+    path: str = str(tmp_path / 'archive.txt')
+    archive = core.DownloadArchive(path)
+    archive.add("youtube dQw4w9WgXcQ")
+    archive.add("youtube dQw4w9WgXcQ")
+    with open(path, encoding='utf-8') as archive_file:
+        assert archive_file.read() == "youtube dQw4w9WgXcQ\n"
+
+    reloaded = core.DownloadArchive(path)
+    assert reloaded.has_url("https://youtu.be/dQw4w9WgXcQ")
+    assert reloaded.has_video("Youtube", "dQw4w9WgXcQ")
+    assert not reloaded.has_video("Youtube", "other")
+
+
+def test_read_only_archive_only_skips(tmp_path) -> None:
+    archive = core.DownloadArchive(str(tmp_path / 'archive.txt'))
+    archive.add("generic a")
+    assert "generic a" in archive.read_only
+    archive.read_only.add("generic b")
+    assert "generic b" not in archive
+    with open(archive.path, encoding='utf-8') as archive_file:
+        assert archive_file.read() == "generic a\n"